@@ -51,13 +51,14 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.instrumentation.InstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'OLS.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -84,6 +85,30 @@ DATABASES = {
     }
 }
 
+# Shared by all worker processes: answer key and catalog versions kept here
+# must be seen by every worker once bumped. Kept out of the database, whose
+# single SQLite writer the requests already queue for: Redis when REDIS_URL
+# is set (required once workers run on more than one host), else files in
+# CACHE_DIR. The tests use a temporary directory, see OLS/test_runner.py.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+TEST_RUNNER = 'OLS.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -146,3 +171,53 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'your-email@example.com'
 EMAIL_HOST_PASSWORD = 'zvwo orvb jlvb osho'
+
+# Built PDF reports, keyed by parameters and data version
+REPORT_CACHE_DIR = os.path.join(BASE_DIR, 'report_cache')
+REPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+REPORT_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Certificate template pages, keyed by the uploaded file's hash
+CERTIFICATE_TEMPLATE_CACHE_DIR = os.path.join(BASE_DIR, 'certificate_cache')
+
+# Chunked material uploads, see core/uploads.py
+MATERIAL_UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, 'upload_tmp')
+MATERIAL_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+MATERIAL_UPLOAD_MAX_SIZE = 20 * 1024 * 1024 * 1024
+# Unfinished uploads untouched for this long are discarded by expire_uploads
+MATERIAL_UPLOAD_EXPIRY = 24 * 60 * 60
+
+# Course materials are served by core.media after a permission check. Set to
+# 'nginx' (X-Accel-Redirect to an internal location at MEDIA_ACCEL_PREFIX
+# aliased to MEDIA_ROOT) or 'sendfile' (X-Sendfile) to let the front-end
+# server stream them.
+MEDIA_ACCEL = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Material thumbnails, see core/previews.py. Without these tools only the
+# size, page count and duration are recorded.
+PREVIEW_PDFTOPPM = 'pdftoppm'
+PREVIEW_FFMPEG = 'ffmpeg'
+PREVIEW_FFPROBE = 'ffprobe'
+PREVIEW_TIMEOUT = 60
+# Generate previews in a background thread of the process that saved the
+# material; False leaves them all to `manage.py generate_previews` (cron)
+PREVIEW_IN_BACKGROUND = True
+
+# Activity log rows are buffered and written in batches, see core/activity.py;
+# False writes each one in the request
+ACTIVITY_LOG_WRITE_BEHIND = True
+ACTIVITY_LOG_FLUSH_SIZE = 200
+ACTIVITY_LOG_FLUSH_INTERVAL = 2
+# Rows kept for retry while the database is unavailable; the oldest go first
+ACTIVITY_LOG_MAX_BACKLOG = 10000
+
+# Per-view query and latency instrumentation, see core/instrumentation.py
+INSTRUMENTATION_ENABLED = True
+INSTRUMENTATION_SAMPLE_SIZE = 1000
+INSTRUMENTATION_SLOW_QUERY_MS = 100
+INSTRUMENTATION_SLOW_QUERY_LOG_SIZE = 200
+# Budgets per URL name; '*' applies to views without their own entry
+VIEW_BUDGETS = {
+    '*': {'queries': 50, 'wall_ms': 1000},
+}
@@ -0,0 +1,255 @@
+import atexit
+import logging
+import os
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .models import CustomUser, UserActivityLog
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 500
+# How long a signal handler waits for the flusher thread to write the buffer
+SIGNAL_FLUSH_WAIT = 5
+
+_start_lock = threading.Lock()
+
+
+def write_activity(events, latest):
+    """
+    Store activity in one transaction: `events` are (user id, activity,
+    timestamp) rows to add, `latest` maps (user id, activity) to the
+    timestamp of a row kept once per user (UserActivityLog.LATEST_ACTIVITIES),
+    updated in place or created; events of those activities are stored
+    the same way. Events of users deleted since are dropped.
+    """
+    latest, added = dict(latest), []
+    for user_id, activity, timestamp in events:
+        if activity in UserActivityLog.LATEST_ACTIVITIES:
+            latest[(user_id, activity)] = max(timestamp, latest.get((user_id, activity), timestamp))
+        else:
+            added.append((user_id, activity, timestamp))
+    events = added
+    user_ids = {user_id for user_id, _, _ in events} | {user_id for user_id, _ in latest}
+    if not user_ids:
+        return
+    with transaction.atomic():
+        users = set(CustomUser.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        UserActivityLog.objects.bulk_create(
+            (
+                UserActivityLog(user_id=user_id, activity=activity, timestamp=timestamp)
+                for user_id, activity, timestamp in events
+                if user_id in users
+            ),
+            batch_size=BULK_BATCH_SIZE,
+        )
+
+        latest = {key: timestamp for key, timestamp in latest.items() if key[0] in users}
+        if latest:
+            existing = {}
+            for activity in {activity for _, activity in latest}:
+                stored = UserActivityLog.objects.filter(
+                    activity=activity, user_id__in=[user_id for user_id, kind in latest if kind == activity],
+                ).values_list('id', 'user_id')
+                for pk, user_id in stored:
+                    existing[(user_id, activity)] = pk
+            UserActivityLog.objects.bulk_update(
+                [UserActivityLog(id=existing[key], timestamp=timestamp) for key, timestamp in latest.items() if key in existing],
+                ['timestamp'], batch_size=BULK_BATCH_SIZE,
+            )
+            # The partial unique constraint turns a row inserted meanwhile by another
+            # process into a conflict (Django cannot name a partial index as the
+            # ON CONFLICT target, so update_conflicts is not an option); update it instead
+            missing = {key: timestamp for key, timestamp in latest.items() if key not in existing}
+            UserActivityLog.objects.bulk_create(
+                [UserActivityLog(user_id=key[0], activity=key[1], timestamp=timestamp) for key, timestamp in missing.items()],
+                batch_size=BULK_BATCH_SIZE, ignore_conflicts=True,
+            )
+            for (user_id, activity), timestamp in missing.items():
+                UserActivityLog.objects.filter(user_id=user_id, activity=activity, timestamp__lt=timestamp).update(
+                    timestamp=timestamp,
+                )
+
+
+class ActivityBuffer:
+    """
+    Write-behind buffer of activity log rows, flushed by a background
+    thread every ACTIVITY_LOG_FLUSH_INTERVAL seconds, as soon as
+    ACTIVITY_LOG_FLUSH_SIZE rows are waiting, and at interpreter exit.
+    Rows of a failed flush are kept for the next one, up to
+    ACTIVITY_LOG_MAX_BACKLOG rows; the oldest beyond that are dropped.
+
+    atexit does not run when a process is killed by a signal, so SIGTERM
+    and SIGINT are caught first: the flusher thread writes the buffer,
+    for up to SIGNAL_FLUSH_WAIT seconds, and the signal is then sent
+    again and handed on to the handler it replaced (or to the default
+    action). Nothing is written on the interrupted thread and the handler
+    returns at once: that thread may be inside a request's transaction,
+    which a write would join and roll back with, and which holds SQLite's
+    write lock until it finishes. Handlers can only be installed from the
+    main thread, which is where the buffer starts under prefork servers
+    such as gunicorn's sync workers; servers that handle requests in other
+    threads should call flush_activity() from their worker exit hook
+    (gunicorn: worker_exit).
+    """
+
+    def __init__(self):
+        self.pid = None
+        atexit.register(self.flush)
+
+    def _start(self):
+        # Once per process: forked workers get their own lock and thread
+        self.pid = os.getpid()
+        # Reentrant: a signal handler may take it while its thread is in add()
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.events = []
+        self.latest = {}
+        # Events set once the flusher thread has written what was buffered
+        self.drained = []
+        # Signals caught, to hand on once the buffer is written
+        self.forwarding = set()
+        threading.Thread(target=self._run, name='activity-log-flusher', daemon=True).start()
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                self._chain_signal(signum)
+
+    def _chain_signal(self, signum):
+        previous = signal.getsignal(signum)
+
+        def handler(signum, frame):
+            if signum not in self.forwarding:
+                self.forwarding.add(signum)
+                threading.Thread(target=self._flush_and_resend, args=(signum,), daemon=True).start()
+                return
+            self.forwarding.discard(signum)
+            if callable(previous):
+                previous(signum, frame)
+            elif previous != signal.SIG_IGN:
+                # Default action (or a handler not set from Python): do it now
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+
+        signal.signal(signum, handler)
+
+    def _flush_and_resend(self, signum):
+        deadline = time.monotonic() + SIGNAL_FLUSH_WAIT
+        # A failed flush (the database locked by the interrupted request) is retried
+        while not self.drain(deadline - time.monotonic()):
+            if time.monotonic() >= deadline:
+                logger.warning('Activity log not written within %ss of signal %s', SIGNAL_FLUSH_WAIT, signum)
+                break
+            time.sleep(0.2)
+        os.kill(os.getpid(), signum)
+
+    def _run(self):
+        while True:
+            self.wake.wait(settings.ACTIVITY_LOG_FLUSH_INTERVAL)
+            self.wake.clear()
+            with self.lock:
+                drained, self.drained = self.drained, []
+            try:
+                self.flush()
+            finally:
+                # Connections are per thread; do not keep this one open between flushes
+                connection.close()
+                for done in drained:
+                    done.set()
+
+    def drain(self, timeout):
+        """
+        Have the flusher thread write the buffered rows, waiting up to
+        `timeout` seconds. Returns whether the buffer is empty afterwards.
+        """
+        if self.pid != os.getpid():
+            return True
+        done = threading.Event()
+        with self.lock:
+            self.drained.append(done)
+        self.wake.set()
+        done.wait(max(timeout, 0))
+        with self.lock:
+            return not self.events and not self.latest
+
+    def add(self, user_id, activity, timestamp, latest=False):
+        if self.pid != os.getpid():
+            with _start_lock:
+                if self.pid != os.getpid():
+                    self._start()
+        with self.lock:
+            if latest:
+                self.latest[(user_id, activity)] = timestamp
+            else:
+                self.events.append((user_id, activity, timestamp))
+            pending = len(self.events) + len(self.latest)
+        if pending >= settings.ACTIVITY_LOG_FLUSH_SIZE:
+            self.wake.set()
+
+    def flush(self):
+        if self.pid != os.getpid():
+            return
+        with self.flush_lock:
+            with self.lock:
+                events, latest = self.events, self.latest
+                self.events, self.latest = [], {}
+            if not events and not latest:
+                return
+            try:
+                write_activity(events, latest)
+            except DatabaseError:
+                logger.exception('Could not write %d activity log rows, keeping them for the next flush',
+                                 len(events) + len(latest))
+                with self.lock:
+                    self.events[:0] = events
+                    for key, timestamp in latest.items():
+                        self.latest.setdefault(key, timestamp)
+                    self._trim_backlog()
+
+    def _trim_backlog(self):
+        # While the database is unavailable, keep the newest rows only
+        excess = len(self.events) + len(self.latest) - settings.ACTIVITY_LOG_MAX_BACKLOG
+        if excess > 0:
+            dropped = min(excess, len(self.events))
+            del self.events[:dropped]
+            logger.warning('Activity log backlog over %d rows, dropped the %d oldest',
+                           settings.ACTIVITY_LOG_MAX_BACKLOG, dropped)
+
+
+activity_buffer = ActivityBuffer()
+
+
+def _record(user, activity, latest):
+    user_id, timestamp = user.pk, timezone.now()
+
+    def record():
+        if settings.ACTIVITY_LOG_WRITE_BEHIND:
+            activity_buffer.add(user_id, activity, timestamp, latest)
+        elif latest:
+            write_activity([], {(user_id, activity): timestamp})
+        else:
+            write_activity([(user_id, activity, timestamp)], {})
+    # Nothing is logged for rolled back transactions
+    transaction.on_commit(record, robust=True)
+
+
+def log_activity(user, activity):
+    """Add an activity log row for `user`."""
+    _record(user, activity, latest=False)
+
+
+def log_latest_activity(user, activity):
+    """Record `activity` (login, logout) in the single row kept per user, replacing its timestamp."""
+    if activity not in UserActivityLog.LATEST_ACTIVITIES:
+        raise ValueError(f'{activity!r} is not kept once per user')
+    _record(user, activity, latest=True)
+
+
+def flush_activity():
+    """Write the buffered activity now."""
+    activity_buffer.flush()
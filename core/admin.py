@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import *
+from .certificates import certificate_pool, issue_course_certificates
 # Register your models here.
 admin.site.register(CustomUser)
 admin.site.register(MainCategory)
@@ -9,7 +10,28 @@ admin.site.register(CourseModule)
 admin.site.register(ModuleMaterialFile)
 admin.site.register(EnrollmentRequest)
 admin.site.register(CourseEnrollmentLimit)
-admin.site.register(CertificateTemplate)
+
+
+@admin.register(CertificateTemplate)
+class CertificateTemplateAdmin(admin.ModelAdmin):
+    list_display = ('course', 'min_avg_score')
+    list_select_related = ('course',)
+    actions = ['issue_certificates']
+
+    @admin.action(description='Issue missing certificates for the selected courses')
+    def issue_certificates(self, request, queryset):
+        # Large cohorts are better served by the issue_certificates command
+        pool = certificate_pool()
+        try:
+            for template in queryset.select_related('course'):
+                result = issue_course_certificates(template.course, pool=pool)
+                self.message_user(
+                    request, f'{template.course.title}: issued {result.issued} of {result.eligible} missing certificates.',
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
 admin.site.register(Certificate)
 admin.site.register(QuizAttempt)
 
@@ -0,0 +1,128 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Prefetch, Q
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework.generics import ListAPIView, RetrieveAPIView
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .catalog import CATALOG_CACHE_TIMEOUT, COUNTS, OUTLINES, TREE, catalog_versions
+from .models import Course, CourseCategory, CourseModule, MainCategory, ModuleMaterialFile
+from .serializers import CategorySerializer, CourseOutlineSerializer, CourseSerializer
+
+# Clients revalidate after this long, which costs a 304 while nothing changed
+CATALOG_API_MAX_AGE = 60
+
+
+class CatalogCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class CatalogAPIView:
+    """
+    Read-only catalog endpoint answered from the catalog versions.
+
+    The ETag hashes the request URL with the versions of `catalog_parts`,
+    which core.signals bump on every change, so a matching If-None-Match
+    gets a 304 before any query or serialization. Response bodies are
+    cached under the same hash, so other clients of an unchanged page
+    skip them too.
+    """
+    catalog_parts = ()
+
+    def requested_fields(self):
+        return [name for name in self.request.query_params.get('fields', '').split(',') if name]
+
+    def wants(self, name):
+        fields = self.requested_fields()
+        return not fields or name in fields
+
+    def get(self, request, *args, **kwargs):
+        versions = catalog_versions(*self.catalog_parts)
+        key = hashlib.md5(
+            ' '.join([request.build_absolute_uri(), *(versions[part] for part in self.catalog_parts)]).encode()
+        ).hexdigest()
+        etag = f'"{key}"'
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            response = Response(status=304)
+        else:
+            data = cache.get(f'core:api:{key}')
+            if data is None:
+                data = super().get(request, *args, **kwargs).data
+                cache.set(f'core:api:{key}', data, CATALOG_CACHE_TIMEOUT)
+            response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=CATALOG_API_MAX_AGE)
+        return response
+
+
+class CategoryListAPIView(CatalogAPIView, ListAPIView):
+    """Main categories with their subcategories and published course counts."""
+    catalog_parts = (TREE, COUNTS)
+    serializer_class = CategorySerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return (
+            MainCategory.objects.order_by('name', 'id')
+            .annotate(course_count=Count('subcategories__course', filter=Q(subcategories__course__is_published=True)))
+            .prefetch_related(Prefetch('subcategories', queryset=CourseCategory.objects.order_by('name', 'id')))
+        )
+
+
+class PublishedCourseAPIView(CatalogAPIView):
+    """Published courses; `fields` picks the fields to return and the joins for the others are left out."""
+    catalog_parts = (OUTLINES,)
+
+    def get_queryset(self):
+        courses = Course.objects.filter(is_published=True)
+        if self.wants('category'):
+            courses = courses.select_related('category__parent_category')
+        if self.wants('instructor'):
+            courses = courses.select_related('instructor')
+        if self.wants('module_count'):
+            courses = courses.annotate(module_count=Count('modules'))
+        return courses
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, fields=self.requested_fields(), **kwargs)
+
+
+class CourseListAPIView(PublishedCourseAPIView, ListAPIView):
+    """Published courses in id order, cursor paginated, optionally of one subcategory."""
+    serializer_class = CourseSerializer
+    pagination_class = CatalogCursorPagination
+
+    def filter_queryset(self, queryset):
+        category = self.request.query_params.get('category')
+        if category and category.isdigit():
+            queryset = queryset.filter(category_id=category)
+        return super().filter_queryset(queryset)
+
+
+class CourseOutlineAPIView(PublishedCourseAPIView, RetrieveAPIView):
+    """A published course with its prerequisites, modules and their materials."""
+    serializer_class = CourseOutlineSerializer
+    lookup_url_kwarg = 'course_id'
+
+    def get_queryset(self):
+        courses = super().get_queryset()
+        if self.wants('prerequisites'):
+            courses = courses.prefetch_related(
+                Prefetch('prerequisites', queryset=Course.objects.filter(is_published=True).order_by('id')),
+            )
+        if self.wants('modules'):
+            courses = courses.prefetch_related(Prefetch(
+                'modules',
+                queryset=CourseModule.objects.prefetch_related(
+                    Prefetch('files', queryset=ModuleMaterialFile.objects.order_by('id')),
+                ),
+            ))
+        return courses
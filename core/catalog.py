@@ -0,0 +1,144 @@
+import uuid
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Course, CourseCategory, CourseModule, MainCategory
+
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Each part of the catalog has its own version, bumped by core.signals:
+#   tree:   main categories and their subcategories
+#   counts: published courses per main category and in total
+#   cards:  pages of published course cards
+#   outlines: courses with their category, instructor, modules and
+#             materials, as served by the catalog API (core.api)
+TREE = 'tree'
+COUNTS = 'counts'
+CARDS = 'cards'
+OUTLINES = 'outlines'
+
+CategoryNode = namedtuple('CategoryNode', ['id', 'name', 'subcategories'])
+CategorySummary = namedtuple('CategorySummary', ['id', 'name', 'course_count'])
+CourseCard = namedtuple('CourseCard', ['id', 'title', 'description', 'category', 'module_count'])
+
+
+def _version_key(part):
+    return f'core:catalog_version:{part}'
+
+
+def catalog_versions(*parts):
+    """
+    Current version token of each part, read in one cache round trip.
+
+    Versions live in the shared cache (settings.CACHES): the catalog pages
+    and the API ETags of every worker move on together when one bumps them.
+    """
+    keys = {part: _version_key(part) for part in parts}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for part, key in keys.items():
+        version = found.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            version = cache.get(key)
+        versions[part] = version
+    return versions
+
+
+def invalidate_catalog(*parts):
+    cache.set_many({_version_key(part): uuid.uuid4().hex for part in parts}, None)
+
+
+def _cached(keys_and_builders):
+    """Fetch several versioned keys at once, building and storing the missing ones."""
+    found = cache.get_many(keys_and_builders)
+    missing = {}
+    for key, build in keys_and_builders.items():
+        if key not in found:
+            found[key] = missing[key] = build()
+    if missing:
+        cache.set_many(missing, CATALOG_CACHE_TIMEOUT)
+    return [found[key] for key in keys_and_builders]
+
+
+def build_category_tree():
+    subcategories = {}
+    for category in CourseCategory.objects.exclude(parent_category=None).order_by('name', 'id'):
+        subcategories.setdefault(category.parent_category_id, []).append((category.id, category.name))
+    return [
+        CategoryNode(main.id, main.name, subcategories.get(main.id, []))
+        for main in MainCategory.objects.order_by('name', 'id')
+    ]
+
+
+def build_course_counts():
+    published = Course.objects.filter(is_published=True)
+    by_main_category = dict(
+        published.exclude(category__parent_category=None)
+        .values_list('category__parent_category')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return {'total': published.count(), 'by_main_category': by_main_category}
+
+
+def course_cards(courses):
+    """CourseCard for each course, with module counts fetched in one query."""
+    courses = list(courses)
+    module_counts = dict(
+        CourseModule.objects.filter(course__in=[course.id for course in courses])
+        .values_list('course')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    return [
+        CourseCard(
+            course.id,
+            course.title,
+            course.description,
+            course.category.name if course.category else None,
+            module_counts.get(course.id, 0),
+        )
+        for course in courses
+    ]
+
+
+def build_course_card_page(number, per_page):
+    start = (number - 1) * per_page
+    courses = Course.objects.filter(is_published=True).select_related('category').order_by('id')
+    return course_cards(courses[start:start + per_page])
+
+
+def category_tree():
+    """Main categories in name order, each with its (id, name) subcategories."""
+    versions = catalog_versions(TREE)
+    return _cached({f'core:catalog:tree:{versions[TREE]}': build_category_tree})[0]
+
+
+def published_course_count():
+    versions = catalog_versions(COUNTS)
+    return _cached({f'core:catalog:counts:{versions[COUNTS]}': build_course_counts})[0]['total']
+
+
+def course_card_page(number, per_page):
+    """Page `number` (1-based) of published course cards in id order."""
+    versions = catalog_versions(CARDS)
+    key = f'core:catalog:cards:{versions[CARDS]}:{per_page}:{number}'
+    return _cached({key: lambda: build_course_card_page(number, per_page)})[0]
+
+
+def landing_page(categories, cards):
+    """Category summaries and the first course cards of the landing page, in two cache round trips."""
+    versions = catalog_versions(TREE, COUNTS, CARDS)
+    tree, counts, first_cards = _cached({
+        f'core:catalog:tree:{versions[TREE]}': build_category_tree,
+        f'core:catalog:counts:{versions[COUNTS]}': build_course_counts,
+        f'core:catalog:cards:{versions[CARDS]}:{cards}:1': lambda: build_course_card_page(1, cards),
+    })
+    summaries = [
+        CategorySummary(node.id, node.name, counts['by_main_category'].get(node.id, 0))
+        for node in tree[:categories]
+    ]
+    return summaries, first_cards
@@ -0,0 +1,128 @@
+import os
+import tempfile
+from io import BytesIO
+
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+# Kept free of Django imports, so certificate worker processes can load it cheaply
+
+# Where each field goes on an uploaded template. x and y are points from
+# the bottom left corner, or fractions of the page size when between 0 and 1.
+DEFAULT_LAYOUT = {
+    'student_name': {'x': 0.5, 'y': 0.55, 'font': 'Helvetica-Bold', 'size': 28, 'align': 'center'},
+    'course_title': {'x': 0.5, 'y': 0.42, 'font': 'Helvetica-Bold', 'size': 20, 'align': 'center'},
+    'issued_date': {'x': 0.5, 'y': 0.30, 'font': 'Helvetica', 'size': 12, 'align': 'center'},
+}
+
+# Parsed template pages by path. Cached template paths embed the file's
+# content hash, so an entry never goes stale.
+_template_pages = {}
+
+
+def render_certificate(full_name, course_title, issued_on):
+    """PDF bytes of a plain certificate of completion."""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    width, height = letter
+
+    c.setFont("Helvetica", 12)
+    c.drawString(100, height - 100, "Certificate of Completion")
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(100, height - 150, f"This is to certify that {full_name}")
+    c.drawString(100, height - 175, f"has successfully completed the course:")
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(100, height - 225, f"{course_title}")
+    c.setFont("Helvetica", 12)
+    c.drawString(100, height - 275, f"Issued Date: {issued_on.strftime('%Y-%m-%d')}")
+
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def extract_first_page(source, destination):
+    """Write the first page of the PDF `source` (a path or file) as a standalone PDF, atomically."""
+    writer = PdfWriter()
+    page = writer.add_page(PdfReader(source).pages[0])
+    # Every merge decodes the page's content stream again; plain Flate (zlib)
+    # is by far the cheapest filter to decode, ASCII85 chains are not
+    page.compress_content_streams()
+    writer.compress_identical_objects()
+    directory = os.path.dirname(destination)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writer.write(f)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def template_page(path):
+    page = _template_pages.get(path)
+    if page is None:
+        page = _template_pages[path] = PdfReader(path).pages[0]
+    return page
+
+
+def _coordinate(value, offset, size):
+    return offset + (value * size if 0 <= value <= 1 else value)
+
+
+def render_overlay(box, layout, fields):
+    """One transparent page the size of `box` (left, bottom, width, height) with the fields drawn on it."""
+    left, bottom, width, height = box
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=(left + width, bottom + height))
+    for name, default in DEFAULT_LAYOUT.items():
+        position = {**default, **layout.get(name, {})}
+        x = _coordinate(position['x'], left, width)
+        y = _coordinate(position['y'], bottom, height)
+        c.setFont(position['font'], position['size'])
+        draw = {'left': c.drawString, 'right': c.drawRightString}.get(position['align'], c.drawCentredString)
+        draw(x, y, fields[name])
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def render_certificate_on_template(template_path, layout, full_name, course_title, issued_on):
+    """
+    PDF bytes of the template page at `template_path` with the student and
+    course fields overlaid. Only the small overlay is drawn per certificate;
+    the template page is parsed once per process.
+    """
+    page = template_page(template_path)
+    box = tuple(float(value) for value in (page.mediabox.left, page.mediabox.bottom, page.mediabox.width, page.mediabox.height))
+    fields = {
+        'student_name': full_name,
+        'course_title': course_title,
+        'issued_date': f"Issued Date: {issued_on.strftime('%Y-%m-%d')}",
+    }
+    overlay = PdfReader(BytesIO(render_overlay(box, layout or {}, fields))).pages[0]
+
+    writer = PdfWriter()
+    # add_page copies the cached page into the writer, so merging leaves it untouched
+    certificate = writer.add_page(page)
+    certificate.merge_page(overlay)
+    # Fastest zlib level: most of the size win for a fraction of the time
+    certificate.compress_content_streams(level=1)
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def render_certificate_job(job):
+    """
+    Certificate rendering for process pool maps:
+    (key, full_name, course_title, issued_on, template_path, layout) -> (key, pdf).
+    Without a template path the plain certificate is drawn.
+    """
+    key, full_name, course_title, issued_on, template_path, layout = job
+    if template_path is None:
+        return key, render_certificate(full_name, course_title, issued_on)
+    return key, render_certificate_on_template(template_path, layout, full_name, course_title, issued_on)
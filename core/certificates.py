@@ -0,0 +1,169 @@
+import hashlib
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Avg, Exists, FloatField, OuterRef, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from pypdf.errors import PdfReadError
+
+from .certificate_pdf import extract_first_page, render_certificate_job
+from .models import Certificate, CertificateTemplate, CustomUser, EnrollmentRequest, QuizAttempt
+
+ISSUE_BATCH_SIZE = 500
+# Certificates handed to a worker process at a time
+RENDER_CHUNK_SIZE = 16
+
+IssueResult = namedtuple('IssueResult', ['course', 'eligible', 'issued'])
+
+# {(template id, file name): cached template path, or None when the file is no usable PDF}
+_template_paths = {}
+
+
+def student_average_score(student, course):
+    """Average score of the student's attempted quizzes in a course, 0 without attempts."""
+    average = QuizAttempt.objects.filter(student=student, quiz__module__course=course).aggregate(
+        average=Avg('score'),
+    )['average']
+    return average or 0
+
+
+def students_missing_certificates(course, min_avg_score):
+    """
+    (id, full name) of every approved student of a course whose average
+    score reaches `min_avg_score` and who has no certificate for it yet,
+    in one aggregate query ordered by id.
+    """
+    students = (
+        CustomUser.objects
+        .filter(Exists(EnrollmentRequest.objects.filter(student=OuterRef('pk'), course=course, status='approved')))
+        .exclude(Exists(Certificate.objects.filter(student=OuterRef('pk'), certificate_template__course=course)))
+        .annotate(average_score=Coalesce(
+            Avg('quizattempt__score', filter=Q(quizattempt__quiz__module__course=course)), Value(0),
+            output_field=FloatField(),
+        ))
+        .filter(average_score__gte=min_avg_score)
+        .order_by('id')
+        .values_list('id', 'first_name', 'last_name')
+    )
+    return [(student_id, f'{first_name} {last_name}'.strip()) for student_id, first_name, last_name in students]
+
+
+def _file_digest(field_file):
+    digest = hashlib.sha256()
+    with field_file.open('rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_template_path(template):
+    """
+    Local path of a single page copy of a template's uploaded PDF, or None
+    when there is no usable PDF and certificates are drawn plain.
+
+    Copies live in CERTIFICATE_TEMPLATE_CACHE_DIR named by the upload's
+    SHA-256, so re-uploads of the same file share one, and a replaced file
+    gets a new name (and a new storage name, which the memo is keyed on).
+    """
+    if template is None or not template.template_file:
+        return None
+    key = (template.id, template.template_file.name)
+    if key not in _template_paths:
+        path = None
+        if template.template_file.name.lower().endswith('.pdf'):
+            try:
+                path = os.path.join(settings.CERTIFICATE_TEMPLATE_CACHE_DIR, f'{_file_digest(template.template_file)}.pdf')
+                if not os.path.exists(path):
+                    with template.template_file.open('rb') as f:
+                        extract_first_page(f, path)
+            except (OSError, PdfReadError, IndexError):
+                path = None
+        _template_paths[key] = path
+    return _template_paths[key]
+
+
+def certificate_job(key, full_name, course_title, issued_on, template=None):
+    """Job tuple for certificate_pdf.render_certificate_job, on the course's template when it has one."""
+    template_path = cached_template_path(template)
+    layout = template.field_layout if template_path is not None else None
+    return (key, full_name, course_title, issued_on, template_path, layout)
+
+
+def render_course_certificate(template, full_name, course_title, issued_on):
+    """PDF bytes of one certificate, rendered in process."""
+    return render_certificate_job(certificate_job(None, full_name, course_title, issued_on, template))[1]
+
+
+def certificate_pool(workers=None):
+    """
+    Process pool for rendering certificates, or None to render in process.
+
+    Workers are spawned rather than forked, so they never inherit the
+    parent's database connections.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1:
+        return None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def issue_course_certificates(course, pool=None, batch_size=ISSUE_BATCH_SIZE, progress=None):
+    """
+    Issue every missing certificate of a course.
+
+    Eligibility is computed up front in one query, then students are
+    handled in batches: the PDFs are rendered in `pool` (in process when
+    None), on the course's template when it has a PDF one, saved to
+    storage, and the Certificate rows are bulk created in a transaction
+    per batch. An interrupted run can simply be started again,
+    because students who already have a certificate are never selected.
+    `progress(issued, eligible)` is called after each batch.
+    """
+    template = CertificateTemplate.objects.filter(course=course).first()
+    if template is None:
+        return IssueResult(course, 0, 0)
+
+    students = students_missing_certificates(course, template.min_avg_score)
+    file_field = Certificate._meta.get_field('certificate_file')
+    issued_on = timezone.localdate()
+    issued = 0
+
+    for start in range(0, len(students), batch_size):
+        batch = students[start:start + batch_size]
+        jobs = [certificate_job(student_id, full_name, course.title, issued_on, template) for student_id, full_name in batch]
+        if pool is None:
+            rendered = map(render_certificate_job, jobs)
+        else:
+            rendered = pool.map(render_certificate_job, jobs, chunksize=RENDER_CHUNK_SIZE)
+
+        files = {}
+        for student_id, pdf in rendered:
+            name = file_field.generate_filename(None, f'certificate_{course.id}_{student_id}.pdf')
+            files[student_id] = file_field.storage.save(name, ContentFile(pdf))
+
+        with transaction.atomic():
+            # Students issued a certificate by the student view in the meantime
+            existing = set(
+                Certificate.objects.filter(student_id__in=files, certificate_template__course=course)
+                .values_list('student_id', flat=True)
+            )
+            Certificate.objects.bulk_create(
+                Certificate(student_id=student_id, certificate_template=template, certificate_file=name)
+                for student_id, name in files.items()
+                if student_id not in existing
+            )
+        for student_id in existing:
+            file_field.storage.delete(files[student_id])
+
+        issued += len(files) - len(existing)
+        if progress is not None:
+            progress(issued, len(students))
+
+    return IssueResult(course, len(students), issued)
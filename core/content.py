@@ -0,0 +1,83 @@
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.middleware.csrf import get_token
+from django.utils import timezone
+
+from .models import Course, CourseContentVersion, Discussion, EnrollmentRequest, QuizAttempt
+
+def bump_course_content(course_id, create=True):
+    """
+    Move a course's content version on. Deletes pass create=False: during a
+    cascade the version row may already be gone with its course.
+    """
+    if course_id is None:
+        return
+    now = timezone.now()
+    if CourseContentVersion.objects.filter(course_id=course_id).update(version=F('version') + 1, updated_at=now) or not create:
+        return
+    try:
+        with transaction.atomic():
+            CourseContentVersion.objects.create(course_id=course_id, version=1, updated_at=now)
+    except IntegrityError:
+        # Created concurrently (or the course is gone)
+        CourseContentVersion.objects.filter(course_id=course_id).update(version=F('version') + 1, updated_at=now)
+
+
+def _aggregate(queryset, group, **aggregate):
+    # Correlated subquery for one aggregate of `queryset` grouped on `group`
+    (name, expression), = aggregate.items()
+    return Subquery(queryset.order_by().values(group).annotate(**{name: expression}).values(name)[:1])
+
+
+def course_page_etag(request, course_id):
+    """
+    ETag of a student's course page, in one query; None when the course
+    does not exist.
+
+    It covers what the page shows: the course and its content version,
+    the category, the student's enrollment request and quiz attempts, the
+    approved count and the discussions. The URL (the discussion page) and
+    the CSRF cookie (the form tokens) are part of it too. There is no
+    Last-Modified: deleted discussions or attempts would not move it.
+    Discussions are tracked by id, count and newest timestamp only: a
+    message edited in place or a sender renaming their account keeps the
+    ETag, so those show up once the next discussion is posted.
+    """
+    user_id = request.user.pk
+    # Sets CSRF_COOKIE on a first visit, as rendering the page would
+    get_token(request)
+    enrollment = EnrollmentRequest.objects.filter(course=OuterRef('pk'), student_id=user_id)
+    discussions = Discussion.objects.filter(course=OuterRef('pk'))
+    attempts = QuizAttempt.objects.filter(quiz__module__course=OuterRef('pk'), student_id=user_id)
+    row = (
+        Course.objects.filter(id=course_id)
+        .annotate(
+            enrollment_status=Subquery(enrollment.values('status')[:1]),
+            enrollment_requested=Subquery(enrollment.values('request_date')[:1]),
+            enrollment_responded=Subquery(enrollment.values('response_date')[:1]),
+            last_response=_aggregate(
+                EnrollmentRequest.objects.filter(course=OuterRef('pk')), 'course', last=Max('response_date'),
+            ),
+            last_discussion=_aggregate(discussions, 'course', last=Max('id')),
+            discussion_count=_aggregate(discussions, 'course', count=Count('id')),
+            last_discussion_at=_aggregate(discussions, 'course', last=Max('timestamp')),
+            attempt_count=_aggregate(attempts, 'student', count=Count('id')),
+            last_attempt_at=_aggregate(attempts, 'student', last=Max('attempt_date')),
+        )
+        .values_list(
+            'updated_at', 'content_version__version', 'content_version__updated_at', 'category__name',
+            'enrollment_rollup__approved', 'enrollment_status', 'enrollment_requested', 'enrollment_responded',
+            'last_response', 'last_discussion', 'discussion_count', 'last_discussion_at',
+            'attempt_count', 'last_attempt_at',
+        )
+        .first()
+    )
+    if row is None:
+        return None
+
+    key = hashlib.md5(repr((
+        row, user_id, getattr(request.user, 'role', None), request.get_full_path(), request.META.get('CSRF_COOKIE'),
+    )).encode()).hexdigest()
+    return f'"{key}"'
@@ -0,0 +1,71 @@
+from collections import namedtuple
+
+from django.db.models.expressions import RawSQL
+
+from .models import Discussion
+
+THREADS_PER_PAGE = 20
+
+# `threads` keeps the shape the templates iterate over:
+# {thread id: {'message': discussion, 'replies': [reply, ...]}}
+DiscussionPage = namedtuple('DiscussionPage', ['threads', 'next_cursor'])
+
+
+def _descendant_ids(root_ids):
+    table = Discussion._meta.db_table
+    placeholders = ', '.join(['%s'] * len(root_ids))
+    return RawSQL(
+        f'WITH RECURSIVE tree(id) AS ('
+        f'SELECT id FROM {table} WHERE parent_id IN ({placeholders}) '
+        f'UNION ALL '
+        f'SELECT d.id FROM {table} d JOIN tree ON d.parent_id = tree.id'
+        f') SELECT id FROM tree',
+        list(root_ids),
+    )
+
+
+def load_discussion_threads(course, before=None, limit=THREADS_PER_PAGE):
+    """
+    One page of a course's top-level threads, newest first, with full reply trees.
+
+    Pages are keyset paginated on the thread id: pass the previous page's
+    `next_cursor` as `before`. Replies of any depth are flattened depth
+    first in timestamp order and get a `depth` attribute (1 for direct
+    replies). Costs three queries whatever the number of messages.
+    """
+    threads = Discussion.objects.filter(course=course, parent__isnull=True).select_related('sender', 'receiver')
+    if before:
+        threads = threads.filter(id__lt=before)
+    threads = list(threads.order_by('-id')[:limit + 1])
+
+    next_cursor = None
+    if len(threads) > limit:
+        threads = threads[:limit]
+        next_cursor = threads[-1].id
+
+    children = {}
+    if threads:
+        replies = (
+            Discussion.objects.filter(id__in=_descendant_ids([thread.id for thread in threads]))
+            .select_related('sender', 'receiver')
+            .order_by('timestamp', 'id')
+        )
+        for reply in replies:
+            children.setdefault(reply.parent_id, []).append(reply)
+
+    page = {}
+    for thread in threads:
+        flattened = []
+        stack = [(reply, 1) for reply in reversed(children.get(thread.id, []))]
+        while stack:
+            reply, depth = stack.pop()
+            reply.depth = depth
+            flattened.append(reply)
+            stack.extend((child, depth + 1) for child in reversed(children.get(reply.id, [])))
+        page[thread.id] = {'message': thread, 'replies': flattened}
+
+    return DiscussionPage(threads=page, next_cursor=next_cursor)
+
+
+def parse_cursor(value):
+    return int(value) if value and value.isdigit() else None
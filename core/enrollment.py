@@ -0,0 +1,263 @@
+from collections import namedtuple
+
+from django.contrib import messages
+from django.db import transaction
+from django.template.defaultfilters import pluralize
+from django.utils import timezone
+
+from .models import CourseEnrollmentLimit, EnrollmentRequest, UserActivityLog
+from .rollups import adjust_enrollments, move_enrollments, remember_state
+from .roster import invalidate_course_roster
+
+APPROVED = 'approved'
+REJECTED = 'rejected'
+COURSE_FULL = 'full'
+NOT_PENDING = 'not_pending'
+REMOVED = 'removed'
+NOT_APPROVED = 'not_approved'
+
+BULK_BATCH_SIZE = 500
+BULK_RETRIES = 3
+# Students named in the summary of a bulk action before it says "and N more"
+BULK_NAMED_OUTCOMES = 10
+
+EnrollmentOutcome = namedtuple('EnrollmentOutcome', ['request_id', 'student', 'course', 'outcome'])
+
+
+def approve_enrollment_request(enrollment_request):
+    """
+    Approve a pending request and reserve its seat as one atomic operation.
+
+    Both steps are conditional UPDATEs, so two concurrent approvals can
+    neither oversubscribe the course nor approve the same request twice.
+    Courses without a CourseEnrollmentLimit row have no seat limit.
+    Returns APPROVED, COURSE_FULL or NOT_PENDING.
+    """
+    course_id = enrollment_request.course_id
+    now = timezone.now()
+    with transaction.atomic():
+        approved = EnrollmentRequest.objects.filter(id=enrollment_request.id, status='pending').update(
+            status='approved', response_date=now,
+        )
+        if not approved:
+            return NOT_PENDING
+
+        has_limit = CourseEnrollmentLimit.objects.filter(course_id=course_id).exists()
+        if has_limit and not CourseEnrollmentLimit.reserve_seat(course_id):
+            transaction.set_rollback(True)
+            return COURSE_FULL
+
+        # The UPDATE above skips the post_save rollup receiver
+        move_enrollments(course_id, 'pending', 'approved')
+        # Robust: the approval is committed whatever happens to the cache
+        transaction.on_commit(lambda: invalidate_course_roster(course_id), robust=True)
+
+    enrollment_request.status = 'approved'
+    enrollment_request.response_date = now
+    remember_state(enrollment_request)
+    return APPROVED
+
+
+def reject_enrollment_request(enrollment_request):
+    """
+    Reject a pending request with a conditional UPDATE, so a request
+    approved concurrently keeps its approval and seat.
+    Returns REJECTED or NOT_PENDING.
+    """
+    course_id = enrollment_request.course_id
+    now = timezone.now()
+    with transaction.atomic():
+        rejected = EnrollmentRequest.objects.filter(id=enrollment_request.id, status='pending').update(
+            status='rejected', response_date=now,
+        )
+        if not rejected:
+            return NOT_PENDING
+        # The UPDATE above skips the post_save rollup receiver
+        move_enrollments(course_id, 'pending', 'rejected')
+        transaction.on_commit(lambda: invalidate_course_roster(course_id), robust=True)
+
+    enrollment_request.status = 'rejected'
+    enrollment_request.response_date = now
+    remember_state(enrollment_request)
+    return REJECTED
+
+
+def remove_enrollment(enrollment_request):
+    """
+    Remove an approved student and release their seat as one atomic
+    operation. Only a request still approved is removed, so a double
+    submit or concurrent removals release one seat, and pending or
+    rejected requests, which hold none, release nothing.
+    Returns REMOVED or NOT_APPROVED.
+    """
+    course_id = enrollment_request.course_id
+    with transaction.atomic():
+        removed = EnrollmentRequest.objects.filter(id=enrollment_request.id, status='approved').update(status='removed')
+        if not removed:
+            return NOT_APPROVED
+        CourseEnrollmentLimit.release_seat(course_id)
+        # The UPDATE above skips the post_save rollup receiver
+        progress = EnrollmentRequest.objects.filter(id=enrollment_request.id).values_list('progress', flat=True).first()
+        adjust_enrollments(course_id, 'approved', -1, progress)
+        transaction.on_commit(lambda: invalidate_course_roster(course_id), robust=True)
+
+    enrollment_request.status = 'removed'
+    remember_state(enrollment_request)
+    return REMOVED
+
+
+def enrollment_message(request, enrollment_request, outcome):
+    """Tell the user how approving or rejecting `enrollment_request` went."""
+    student, course = enrollment_request.student.username, enrollment_request.course.title
+    if outcome == APPROVED:
+        messages.success(request, f'{student} was enrolled in {course}.')
+    elif outcome == REJECTED:
+        messages.success(request, f'The request of {student} for {course} was rejected.')
+    elif outcome == COURSE_FULL:
+        messages.error(request, f'{course} is full: {student} was not enrolled.')
+    else:
+        messages.warning(request, f'The request of {student} for {course} was already handled.')
+
+
+def bulk_enrollment_message(request, outcomes):
+    """Summarise the EnrollmentOutcome list of a bulk action, one message per kind of outcome."""
+    if not outcomes:
+        messages.warning(request, 'No pending requests were selected.')
+        return
+    by_outcome = {}
+    for outcome in outcomes:
+        by_outcome.setdefault(outcome.outcome, []).append(outcome)
+    if APPROVED in by_outcome:
+        count = len(by_outcome[APPROVED])
+        messages.success(request, f'{count} student{pluralize(count)} enrolled.')
+    if REJECTED in by_outcome:
+        count = len(by_outcome[REJECTED])
+        messages.success(request, f'{count} request{pluralize(count)} rejected.')
+    if COURSE_FULL in by_outcome:
+        # The students that were turned away are the ones worth naming
+        full = by_outcome[COURSE_FULL]
+        names = ', '.join(f'{outcome.student} ({outcome.course})' for outcome in full[:BULK_NAMED_OUTCOMES])
+        if len(full) > BULK_NAMED_OUTCOMES:
+            names += f' and {len(full) - BULK_NAMED_OUTCOMES} more'
+        messages.error(request, f'Course full, not enrolled: {names}.')
+    if NOT_PENDING in by_outcome:
+        count = len(by_outcome[NOT_PENDING])
+        messages.warning(request, f'{count} request{pluralize(count)} had already been handled.')
+
+
+def select_enrollment_requests(queryset, data):
+    """
+    Narrow `queryset` to what a bulk form posted: the checked `request_ids`,
+    or with `select_all` every pending request, optionally of one `course_id`.
+    """
+    if data.get('select_all'):
+        queryset = queryset.filter(status='pending')
+    else:
+        request_ids = [value for value in data.getlist('request_ids') if value.isdigit()]
+        queryset = queryset.filter(id__in=request_ids)
+
+    course_id = data.get('course_id')
+    if course_id and course_id.isdigit():
+        queryset = queryset.filter(course_id=course_id)
+    return queryset
+
+
+class StaleEnrollmentRequests(Exception):
+    """Requests or seat counts changed while a bulk action was running."""
+
+
+def bulk_process_enrollment_requests(enrollment_requests, action, log_user=None):
+    """
+    Approve or reject every pending request of a queryset in one transaction.
+
+    Requests are taken oldest first. Status changes are set-based UPDATEs,
+    seats are reserved per course with one compare-and-set UPDATE, and
+    requests beyond a course's free seats stay pending as COURSE_FULL.
+    When `log_user` is given, one UserActivityLog row per processed request
+    is bulk inserted for them. Returns one EnrollmentOutcome per request.
+    """
+    for attempt in range(BULK_RETRIES):
+        try:
+            return _bulk_process(enrollment_requests, action, log_user)
+        except StaleEnrollmentRequests:
+            if attempt == BULK_RETRIES - 1:
+                raise
+
+
+def _update_pending(request_ids, **fields):
+    updated = 0
+    for start in range(0, len(request_ids), BULK_BATCH_SIZE):
+        batch = request_ids[start:start + BULK_BATCH_SIZE]
+        updated += EnrollmentRequest.objects.filter(id__in=batch, status='pending').update(**fields)
+    if updated != len(request_ids):
+        raise StaleEnrollmentRequests()
+
+
+def _bulk_process(enrollment_requests, action, log_user):
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            enrollment_requests.select_for_update(of=('self',))
+            .order_by('request_date', 'id')
+            .values_list('id', 'status', 'course_id', 'student__username', 'course__title')
+        )
+
+        outcomes = {}
+        pending_by_course = {}
+        for request_id, status, course_id, _, _ in rows:
+            if status == 'pending':
+                pending_by_course.setdefault(course_id, []).append(request_id)
+            else:
+                outcomes[request_id] = NOT_PENDING
+
+        if action == 'reject':
+            rejected = [request_id for ids in pending_by_course.values() for request_id in ids]
+            _update_pending(rejected, status='rejected', response_date=now)
+            outcomes.update((request_id, REJECTED) for request_id in rejected)
+            for course_id, request_ids in pending_by_course.items():
+                move_enrollments(course_id, 'pending', 'rejected', len(request_ids))
+        else:
+            seats_by_course = {
+                course_id: (limit, current)
+                for course_id, limit, current in CourseEnrollmentLimit.objects.select_for_update()
+                .filter(course_id__in=list(pending_by_course))
+                .values_list('course_id', 'enrollment_limit', 'current_enrollments')
+            }
+            approved = []
+            for course_id, request_ids in pending_by_course.items():
+                if course_id in seats_by_course:
+                    limit, current = seats_by_course[course_id]
+                    seats = min(max(limit - current, 0), len(request_ids))
+                    # Compare-and-set against the count read above
+                    if seats and not CourseEnrollmentLimit.objects.filter(
+                        course_id=course_id, current_enrollments=current,
+                    ).update(current_enrollments=current + seats):
+                        raise StaleEnrollmentRequests()
+                else:
+                    seats = len(request_ids)
+                approved.extend(request_ids[:seats])
+                move_enrollments(course_id, 'pending', 'approved', seats)
+                outcomes.update((request_id, COURSE_FULL) for request_id in request_ids[seats:])
+            _update_pending(approved, status='approved', response_date=now)
+            outcomes.update((request_id, APPROVED) for request_id in approved)
+
+            def invalidate_rosters(course_ids=list(pending_by_course)):
+                for course_id in course_ids:
+                    invalidate_course_roster(course_id)
+            transaction.on_commit(invalidate_rosters, robust=True)
+
+        if log_user is not None:
+            verb = {APPROVED: 'approved', REJECTED: 'rejected'}
+            UserActivityLog.objects.bulk_create(
+                (
+                    UserActivityLog(user=log_user, activity=f'{student} {course} course request {verb[outcomes[request_id]]}')
+                    for request_id, _, _, student, course in rows
+                    if outcomes[request_id] in verb
+                ),
+                batch_size=BULK_BATCH_SIZE,
+            )
+
+    return [
+        EnrollmentOutcome(request_id, student, course, outcomes[request_id])
+        for request_id, _, _, student, course in rows
+    ]
@@ -107,11 +107,12 @@ class CourseEnrollmentLimitForm(forms.ModelForm):
 class CertificateTemplateForm(forms.ModelForm):
     class Meta:
         model = CertificateTemplate
-        fields = ['template_file', 'course','min_avg_score']
+        fields = ['template_file', 'course','min_avg_score', 'field_layout']
         widgets = {
             'template_file': forms.FileInput(attrs={'class': 'form-control'}),
             'course': forms.Select(attrs={'class': 'form-control'}),
-            'min_avg_score': forms.NumberInput(attrs={'class': 'form-control'})
+            'min_avg_score': forms.NumberInput(attrs={'class': 'form-control'}),
+            'field_layout': forms.Textarea(attrs={'class': 'form-control', 'rows': 4}),
         }
 
 class IssueCertificateForm(forms.Form):
@@ -0,0 +1,125 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from .models import Answer, Question, QuizAttempt
+
+ANSWER_KEY_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Process-local copies: {quiz id: (version, answer key)}
+_local_answer_keys = {}
+_local_lock = threading.Lock()
+
+
+class InvalidSubmission(Exception):
+    """A submitted option does not belong to its question."""
+
+
+def load_answer_key(quiz_id):
+    """{question id: {option id: is_correct}} for a quiz, in one query."""
+    answer_key = {}
+    rows = Question.objects.filter(quiz_id=quiz_id).values_list('id', 'options__id', 'options__is_correct')
+    for question_id, option_id, is_correct in rows:
+        options = answer_key.setdefault(question_id, {})
+        if option_id is not None:
+            options[option_id] = is_correct
+    return answer_key
+
+
+def _version_cache_key(quiz_id):
+    return f'core:answer_key_version:{quiz_id}'
+
+
+def answer_key_version(quiz_id):
+    """
+    Content version of a quiz's answer key, kept in the shared cache
+    (settings.CACHES) so that every worker sees an invalidation.
+
+    Versions are random tokens rather than counters, so a version key lost
+    to eviction can never be recreated equal to an older one.
+    """
+    key = _version_cache_key(quiz_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def get_answer_key(quiz_id):
+    """
+    Answer key from the process-local copy, else the shared cache, else the DB.
+
+    Both layers are keyed by quiz id and content version, so in steady state
+    grading reads no rows for the key.
+    """
+    version = answer_key_version(quiz_id)
+    local = _local_answer_keys.get(quiz_id)
+    if local is not None and local[0] == version:
+        return local[1]
+
+    shared_key = f'core:answer_key:{quiz_id}:{version}'
+    answer_key = cache.get(shared_key)
+    if answer_key is None:
+        answer_key = load_answer_key(quiz_id)
+        cache.set(shared_key, answer_key, ANSWER_KEY_CACHE_TIMEOUT)
+    with _local_lock:
+        _local_answer_keys[quiz_id] = (version, answer_key)
+    return answer_key
+
+
+def invalidate_answer_key(quiz_id):
+    if quiz_id is None:
+        return
+    cache.set(_version_cache_key(quiz_id), uuid.uuid4().hex, None)
+    with _local_lock:
+        _local_answer_keys.pop(quiz_id, None)
+
+
+def grade_submission(answer_key, data):
+    """
+    Grade posted ``question_<id>`` fields against an answer key in memory.
+
+    Returns the percentage score and the (question id, option id) pairs to store.
+    """
+    selected = []
+    correct_answers = 0
+    for question_id, options in answer_key.items():
+        value = data.get(f'question_{question_id}')
+        if not value:
+            continue
+        option_id = int(value) if value.isdigit() else None
+        if option_id not in options:
+            raise InvalidSubmission(f'Option {value} does not belong to question {question_id}.')
+        selected.append((question_id, option_id))
+        if options[option_id]:
+            correct_answers += 1
+
+    total_questions = len(answer_key)
+    score = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
+    return score, selected
+
+
+def submit_quiz(student, quiz, data):
+    """
+    Grade a submission and store the attempt with its answers in one transaction.
+
+    Returns the new QuizAttempt, or None when the student already attempted the quiz.
+    """
+    if QuizAttempt.objects.filter(student=student, quiz=quiz).exists():
+        return None
+
+    score, selected = grade_submission(get_answer_key(quiz.id), data)
+    try:
+        with transaction.atomic():
+            attempt = QuizAttempt.objects.create(student=student, quiz=quiz, score=score)
+            Answer.objects.bulk_create(
+                Answer(attempt=attempt, question_id=question_id, selected_option_id=option_id)
+                for question_id, option_id in selected
+            )
+    except IntegrityError:
+        # A concurrent submission of the same quiz won the unique constraint
+        return None
+    return attempt
@@ -0,0 +1,191 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+import traceback
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('queries', 'sql_ms', 'template_ms', 'wall_ms')
+PERCENTILES = (50, 95, 99)
+
+_current = contextvars.ContextVar('core_instrumentation', default=None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_ms', 'template_ms', 'slow_queries')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self.slow_queries = []
+
+
+class ViewStats:
+    """Rolling window of the last samples recorded for one URL name."""
+
+    def __init__(self, size):
+        self.count = 0
+        self.samples = {metric: deque(maxlen=size) for metric in METRICS}
+
+    def add(self, sample):
+        self.count += 1
+        for metric in METRICS:
+            self.samples[metric].append(sample[metric])
+
+    def summary(self):
+        summary = {'count': self.count}
+        for metric, values in self.samples.items():
+            ordered = sorted(values)
+            summary[metric] = {
+                f'p{p}': round(ordered[min(len(ordered) - 1, len(ordered) * p // 100)], 2) if ordered else None
+                for p in PERCENTILES
+            }
+            summary[metric]['max'] = round(ordered[-1], 2) if ordered else None
+        return summary
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.slow_queries = deque(maxlen=_setting('INSTRUMENTATION_SLOW_QUERY_LOG_SIZE', 200))
+
+    def record(self, view_name, sample, slow_queries):
+        with self.lock:
+            stats = self.views.get(view_name)
+            if stats is None:
+                stats = self.views[view_name] = ViewStats(_setting('INSTRUMENTATION_SAMPLE_SIZE', 1000))
+            stats.add(sample)
+            self.slow_queries.extend(dict(query, view=view_name) for query in slow_queries)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'views': {name: stats.summary() for name, stats in sorted(self.views.items())},
+                'slow_queries': list(reversed(self.slow_queries)),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+            self.slow_queries.clear()
+
+
+registry = Registry()
+
+
+def _call_site():
+    """Innermost stack frame inside the project, skipping Django and this module."""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        filename = frame.filename
+        if filename.startswith(base_dir) and 'site-packages' not in filename and filename != __file__:
+            return f'{os.path.relpath(filename, base_dir)}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def _query_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if stats is not None:
+            elapsed = (time.perf_counter() - started) * 1000
+            stats.queries += 1
+            stats.sql_ms += elapsed
+            if elapsed >= _setting('INSTRUMENTATION_SLOW_QUERY_MS', 100):
+                stats.slow_queries.append({'sql': sql[:1000], 'ms': round(elapsed, 2), 'call_site': _call_site()})
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            if stats is not None:
+                stats.template_ms += (time.perf_counter() - started) * 1000
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Django template backend that adds each top-level render to the request's template time."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+class InstrumentationMiddleware:
+    """
+    Records query count, SQL time, template time and wall time per URL name.
+
+    Budgets come from the VIEW_BUDGETS setting, e.g.
+    ``{'student_course_detail': {'queries': 20, 'wall_ms': 500}, '*': {...}}``;
+    exceeding one logs a warning on the ``core.instrumentation`` logger.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _setting('INSTRUMENTATION_ENABLED', True):
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with _wrap_connections():
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = (match.view_name if match else None) or 'unresolved'
+        sample = {
+            'queries': stats.queries,
+            'sql_ms': stats.sql_ms,
+            'template_ms': stats.template_ms,
+            'wall_ms': (time.perf_counter() - started) * 1000,
+        }
+        registry.record(view_name, sample, stats.slow_queries)
+        self.check_budget(view_name, sample, request)
+        return response
+
+    def check_budget(self, view_name, sample, request):
+        budgets = _setting('VIEW_BUDGETS', {})
+        budget = budgets.get(view_name, budgets.get('*'))
+        if not budget:
+            return
+        exceeded = {metric: round(sample[metric], 2) for metric, limit in budget.items() if sample.get(metric, 0) > limit}
+        if exceeded:
+            logger.warning('Budget exceeded for %s (%s %s): %s, budget %s',
+                           view_name, request.method, request.path, exceeded, budget)
+
+
+class _wrap_connections:
+    def __enter__(self):
+        self.wrappers = [connection.execute_wrapper(_query_wrapper) for connection in connections.all()]
+        for wrapper in self.wrappers:
+            wrapper.__enter__()
+
+    def __exit__(self, *exc_info):
+        for wrapper in reversed(self.wrappers):
+            wrapper.__exit__(*exc_info)
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+
+from .discussions import parse_cursor
+
+LIST_PAGE_SIZE = 50
+
+# `previous_cursor` and `next_cursor` are the `before` and `after`
+# values of the neighbouring pages, None on the first or last page
+ListPage = namedtuple('ListPage', ['items', 'previous_cursor', 'next_cursor', 'query'])
+
+
+def prefix_search(queryset, fields, text):
+    """
+    Rows where one of `fields` starts with `text`, ignoring case.
+
+    The prefix is matched as a range on Lower(field), which the Lower()
+    indexes on user names, emails and course titles can answer, unlike
+    LIKE or icontains.
+    """
+    prefix = (text or '').strip().lower()
+    if not prefix:
+        return queryset
+    # Smallest string after every string starting with the prefix
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    condition = Q()
+    for field in fields:
+        condition |= Q(GreaterThanOrEqual(Lower(field), prefix), LessThan(Lower(field), upper))
+    return queryset.filter(condition)
+
+
+def keyset_page(queryset, after=None, before=None, limit=LIST_PAGE_SIZE):
+    """
+    One page of rows in id order: the rows after the `after` id, or the
+    rows before the `before` id. One query whatever the page, unlike
+    OFFSET which reads and skips every earlier row.
+    """
+    if before:
+        items = list(queryset.filter(id__lt=before).order_by('-id')[:limit + 1])
+        has_previous = len(items) > limit
+        items = items[:limit][::-1]
+        previous_cursor = items[0].id if has_previous else None
+        next_cursor = items[-1].id if items else before - 1
+        return ListPage(items, previous_cursor, next_cursor, None)
+
+    if after:
+        queryset = queryset.filter(id__gt=after)
+    items = list(queryset.order_by('id')[:limit + 1])
+    next_cursor = items[limit - 1].id if len(items) > limit else None
+    items = items[:limit]
+    previous_cursor = None
+    if after:
+        previous_cursor = items[0].id if items else after + 1
+    return ListPage(items, previous_cursor, next_cursor, None)
+
+
+def list_page(request, queryset, search_fields):
+    """Search and keyset paginate `queryset` with the q, after and before GET parameters."""
+    query = request.GET.get('q', '').strip()
+    page = keyset_page(
+        prefix_search(queryset, search_fields, query),
+        after=parse_cursor(request.GET.get('after')),
+        before=parse_cursor(request.GET.get('before')),
+    )
+    return page._replace(query=query)
@@ -0,0 +1,90 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.pdfgen import canvas
+
+from core import certificate_pdf
+from core.certificate_pdf import extract_first_page, render_certificate, render_certificate_on_template
+
+
+class Command(BaseCommand):
+    help = (
+        'Time certificate rendering: the plain drawn certificate, overlaying a template '
+        'parsed for every certificate, and overlaying the cached single page copy of it. '
+        'Uses --template, or generates a busy multi-page template.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', help='PDF certificate template to overlay.')
+        parser.add_argument('--count', type=int, default=200, help='Certificates per path.')
+        parser.add_argument('--pages', type=int, default=5, help='Pages of the generated template.')
+        parser.add_argument('--shapes', type=int, default=2000, help='Drawn shapes per generated page.')
+
+    def handle(self, *args, **options):
+        if options['template'] and not os.path.exists(options['template']):
+            raise CommandError(f'No such file: {options["template"]}')
+
+        with tempfile.TemporaryDirectory() as directory:
+            source = options['template'] or self.generate_template(
+                os.path.join(directory, 'template.pdf'), options['pages'], options['shapes'],
+            )
+            cached = os.path.join(directory, 'cached.pdf')
+            started = time.perf_counter()
+            extract_first_page(source, cached)
+            self.stdout.write(
+                f'Template: {os.path.getsize(source) / 1024:.0f} KiB, cached page {os.path.getsize(cached) / 1024:.0f} KiB, '
+                f'extracted in {(time.perf_counter() - started) * 1000:.1f} ms'
+            )
+
+            def uncached(name, title, issued_on):
+                certificate_pdf._template_pages.clear()
+                return render_certificate_on_template(source, {}, name, title, issued_on)
+
+            def warm(name, title, issued_on):
+                return render_certificate_on_template(cached, {}, name, title, issued_on)
+
+            paths = [
+                ('plain', render_certificate),
+                ('template parsed per certificate', uncached),
+                ('cached template page', warm),
+            ]
+            for label, render in paths:
+                self.report(label, self.time(render, options['count']))
+
+    def generate_template(self, path, pages, shapes):
+        rng = random.Random(0)
+        width, height = landscape(letter)
+        c = canvas.Canvas(path, pagesize=(width, height))
+        for _ in range(pages):
+            c.setStrokeColorRGB(0.6, 0.5, 0.2)
+            for _ in range(shapes):
+                c.line(rng.uniform(0, width), rng.uniform(0, height), rng.uniform(0, width), rng.uniform(0, height))
+            c.setFont('Times-Bold', 36)
+            c.drawCentredString(width / 2, height * 0.8, 'Certificate of Completion')
+            c.showPage()
+        c.save()
+        return path
+
+    def time(self, render, count):
+        timings = []
+        size = 0
+        for i in range(count):
+            started = time.perf_counter()
+            size += len(render(f'Student {i}', 'Benchmark Course', date.today()))
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings, size / max(count, 1)
+
+    def report(self, label, result):
+        timings, average_size = result
+        total = sum(timings)
+        self.stdout.write(
+            f'{label:32} mean {statistics.mean(timings):7.2f} ms  '
+            f'p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:7.2f} ms  '
+            f'{len(timings) / (total / 1000):7.1f}/s  {average_size / 1024:6.1f} KiB each'
+        )
@@ -0,0 +1,300 @@
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.models import Course, CustomUser, EnrollmentRequest, Option, QuizAttempt
+
+from .seed_ols import WORDS
+
+# Relative weight of each scenario in the replayed mix
+SCENARIOS = {
+    'catalog_browse': 40,
+    'course_detail': 30,
+    'quiz_submit': 10,
+    'roster': 10,
+    'export_csv': 5,
+    'progress_pdf': 5,
+}
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, len(ordered) * p // 100)] if ordered else None
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a weighted mix of page requests through the test client and report '
+        'throughput and p50/p95/p99 latency per scenario. Run seed_ols first. Quiz '
+        'submissions are deleted again after each request. Use --output and --compare '
+        'to compare branches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--clients', type=int, default=10, help='Logged-in clients per role and worker.')
+        parser.add_argument('--prefix', default='seed', help='Username prefix of the seeded users to act as.')
+        parser.add_argument('--scenarios', default='',
+                            help='Weight overrides, e.g. "catalog_browse=1,quiz_submit=0".')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare against.')
+
+    def handle(self, *args, **options):
+        weights = self.parse_weights(options['scenarios'])
+        self.load_fixtures(options['prefix'])
+
+        # The test client talks to 'testserver'
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            self.run_worker(0, options['warmup'], weights, options, random.Random(options['seed'] - 1))
+
+            concurrency = max(options['concurrency'], 1)
+            counts = [options['requests'] // concurrency] * concurrency
+            counts[0] += options['requests'] % concurrency
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(
+                    lambda worker: self.run_worker(
+                        worker, counts[worker], weights, options, random.Random(options['seed'] + worker),
+                    ),
+                    range(concurrency),
+                ))
+            elapsed = time.perf_counter() - started
+
+        results = self.summarize([sample for worker in samples for sample in worker], elapsed, options)
+        self.print_results(results)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(json.load(f), results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    def parse_weights(self, overrides):
+        weights = dict(SCENARIOS)
+        for item in filter(None, overrides.split(',')):
+            name, _, weight = item.partition('=')
+            if name not in weights:
+                raise CommandError(f'Unknown scenario {name!r}, choose from {", ".join(SCENARIOS)}.')
+            weights[name] = float(weight or 0)
+        weights = {name: weight for name, weight in weights.items() if weight > 0}
+        if not weights:
+            raise CommandError('Every scenario has weight 0.')
+        return weights
+
+    def load_fixtures(self, prefix):
+        users = CustomUser.objects.filter(username__startswith=f'{prefix}_')
+        enrollments = list(
+            EnrollmentRequest.objects.filter(status='approved', student__in=users, student__role='student')
+            .values_list('student_id', 'course_id')[:5000]
+        )
+        if not enrollments:
+            raise CommandError(f'No approved enrollments of users named {prefix}_*, run seed_ols first.')
+        self.enrollments = enrollments
+        self.student_ids = sorted({student_id for student_id, _ in enrollments})
+        self.instructor_courses = list(
+            Course.objects.filter(instructor__in=users).values_list('instructor_id', 'id')[:5000]
+        )
+        self.admin_ids = list(CustomUser.objects.filter(is_superuser=True).values_list('id', flat=True)[:1])
+
+        # Quizzes of the sampled courses with {question id: option ids}, for submissions
+        course_ids = {course_id for _, course_id in enrollments}
+        self.quizzes = {}
+        rows = Option.objects.filter(question__quiz__module__course_id__in=course_ids).values_list(
+            'question__quiz__module__course_id', 'question__quiz_id', 'question_id', 'id',
+        )
+        for course_id, quiz_id, question_id, option_id in rows.iterator():
+            quiz = self.quizzes.setdefault(course_id, {}).setdefault(quiz_id, {})
+            quiz.setdefault(question_id, []).append(option_id)
+        self.attempted = set(
+            QuizAttempt.objects.filter(student_id__in=self.student_ids).values_list('student_id', 'quiz_id')
+        )
+        self.attempted_lock = threading.Lock()
+
+    def clients(self, user_ids, count, rng):
+        clients = []
+        for user in CustomUser.objects.filter(id__in=rng.sample(user_ids, min(count, len(user_ids)))):
+            client = Client()
+            client.force_login(user)
+            clients.append((user.id, client))
+        return clients
+
+    def run_worker(self, worker, count, weights, options, rng):
+        try:
+            students = dict(self.clients(self.student_ids, options['clients'], rng))
+            instructors = dict(self.clients(sorted({i for i, _ in self.instructor_courses}), options['clients'], rng))
+            admins = dict(self.clients(self.admin_ids, 1, rng))
+            courses_by_student = {}
+            for student_id, course_id in self.enrollments:
+                if student_id in students:
+                    courses_by_student.setdefault(student_id, []).append(course_id)
+            students = {student_id: client for student_id, client in students.items() if student_id in courses_by_student}
+            courses_by_instructor = {}
+            for instructor_id, course_id in self.instructor_courses:
+                if instructor_id in instructors:
+                    courses_by_instructor.setdefault(instructor_id, []).append(course_id)
+
+            context = {
+                'rng': rng,
+                'students': students,
+                'courses_by_student': courses_by_student,
+                'instructors': instructors,
+                'courses_by_instructor': courses_by_instructor,
+                'admins': admins,
+            }
+            names = list(weights)
+            samples = []
+            for name in rng.choices(names, weights=[weights[name] for name in names], k=count):
+                samples.append(getattr(self, f'scenario_{name}')(context))
+            return [sample for sample in samples if sample is not None]
+        finally:
+            connection.close()
+
+    def timed(self, name, request):
+        started = time.perf_counter()
+        try:
+            response = request()
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        return name, (time.perf_counter() - started) * 1000, ok
+
+    def scenario_catalog_browse(self, context):
+        rng = context['rng']
+        client = rng.choice(list(context['students'].values()))
+        params = {'page': rng.randint(1, 3)}
+        if rng.random() < 0.5:
+            params['course_title'] = rng.choice(WORDS)
+        return self.timed('catalog_browse', lambda: client.get(reverse('student_dashboard'), params))
+
+    def scenario_course_detail(self, context):
+        rng = context['rng']
+        student_id = rng.choice(list(context['students']))
+        course_id = rng.choice(context['courses_by_student'][student_id])
+        client = context['students'][student_id]
+        return self.timed('course_detail', lambda: client.get(reverse('student_course_detail', args=[course_id])))
+
+    def scenario_quiz_submit(self, context):
+        rng = context['rng']
+        student_id = rng.choice(list(context['students']))
+        course_id = rng.choice(context['courses_by_student'][student_id])
+        candidates = [
+            quiz_id for quiz_id in self.quizzes.get(course_id, {})
+            if (student_id, quiz_id) not in self.attempted
+        ]
+        if not candidates:
+            return None
+        quiz_id = rng.choice(candidates)
+        with self.attempted_lock:
+            if (student_id, quiz_id) in self.attempted:
+                return None
+            self.attempted.add((student_id, quiz_id))
+
+        data = {'submit_quiz': 'true', 'quiz_id': quiz_id}
+        for question_id, option_ids in self.quizzes[course_id][quiz_id].items():
+            data[f'question_{question_id}'] = rng.choice(option_ids)
+        client = context['students'][student_id]
+        try:
+            return self.timed(
+                'quiz_submit', lambda: client.post(reverse('student_course_detail', args=[course_id]), data),
+            )
+        finally:
+            # Leave the dataset as it was, so runs stay comparable
+            QuizAttempt.objects.filter(student_id=student_id, quiz_id=quiz_id).delete()
+            with self.attempted_lock:
+                self.attempted.discard((student_id, quiz_id))
+
+    def scenario_roster(self, context):
+        if not context['instructors']:
+            return None
+        rng = context['rng']
+        instructor_id = rng.choice(list(context['instructors']))
+        course_id = rng.choice(context['courses_by_instructor'][instructor_id])
+        client = context['instructors'][instructor_id]
+        return self.timed('roster', lambda: client.get(reverse('course_enrolled_students', args=[course_id])))
+
+    def scenario_export_csv(self, context):
+        if not context['admins']:
+            return None
+        rng = context['rng']
+        client = next(iter(context['admins'].values()))
+        course_id = rng.choice(self.enrollments)[1]
+        return self.timed('export_csv', lambda: client.get(reverse('export_csv'), {'course': course_id}))
+
+    def scenario_progress_pdf(self, context):
+        if not context['instructors']:
+            return None
+        rng = context['rng']
+        instructor_id = rng.choice(list(context['instructors']))
+        course_id = rng.choice(context['courses_by_instructor'][instructor_id])
+        client = context['instructors'][instructor_id]
+        return self.timed('progress_pdf', lambda: client.get(reverse('download_progress', args=[course_id])))
+
+    def summarize(self, samples, elapsed, options):
+        by_scenario = {}
+        for name, ms, ok in samples:
+            by_scenario.setdefault(name, []).append((ms, ok))
+
+        def stats(entries, seconds=None):
+            ordered = sorted(ms for ms, _ in entries)
+            summary = {
+                'requests': len(entries),
+                'errors': sum(1 for _, ok in entries if not ok),
+                'mean_ms': round(statistics.fmean(ordered), 2) if ordered else None,
+            }
+            summary.update({f'p{p}_ms': round(percentile(ordered, p), 2) if ordered else None for p in (50, 95, 99)})
+            if seconds:
+                summary['throughput_rps'] = round(len(entries) / seconds, 2)
+            return summary
+
+        return {
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'seconds': round(elapsed, 3),
+            'total': stats([(ms, ok) for _, ms, ok in samples], elapsed),
+            'scenarios': {name: stats(entries) for name, entries in sorted(by_scenario.items())},
+        }
+
+    def print_results(self, results):
+        header = f'{"scenario":<16}{"requests":>9}{"errors":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+        self.stdout.write(header)
+        for name, stats in [*results['scenarios'].items(), ('total', results['total'])]:
+            self.stdout.write(
+                f'{name:<16}{stats["requests"]:>9}{stats["errors"]:>8}'
+                f'{stats["p50_ms"] or 0:>10.2f}{stats["p95_ms"] or 0:>10.2f}{stats["p99_ms"] or 0:>10.2f}'
+            )
+        self.stdout.write(
+            f'{results["total"]["requests"]} requests in {results["seconds"]:.2f}s '
+            f'({results["total"].get("throughput_rps", 0)} req/s, concurrency {results["concurrency"]})'
+        )
+
+    def print_comparison(self, baseline, results):
+        self.stdout.write('Change against baseline (p50 / p95 / p99):')
+        for name, stats in [*results['scenarios'].items(), ('total', results['total'])]:
+            before = baseline['total'] if name == 'total' else baseline['scenarios'].get(name)
+            if not before:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if before.get(key) and stats.get(key) is not None:
+                    changes.append(f'{(stats[key] - before[key]) / before[key] * 100:+.1f}%')
+                else:
+                    changes.append('n/a')
+            self.stdout.write(f'{name:<16}{" / ".join(changes)}')
+        if baseline['total'].get('throughput_rps'):
+            ratio = results['total']['throughput_rps'] / baseline['total']['throughput_rps']
+            self.stdout.write(f'Throughput: {ratio:.2f}x baseline')
@@ -0,0 +1,87 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import transaction
+
+from core.models import Course, CourseCategory, MainCategory
+from core.search import IContainsSearchBackend, SQLiteFTS5SearchBackend, get_search_backend
+
+WORDS = [
+    'python', 'django', 'data', 'science', 'machine', 'learning', 'web', 'design',
+    'algebra', 'calculus', 'history', 'biology', 'chemistry', 'physics', 'music',
+    'theory', 'painting', 'marketing', 'finance', 'accounting', 'writing', 'poetry',
+    'networks', 'security', 'cloud', 'mobile', 'android', 'kubernetes', 'statistics',
+    'economics', 'philosophy', 'spanish', 'french', 'photography', 'cooking', 'yoga',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the icontains course search with the search index on synthetic '
+        'courses. Everything is created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--per-page', type=int, default=12)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if not isinstance(backend, SQLiteFTS5SearchBackend):
+            raise CommandError(f'The active search backend is {type(backend).__name__}, nothing to compare.')
+
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            self.create_courses(rng, options['courses'])
+            started = time.perf_counter()
+            backend.rebuild()
+            self.stdout.write(f'Indexed in {time.perf_counter() - started:.2f}s')
+
+            terms = [rng.choice(WORDS) for _ in range(options['queries'])]
+            published = Course.objects.filter(is_published=True)
+            paths = [
+                ('icontains (title)', lambda term: published.filter(title__icontains=term).order_by('id')),
+                ('icontains (all fields)', lambda term: IContainsSearchBackend().search(published, term)),
+                ('fts5 ranked', lambda term: backend.search(published, term)),
+            ]
+            for name, search in paths:
+                timings = []
+                for term in terms:
+                    started = time.perf_counter()
+                    page = Paginator(search(term), options['per_page']).get_page(1)
+                    list(page)
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                self.stdout.write(
+                    f'{name:<24} p50 {statistics.median(timings):8.2f} ms   '
+                    f'p95 {timings[int(len(timings) * 0.95) - 1]:8.2f} ms   '
+                    f'max {timings[-1]:8.2f} ms'
+                )
+
+            transaction.set_rollback(True)
+
+    def create_courses(self, rng, count):
+        main = MainCategory.objects.create(name='Benchmark')
+        categories = [CourseCategory.objects.create(name=word, parent_category=main) for word in WORDS[:10]]
+
+        def sentence(words):
+            return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+        Course.objects.bulk_create(
+            (
+                Course(
+                    title=sentence(4).title(),
+                    description=sentence(40),
+                    category=rng.choice(categories),
+                    difficulty_level='Beginner',
+                    is_published=True,
+                )
+                for _ in range(count)
+            ),
+            batch_size=2000,
+        )
@@ -0,0 +1,113 @@
+import hashlib
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from core.models import CONTENT_ADDRESSED_FIELDS, StoredBlob
+from core.previews import prune_previews
+from core.storage import BLOB_DIR, LocalFile, blob_name, content_addressed_storage, recount_blob_references
+
+
+# Where the file fields stored files before the blob store
+LEGACY_DIRS = ('course_materials', 'certificate_templates', 'certificates')
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def human(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(size) < 1024 or unit == 'GiB':
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+        size /= 1024
+
+
+class Command(BaseCommand):
+    help = (
+        'Move material, certificate template and certificate files stored under '
+        'title-based names into the content-addressed blob store, keeping one copy '
+        'of identical files, then recount blob references. Reports the bytes reclaimed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only hash the files and report what would be reclaimed.')
+        parser.add_argument('--delete-unreferenced', action='store_true',
+                            help='Also delete files in the legacy upload directories that no row refers to.')
+
+    def handle(self, *args, **options):
+        storage = content_addressed_storage
+        dry_run = options['dry_run']
+        existing = set(StoredBlob.objects.values_list('name', flat=True))
+        before = after = files = 0
+        missing = []
+
+        for model, field in CONTENT_ADDRESSED_FIELDS.items():
+            # Legacy names, with how many rows share each
+            names = (
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .exclude(**{f'{field}__startswith': f'{BLOB_DIR}/'})
+                .values_list(field).annotate(rows=Count('pk')).order_by()
+            )
+            for name, rows in names:
+                path = storage.path(name)
+                if not os.path.exists(path):
+                    missing.append(name)
+                    continue
+                size = os.path.getsize(path)
+                files += 1
+                before += size
+                sha256 = sha256_of(path)
+                target = blob_name(sha256, os.path.splitext(name)[1])
+                if target not in existing:
+                    existing.add(target)
+                    after += size
+                if dry_run:
+                    continue
+
+                with transaction.atomic():
+                    with open(path, 'rb') as f:
+                        stored = storage.save(name, LocalFile(f, sha256=sha256))
+                    if rows > 1:
+                        StoredBlob.objects.filter(name=stored).update(references=F('references') + rows - 1)
+                    # Queryset update: the rows keep their reference, no signal releases the old name
+                    model.objects.filter(**{field: name}).update(**{field: stored})
+                if os.path.exists(path):
+                    os.remove(path)
+
+        freed = 0 if dry_run else recount_blob_references() + prune_previews()
+
+        # Leftovers of replaced uploads and deleted rows
+        referenced = set()
+        for model, field in CONTENT_ADDRESSED_FIELDS.items():
+            referenced.update(model.objects.values_list(field, flat=True).iterator())
+        unreferenced = []
+        for legacy in LEGACY_DIRS:
+            for directory, _, filenames in os.walk(storage.path(legacy)):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    if os.path.relpath(path, storage.location).replace(os.sep, '/') not in referenced:
+                        unreferenced.append(path)
+        unreferenced_size = sum(os.path.getsize(path) for path in unreferenced)
+        if unreferenced and options['delete_unreferenced'] and not dry_run:
+            for path in unreferenced:
+                os.remove(path)
+            freed += unreferenced_size
+        elif unreferenced:
+            self.stdout.write(
+                f'{len(unreferenced)} files ({human(unreferenced_size)}) in the legacy upload directories '
+                f'are not used by any row; --delete-unreferenced removes them.'
+            )
+        for name in missing:
+            self.stdout.write(self.style.WARNING(f'Missing on disk: {name}'))
+        verb = 'Would reclaim' if dry_run else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{files} files, {human(before)} under legacy names, {human(after)} as blobs. '
+            f'{verb} {human(before - after + freed)}.'
+        ))
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = 'Discard chunked material uploads that were not touched for MATERIAL_UPLOAD_EXPIRY seconds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.MATERIAL_UPLOAD_EXPIRY, help='Seconds.')
+
+    def handle(self, *args, **options):
+        count = expire_uploads(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f'Discarded {count} unfinished uploads.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core.models import ModuleMaterialFile
+from core.previews import generate_preview, materials_without_preview, prune_previews
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails and metadata for course materials that have none for their current file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate the previews of every material.')
+
+    def handle(self, *args, **options):
+        materials = ModuleMaterialFile.objects.exclude(file='') if options['all'] else materials_without_preview()
+        done = failed = 0
+        for material in materials.order_by('id').iterator():
+            try:
+                fields = generate_preview(material)
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'{material.id} {material.file.name}: {e}'))
+                continue
+            done += 1
+            self.stdout.write(f'{material.id} {material.file.name}: {"thumbnail" if fields["preview"] else "metadata only"}')
+        freed = prune_previews()
+        self.stdout.write(self.style.SUCCESS(
+            f'Previewed {done} materials, {failed} failed; {freed} bytes of unused previews removed.'
+        ))
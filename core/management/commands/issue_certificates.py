@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.certificates import ISSUE_BATCH_SIZE, certificate_pool, issue_course_certificates
+from core.models import Course
+
+
+class Command(BaseCommand):
+    help = (
+        'Issue the missing certificates of every eligible student of the given courses, '
+        'rendering the PDFs in a process pool. Safe to re-run after an interruption: '
+        'students who already have a certificate are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int)
+        parser.add_argument('--all', action='store_true', help='Every course with a certificate template.')
+        parser.add_argument('--workers', type=int, default=None, help='Render processes, default one per CPU.')
+        parser.add_argument('--batch-size', type=int, default=ISSUE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['all']:
+            courses = Course.objects.filter(template__isnull=False).order_by('id')
+        elif options['course_ids']:
+            courses = Course.objects.filter(id__in=options['course_ids']).order_by('id')
+        else:
+            raise CommandError('Give course ids or --all.')
+
+        pool = certificate_pool(options['workers'])
+        try:
+            for course in courses:
+                started = time.perf_counter()
+
+                def progress(issued, eligible):
+                    rate = issued / max(time.perf_counter() - started, 1e-6)
+                    self.stdout.write(f'  {course.title}: {issued}/{eligible} issued ({rate:.0f}/s)')
+
+                result = issue_course_certificates(course, pool=pool, batch_size=options['batch_size'], progress=progress)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{course.title}: issued {result.issued} of {result.eligible} missing certificates '
+                    f'in {time.perf_counter() - started:.1f}s'
+                ))
+        finally:
+            if pool is not None:
+                pool.shutdown()
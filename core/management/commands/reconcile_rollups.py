@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core.rollups import reconcile_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the analytics rollups from the source tables, report every row '
+        'that drifted and rewrite the rollup tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift, leave the rollups alone.')
+        parser.add_argument('--show', type=int, default=20, help='How many drifted rows to list.')
+
+    def handle(self, *args, **options):
+        drift = reconcile_rollups(fix=not options['dry_run'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Rollups match the source tables.'))
+            return
+
+        tables = {}
+        for entry in drift:
+            tables[entry.table] = tables.get(entry.table, 0) + 1
+        for table, count in sorted(tables.items()):
+            self.stdout.write(self.style.WARNING(f'{table}: {count} drifted rows'))
+        for entry in drift[:options['show']]:
+            self.stdout.write(f'  {entry.table} {entry.key}: stored {entry.stored}, expected {entry.expected}')
+        if options['dry_run']:
+            self.stdout.write('Dry run, nothing rewritten.')
+        else:
+            self.stdout.write(self.style.SUCCESS('Rollups rebuilt.'))
@@ -0,0 +1,275 @@
+import random
+import time
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.catalog import CARDS, COUNTS, TREE, invalidate_catalog
+from core.models import (
+    Answer, Course, CourseCategory, CourseEnrollmentLimit, CourseModule, CustomUser, Discussion,
+    EnrollmentRequest, MainCategory, Option, Question, Quiz, QuizAttempt,
+)
+from core.rollups import reconcile_rollups
+from core.search import get_search_backend
+
+WORDS = [
+    'python', 'django', 'data', 'science', 'machine', 'learning', 'web', 'design',
+    'algebra', 'calculus', 'history', 'biology', 'chemistry', 'physics', 'music',
+    'theory', 'painting', 'marketing', 'finance', 'accounting', 'writing', 'poetry',
+    'networks', 'security', 'cloud', 'mobile', 'android', 'kubernetes', 'statistics',
+    'economics', 'philosophy', 'spanish', 'french', 'photography', 'cooking', 'yoga',
+]
+DIFFICULTY_LEVELS = ['Beginner', 'Intermediate', 'Advanced']
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic dataset of users, categories, courses, modules, quizzes, '
+        'enrollments, attempts and discussions with bulk inserts. Generated users share '
+        'the --prefix and the given --password, so --flush can remove them again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--instructors', type=int, default=20)
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--main-categories', type=int, default=5)
+        parser.add_argument('--categories', type=int, default=4, help='Subcategories per main category.')
+        parser.add_argument('--courses', type=int, default=200)
+        parser.add_argument('--modules', type=int, default=5, help='Modules per course.')
+        parser.add_argument('--quizzes', type=int, default=1, help='Quizzes per module.')
+        parser.add_argument('--questions', type=int, default=5, help='Questions per quiz.')
+        parser.add_argument('--options', type=int, default=4, help='Options per question.')
+        parser.add_argument('--enrollments', type=int, default=10, help='Enrollment requests per student.')
+        parser.add_argument('--attempt-rate', type=float, default=0.5,
+                            help='Share of quizzes an approved student has attempted.')
+        parser.add_argument('--discussions', type=int, default=10, help='Threads per course.')
+        parser.add_argument('--replies', type=int, default=3, help='Replies per thread.')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--flush', action='store_true',
+                            help='Delete users, courses and categories from earlier runs with the same prefix first.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            if options['flush']:
+                self.flush()
+            instructors, students = self.create_users(options)
+            categories = self.create_categories(options)
+            courses = self.create_courses(options, instructors, categories)
+            quizzes_by_course = self.create_content(options, courses)
+            approved_by_course = self.create_enrollments(options, students, courses)
+            self.create_attempts(options, quizzes_by_course, approved_by_course)
+            self.create_discussions(options, courses, students, approved_by_course)
+            # bulk_create skips the signals that keep the search index, catalog and rollups in sync
+            get_search_backend().index_courses([course.id for course in courses])
+            reconcile_rollups()
+            transaction.on_commit(lambda: invalidate_catalog(TREE, COUNTS, CARDS))
+
+        self.stdout.write(self.style.SUCCESS(f'Seeded in {time.perf_counter() - started:.2f}s.'))
+
+    def report(self, label, count):
+        self.stdout.write(f'{label}: {count}')
+
+    def bulk_create(self, model, objs):
+        return model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+    def sentence(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    def flush(self):
+        users = CustomUser.objects.filter(username__startswith=f'{self.prefix}_')
+        courses = Course.objects.filter(instructor__in=users.filter(role='instructor'))
+        categories = MainCategory.objects.filter(name__startswith=f'{self.prefix.title()} ')
+        deleted = courses.count()
+        get_search_backend().remove_courses(list(courses.values_list('id', flat=True)))
+        courses.delete()
+        CourseCategory.objects.filter(parent_category__in=categories).delete()
+        categories.delete()
+        self.report('Flushed courses', deleted)
+        self.report('Flushed users', users.delete()[1].get(CustomUser._meta.label, 0))
+
+    def create_users(self, options):
+        password = make_password(options['password'])
+        tag = uuid.uuid4().hex[:6]
+
+        def users(role, count):
+            return self.bulk_create(CustomUser, (
+                CustomUser(
+                    username=f'{self.prefix}_{tag}_{role}_{i}',
+                    email=f'{self.prefix}_{tag}_{role}_{i}@example.com',
+                    first_name=self.rng.choice(WORDS).title(),
+                    last_name=self.rng.choice(WORDS).title(),
+                    role=role,
+                    password=password,
+                )
+                for i in range(count)
+            ))
+
+        instructors = users('instructor', options['instructors'])
+        students = users('student', options['students'])
+        self.report('Instructors', len(instructors))
+        self.report('Students', len(students))
+        return instructors, students
+
+    def create_categories(self, options):
+        main_categories = self.bulk_create(MainCategory, (
+            MainCategory(name=f'{self.prefix.title()} {self.sentence(2).title()}')
+            for _ in range(options['main_categories'])
+        ))
+        categories = self.bulk_create(CourseCategory, (
+            CourseCategory(name=self.sentence(2).title(), parent_category=main)
+            for main in main_categories
+            for _ in range(options['categories'])
+        ))
+        self.report('Categories', len(main_categories) + len(categories))
+        return categories
+
+    def create_courses(self, options, instructors, categories):
+        courses = self.bulk_create(Course, (
+            Course(
+                title=self.sentence(4).title(),
+                description=self.sentence(40),
+                instructor=self.rng.choice(instructors) if instructors else None,
+                category=self.rng.choice(categories) if categories else None,
+                difficulty_level=self.rng.choice(DIFFICULTY_LEVELS),
+                is_published=self.rng.random() < 0.9,
+            )
+            for _ in range(options['courses'])
+        ))
+        self.report('Courses', len(courses))
+        return courses
+
+    def create_content(self, options, courses):
+        modules = self.bulk_create(CourseModule, (
+            CourseModule(course=course, title=self.sentence(3).title(), description=self.sentence(15), order=order)
+            for course in courses
+            for order in range(1, options['modules'] + 1)
+        ))
+        quizzes = self.bulk_create(Quiz, (
+            Quiz(module=module, title=f'{module.title} Quiz {i + 1}')
+            for module in modules
+            for i in range(options['quizzes'])
+        ))
+        questions = self.bulk_create(Question, (
+            Question(quiz=quiz, text=f'{self.sentence(8).capitalize()}?', question_type='MC')
+            for quiz in quizzes
+            for _ in range(options['questions'])
+        ))
+        correct = {question.id: self.rng.randrange(options['options']) for question in questions}
+        option_objs = self.bulk_create(Option, (
+            Option(question=question, text=self.sentence(3), is_correct=i == correct[question.id])
+            for question in questions
+            for i in range(options['options'])
+        ))
+        self.report('Modules', len(modules))
+        self.report('Quizzes', len(quizzes))
+        self.report('Questions', len(questions))
+        self.report('Options', len(option_objs))
+
+        # {course id: [(quiz id, [(question id, [(option id, is_correct), ...]), ...]), ...]}
+        options_by_question = {}
+        for option in option_objs:
+            options_by_question.setdefault(option.question_id, []).append((option.id, option.is_correct))
+        questions_by_quiz = {}
+        for question in questions:
+            questions_by_quiz.setdefault(question.quiz_id, []).append((question.id, options_by_question.get(question.id, [])))
+        course_by_module = {module.id: module.course_id for module in modules}
+        quizzes_by_course = {}
+        for quiz in quizzes:
+            quizzes_by_course.setdefault(course_by_module[quiz.module_id], []).append(
+                (quiz.id, questions_by_quiz.get(quiz.id, []))
+            )
+        return quizzes_by_course
+
+    def create_enrollments(self, options, students, courses):
+        course_ids = [course.id for course in courses]
+        requests = []
+        approved_by_course = {}
+        for student in students:
+            for course_id in self.rng.sample(course_ids, min(options['enrollments'], len(course_ids))):
+                roll = self.rng.random()
+                status = 'approved' if roll < 0.7 else 'pending' if roll < 0.9 else 'rejected'
+                requests.append(EnrollmentRequest(
+                    student=student,
+                    course_id=course_id,
+                    status=status,
+                    progress=self.rng.uniform(0, 100) if status == 'approved' else 0.0,
+                ))
+                if status == 'approved':
+                    approved_by_course.setdefault(course_id, []).append(student.id)
+        self.bulk_create(EnrollmentRequest, requests)
+
+        # Seat counts must agree with the approved requests
+        self.bulk_create(CourseEnrollmentLimit, (
+            CourseEnrollmentLimit(
+                course_id=course_id,
+                enrollment_limit=len(approved_by_course.get(course_id, [])) + self.rng.randint(0, 50),
+                current_enrollments=len(approved_by_course.get(course_id, [])),
+            )
+            for course_id in course_ids
+        ))
+        self.report('Enrollment requests', len(requests))
+        return approved_by_course
+
+    def create_attempts(self, options, quizzes_by_course, approved_by_course):
+        attempts = []
+        picks = []
+        for course_id, student_ids in approved_by_course.items():
+            for student_id in student_ids:
+                for quiz_id, questions in quizzes_by_course.get(course_id, []):
+                    if self.rng.random() >= options['attempt_rate']:
+                        continue
+                    selected = [(question_id, self.rng.choice(opts)) for question_id, opts in questions if opts]
+                    correct_answers = sum(1 for _, (_, is_correct) in selected if is_correct)
+                    score = (correct_answers / len(questions)) * 100 if questions else 0
+                    attempts.append(QuizAttempt(student_id=student_id, quiz_id=quiz_id, score=round(score, 2)))
+                    picks.append(selected)
+        attempts = self.bulk_create(QuizAttempt, attempts)
+        answers = self.bulk_create(Answer, (
+            Answer(attempt=attempt, question_id=question_id, selected_option_id=option_id)
+            for attempt, selected in zip(attempts, picks)
+            for question_id, (option_id, _) in selected
+        ))
+        self.report('Quiz attempts', len(attempts))
+        self.report('Answers', len(answers))
+
+    def create_discussions(self, options, courses, students, approved_by_course):
+        if not students:
+            return
+        student_ids = [student.id for student in students]
+        threads = []
+        for course in courses:
+            if course.instructor_id is None:
+                continue
+            participants = approved_by_course.get(course.id) or student_ids
+            for _ in range(options['discussions']):
+                threads.append(Discussion(
+                    course=course, sender_id=self.rng.choice(participants),
+                    receiver_id=course.instructor_id, message=self.sentence(12),
+                ))
+        threads = self.bulk_create(Discussion, threads)
+
+        # One round of replies per level, each answering a random earlier message of its thread
+        messages = {thread.id: [thread] for thread in threads}
+        replies = 0
+        for _ in range(options['replies']):
+            round_replies = []
+            for thread in threads:
+                parent = self.rng.choice(messages[thread.id])
+                round_replies.append(Discussion(
+                    course_id=thread.course_id, sender_id=parent.receiver_id, receiver_id=parent.sender_id,
+                    message=self.sentence(10), parent=parent,
+                ))
+            for thread, reply in zip(threads, self.bulk_create(Discussion, round_replies)):
+                messages[thread.id].append(reply)
+            replies += len(round_replies)
+        self.report('Discussions', len(threads) + replies)
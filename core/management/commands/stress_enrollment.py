@@ -0,0 +1,77 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from core.enrollment import APPROVED, COURSE_FULL, approve_enrollment_request
+from core.models import Course, CourseEnrollmentLimit, CustomUser, EnrollmentRequest
+from core.rollups import adjust_counter, adjust_enrollments, role_counter
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire parallel approvals at one throwaway course and check that seats '
+        'are never oversubscribed. The course and its students are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated course and students.')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        course = Course.objects.create(title=f'Enrollment stress {tag}', description='', difficulty_level='Beginner')
+        CourseEnrollmentLimit.objects.create(course=course, enrollment_limit=options['limit'])
+        students = CustomUser.objects.bulk_create(
+            CustomUser(username=f'stress_{tag}_{i}', role='student', password='!')
+            for i in range(options['requests'])
+        )
+        EnrollmentRequest.objects.bulk_create(
+            EnrollmentRequest(student=student, course=course) for student in students
+        )
+        # bulk_create skips the rollup receivers
+        adjust_counter(role_counter('student'), len(students))
+        adjust_enrollments(course.id, 'pending', len(students))
+        # Two approvals per request, so double approvals are exercised too
+        request_ids = list(EnrollmentRequest.objects.filter(course=course).values_list('id', flat=True)) * 2
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                outcomes = list(pool.map(self.approve, request_ids))
+            elapsed = time.perf_counter() - started
+
+            limit = CourseEnrollmentLimit.objects.get(course=course)
+            approved = EnrollmentRequest.objects.filter(course=course, status='approved').count()
+            counts = {outcome: outcomes.count(outcome) for outcome in set(outcomes)}
+            self.stdout.write(
+                f'{len(request_ids)} approvals in {elapsed:.2f}s: {counts}; '
+                f'approved={approved} seats={limit.current_enrollments}/{limit.enrollment_limit}'
+            )
+
+            expected = min(options['limit'], options['requests'])
+            if approved != limit.current_enrollments or approved > limit.enrollment_limit:
+                raise CommandError('Seat accounting is inconsistent.')
+            if counts.get(APPROVED, 0) != approved or (approved < expected and 'error' not in counts):
+                raise CommandError('Approval outcomes do not match the stored state.')
+            self.stdout.write(self.style.SUCCESS('No oversubscription.'))
+        finally:
+            if not options['keep']:
+                course.delete()
+                CustomUser.objects.filter(id__in=[student.id for student in students]).delete()
+
+    def approve(self, request_id):
+        try:
+            for attempt in range(20):
+                try:
+                    return approve_enrollment_request(EnrollmentRequest.objects.get(id=request_id))
+                except OperationalError:
+                    # SQLite reports lock contention instead of waiting forever
+                    time.sleep(0.05 * (attempt + 1))
+            return 'error'
+        finally:
+            connection.close()
@@ -0,0 +1,178 @@
+import mimetypes
+import os
+import re
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from .models import EnrollmentRequest
+
+# Buffer used to stream files, whatever the size of the file or range
+STREAM_BLOCK_SIZE = 64 * 1024
+# More ranges than this in one request are answered with the whole file
+MAX_RANGES = 16
+
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+class UnsatisfiableRange(Exception):
+    pass
+
+
+def can_view_material(user, material):
+    """Admins, the course's instructor and its approved students may view a material."""
+    if not user.is_authenticated:
+        return False
+    course = material.module.course
+    if user.is_superuser or user.role == 'admin' or course.instructor_id == user.id:
+        return True
+    return EnrollmentRequest.objects.filter(student=user, course=course, status='approved').exists()
+
+
+def parse_ranges(header, size):
+    """
+    [(first, last), ...] byte ranges of a Range header, sorted and with
+    overlapping or adjacent ranges merged; None when the header should be
+    ignored (missing, malformed, not bytes, or too many ranges).
+    Raises UnsatisfiableRange when no range overlaps the file.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    specs = header[len('bytes='):].split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+    ranges = []
+    for spec in specs:
+        match = RANGE_RE.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first == '':
+            # Suffix range: the last `last` bytes, none of an empty file
+            if int(last) == 0 or size == 0:
+                continue
+            first, last = max(size - int(last), 0), size - 1
+        else:
+            first, last = int(first), int(last) if last else None
+            if last is not None and last < first:
+                return None
+            if first >= size:
+                continue
+            last = size - 1 if last is None else min(last, size - 1)
+        ranges.append((first, last))
+    if not ranges:
+        raise UnsatisfiableRange()
+
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def read_range(path, first, last):
+    with open(path, 'rb') as f:
+        f.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def _multipart(path, ranges, size, content_type, boundary):
+    for first, last in ranges:
+        yield (
+            f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Range: bytes {first}-{last}/{size}\r\n\r\n'
+        ).encode()
+        yield from read_range(path, first, last)
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode()
+
+
+def _multipart_length(ranges, size, content_type, boundary):
+    length = len(f'--{boundary}--\r\n')
+    for first, last in ranges:
+        length += len(
+            f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Range: bytes {first}-{last}/{size}\r\n\r\n'
+        ) + last - first + 1 + 2
+    return length
+
+
+def _accel_response(name, path, content_type):
+    # The front-end server streams the file and handles ranges itself
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_ACCEL == 'nginx':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_file(request, field_file, filename=None):
+    """
+    Response for a stored file with ETag and Last-Modified validators, and
+    single or multipart byte range (206) responses to Range requests.
+    `filename` is offered to the browser (Content-Disposition) in place of
+    the stored name.
+
+    With MEDIA_ACCEL set to 'nginx' (X-Accel-Redirect to MEDIA_ACCEL_PREFIX)
+    or 'sendfile' (X-Sendfile), only the headers are produced here.
+    """
+    path = field_file.path
+    stat = os.stat(path)
+    size = stat.st_size
+    content_type = mimetypes.guess_type(field_file.name)[0] or 'application/octet-stream'
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    if settings.MEDIA_ACCEL:
+        response = _accel_response(field_file.name, path, content_type)
+    else:
+        ranges = None
+        if_range = request.headers.get('If-Range')
+        if not if_range or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+            try:
+                ranges = parse_ranges(request.headers.get('Range'), size)
+            except UnsatisfiableRange:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+
+        if not ranges:
+            response = StreamingHttpResponse(read_range(path, 0, size - 1), content_type=content_type)
+            response['Content-Length'] = size
+        elif len(ranges) == 1:
+            first, last = ranges[0]
+            response = StreamingHttpResponse(read_range(path, first, last), status=206, content_type=content_type)
+            response['Content-Length'] = last - first + 1
+            response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        else:
+            boundary = uuid.uuid4().hex
+            response = StreamingHttpResponse(
+                _multipart(path, ranges, size, content_type, boundary), status=206,
+                content_type=f'multipart/byteranges; boundary={boundary}',
+            )
+            response['Content-Length'] = _multipart_length(ranges, size, content_type, boundary)
+        response['Accept-Ranges'] = 'bytes'
+
+    if filename:
+        response['Content-Disposition'] = content_disposition_header(False, filename)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private'
+    return response
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS core_course_fts USING fts5("
+        "title, description, category, instructor, tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        "INSERT INTO core_course_fts (rowid, title, description, category, instructor) "
+        "SELECT c.id, c.title, c.description, "
+        "COALESCE(cat.name, '') || ' ' || COALESCE(main.name, ''), "
+        "COALESCE(u.username, '') || ' ' || COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, '') "
+        "FROM core_course c "
+        "LEFT JOIN core_coursecategory cat ON cat.id = c.category_id "
+        "LEFT JOIN core_maincategory main ON main.id = cat.parent_category_id "
+        "LEFT JOIN core_customuser u ON u.id = c.instructor_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS core_course_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_alter_quiz_module'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
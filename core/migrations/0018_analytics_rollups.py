@@ -0,0 +1,89 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_rollups(apps, schema_editor):
+    CustomUser = apps.get_model('core', 'CustomUser')
+    Course = apps.get_model('core', 'Course')
+    EnrollmentRequest = apps.get_model('core', 'EnrollmentRequest')
+    QuizAttempt = apps.get_model('core', 'QuizAttempt')
+    RollupCounter = apps.get_model('core', 'RollupCounter')
+    CourseEnrollmentRollup = apps.get_model('core', 'CourseEnrollmentRollup')
+    StudentCourseScoreRollup = apps.get_model('core', 'StudentCourseScoreRollup')
+
+    counters = [
+        RollupCounter(name=f'users:{role}', value=count)
+        for role, count in CustomUser.objects.values_list('role').annotate(count=Count('id')).order_by()
+    ]
+    counters.append(RollupCounter(name='courses', value=Course.objects.count()))
+    RollupCounter.objects.bulk_create(counters)
+
+    CourseEnrollmentRollup.objects.bulk_create(
+        CourseEnrollmentRollup(
+            course_id=course_id, pending=pending, approved=approved, rejected=rejected,
+            progress_sum=progress_sum or 0.0,
+        )
+        for course_id, pending, approved, rejected, progress_sum in EnrollmentRequest.objects.values_list('course_id')
+        .annotate(
+            pending=Count('id', filter=Q(status='pending')),
+            approved=Count('id', filter=Q(status='approved')),
+            rejected=Count('id', filter=Q(status='rejected')),
+            progress_sum=Sum('progress'),
+        )
+        .order_by()
+    )
+
+    StudentCourseScoreRollup.objects.bulk_create(
+        StudentCourseScoreRollup(
+            student_id=student_id, course_id=course_id, score_sum=score_sum, score_count=score_count,
+        )
+        for student_id, course_id, score_sum, score_count in QuizAttempt.objects.exclude(score=None)
+        .values_list('student_id', 'quiz__module__course_id')
+        .annotate(score_sum=Sum('score'), score_count=Count('id'))
+        .order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_course_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseEnrollmentRollup',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='enrollment_rollup', serialize=False, to='core.course')),
+                ('pending', models.IntegerField(default=0)),
+                ('approved', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+                ('progress_sum', models.FloatField(default=0.0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StudentCourseScoreRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score_sum', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('score_count', models.IntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('student', 'course')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:11
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificatetemplate',
+            name='field_layout',
+            field=models.JSONField(blank=True, default=dict, validators=[core.models.validate_field_layout]),
+        ),
+    ]
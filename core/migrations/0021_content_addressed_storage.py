@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:40
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_material_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='certificate',
+            name='certificate_file',
+            field=models.FileField(blank=True, null=True, storage=core.storage.get_content_addressed_storage, upload_to='certificates/'),
+        ),
+        migrations.AlterField(
+            model_name='certificatetemplate',
+            name='template_file',
+            field=models.FileField(storage=core.storage.get_content_addressed_storage, upload_to='certificate_templates/'),
+        ),
+        migrations.AlterField(
+            model_name='modulematerialfile',
+            name='file',
+            field=models.FileField(storage=core.storage.get_content_addressed_storage, upload_to=core.models.upload_to),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modulematerialfile',
+            name='duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='modulematerialfile',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='modulematerialfile',
+            name='preview',
+            field=models.FileField(blank=True, upload_to='previews/'),
+        ),
+        migrations.AddField(
+            model_name='modulematerialfile',
+            name='preview_source',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='modulematerialfile',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
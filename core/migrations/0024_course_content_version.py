@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_admin_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseContentVersion',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content_version', serialize=False, to='core.course')),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:20
+
+import os
+
+from django.db import migrations, models
+
+
+def fill_original_names(apps, schema_editor):
+    ModuleMaterialFile = apps.get_model('core', 'ModuleMaterialFile')
+    MaterialUpload = apps.get_model('core', 'MaterialUpload')
+
+    # Chunked uploads kept the name; files saved before blobs still carry it
+    uploaded = dict(MaterialUpload.objects.exclude(material=None).values_list('material_id', 'filename'))
+    materials = []
+    for material in ModuleMaterialFile.objects.only('id', 'file').iterator():
+        name = uploaded.get(material.id)
+        if name is None and material.file.name and not material.file.name.startswith('blobs/'):
+            name = os.path.basename(material.file.name)
+        if name:
+            material.original_name = name[:255]
+            materials.append(material)
+    ModuleMaterialFile.objects.bulk_update(materials, ['original_name'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_shared_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modulematerialfile',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(fill_original_names, migrations.RunPython.noop),
+    ]
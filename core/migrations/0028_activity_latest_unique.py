@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:40
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def merge_duplicate_latest_rows(apps, schema_editor):
+    # Rows written concurrently before the constraint: keep one per user with the newest timestamp
+    UserActivityLog = apps.get_model('core', 'UserActivityLog')
+    duplicates = (
+        UserActivityLog.objects.filter(activity__in=['login', 'logout'])
+        .values('user_id', 'activity')
+        .annotate(rows=Count('id'), first=Min('id'), latest=Max('timestamp'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for row in duplicates:
+        UserActivityLog.objects.filter(id=row['first']).update(timestamp=row['latest'])
+        UserActivityLog.objects.filter(user_id=row['user_id'], activity=row['activity']).exclude(id=row['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_material_original_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_latest_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='useractivitylog',
+            constraint=models.UniqueConstraint(condition=models.Q(('activity__in', ['login', 'logout'])), fields=('user', 'activity'), name='core_activity_latest_unique'),
+        ),
+    ]
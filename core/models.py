@@ -1,6 +1,14 @@
+import os
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser,Group, Permission
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .storage import get_content_addressed_storage
 
 class CustomUser(AbstractUser):
     ROLE_CHOICES = [
@@ -26,16 +34,36 @@ class CustomUser(AbstractUser):
         help_text='Specific permissions for this user.',
         verbose_name='user permissions',
     )
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Admin lists: users of a role in id order, prefix search
+            models.Index(fields=['role', 'id'], name='core_user_role_id_idx'),
+            models.Index(Lower('username'), name='core_user_username_lower_idx'),
+            models.Index(Lower('email'), name='core_user_email_lower_idx'),
+        ]
     
     def __str__(self):
         return self.username
 
 # User Activity Log
 class UserActivityLog(models.Model):
+    # Kept in a single row per user, whose timestamp is updated, see core.activity
+    LATEST_ACTIVITIES = ('login', 'logout')
+
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     activity = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
-    
+    # Set when the activity happens, not when core.activity writes it
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'activity'], condition=models.Q(activity__in=['login', 'logout']),
+                name='core_activity_latest_unique',
+            ),
+        ]
+
     def __str__(self):
         return f'{self.user.username}'
 
@@ -71,6 +99,11 @@ class Course(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(Lower('title'), name='core_course_title_lower_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -96,11 +129,63 @@ class ModuleMaterialFile(models.Model):
         ('other', 'Other'),
     ]
     module = models.ForeignKey(CourseModule, on_delete=models.CASCADE, related_name='files')
-    file = models.FileField(upload_to=upload_to)
+    file = models.FileField(upload_to=upload_to, storage=get_content_addressed_storage)
+    # Name of the uploaded file, which the stored (content hash) name drops
+    original_name = models.CharField(max_length=255, blank=True)
     file_type = models.CharField(max_length=50, choices=MATERIAL_TYPE_CHOICES, default='other')
+    # Filled in by core.previews once the file is stored
+    size = models.PositiveBigIntegerField(null=True, blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    preview = models.FileField(upload_to='previews/', blank=True)
+    # The file name the fields above describe
+    preview_source = models.CharField(max_length=255, blank=True)
 
     def __str__(self):
         return f'{self.file.name}'
+
+    @property
+    def display_name(self):
+        return self.original_name or os.path.basename(self.file.name)
+
+    @property
+    def duration_display(self):
+        if self.duration is None:
+            return ''
+        minutes, seconds = divmod(int(round(self.duration)), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f'{hours}:{minutes:02}:{seconds:02}' if hours else f'{minutes}:{seconds:02}'
+
+class MaterialUpload(models.Model):
+    # A chunked upload of a ModuleMaterialFile, see core/uploads.py
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('completing', 'Completing'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    module = models.ForeignKey(CourseModule, on_delete=models.CASCADE, related_name='uploads')
+    uploaded_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    filename = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=50, choices=ModuleMaterialFile.MATERIAL_TYPE_CHOICES, default='other')
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    material = models.OneToOneField(ModuleMaterialFile, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.status})'
+
+class MaterialUploadChunk(models.Model):
+    upload = models.ForeignKey(MaterialUpload, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('upload', 'index')
     
 class EnrollmentRequest(models.Model):
     STATUS_CHOICES = [
@@ -131,35 +216,65 @@ class CourseEnrollmentLimit(models.Model):
     def is_full(self):
         return self.current_enrollments >= self.enrollment_limit
 
+    @classmethod
+    def reserve_seat(cls, course_id):
+        # Conditional UPDATE: only succeeds while a seat is free
+        return cls.objects.filter(
+            course_id=course_id, current_enrollments__lt=models.F('enrollment_limit'),
+        ).update(current_enrollments=models.F('current_enrollments') + 1) == 1
+
+    @classmethod
+    def release_seat(cls, course_id):
+        return cls.objects.filter(
+            course_id=course_id, current_enrollments__gt=0,
+        ).update(current_enrollments=models.F('current_enrollments') - 1) == 1
+
     def enroll_student(self):
-        if not self.is_full():
-            self.current_enrollments += 1
-            self.save()
-            return True
-        return False
+        reserved = CourseEnrollmentLimit.reserve_seat(self.course_id)
+        self.refresh_from_db(fields=['current_enrollments'])
+        return reserved
 
     def unenroll_student(self):
-        if self.current_enrollments > 0:
-            self.current_enrollments -= 1
-            self.save()
-            return True
-        return False
+        released = CourseEnrollmentLimit.release_seat(self.course_id)
+        self.refresh_from_db(fields=['current_enrollments'])
+        return released
 
 
 #certificate
+def validate_field_layout(value):
+    from reportlab.pdfbase.pdfmetrics import standardFonts
+
+    from .certificate_pdf import DEFAULT_LAYOUT
+
+    if not isinstance(value, dict) or not set(value) <= set(DEFAULT_LAYOUT):
+        raise ValidationError(f'Expected an object with any of the keys {", ".join(DEFAULT_LAYOUT)}.')
+    for name, position in value.items():
+        if not isinstance(position, dict):
+            raise ValidationError(f'{name}: expected an object.')
+        for axis in ('x', 'y', 'size'):
+            if axis in position and (isinstance(position[axis], bool) or not isinstance(position[axis], (int, float))):
+                raise ValidationError(f'{name}: {axis} must be a number.')
+        if 'font' in position and position['font'] not in standardFonts:
+            raise ValidationError(f'{name}: unknown font {position["font"]!r}.')
+        if position.get('align', 'center') not in ('left', 'center', 'right'):
+            raise ValidationError(f'{name}: align must be left, center or right.')
+
+
 class CertificateTemplate(models.Model):
-    template_file = models.FileField(upload_to='certificate_templates/')
+    template_file = models.FileField(upload_to='certificate_templates/', storage=get_content_addressed_storage)
     course = models.OneToOneField(Course, on_delete=models.CASCADE, related_name='template')
     min_avg_score = models.FloatField(default=35.0) 
+    # Field positions on the template, see certificate_pdf.DEFAULT_LAYOUT
+    field_layout = models.JSONField(default=dict, blank=True, validators=[validate_field_layout])
 
     def __str__(self):
-        return self.min_avg_score
+        return f'{self.course.title} - {self.min_avg_score}'
 
 class Certificate(models.Model):
     student = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     certificate_template = models.ForeignKey(CertificateTemplate, on_delete=models.SET_NULL, null=True, blank=True)
     issued_date = models.DateField(auto_now_add=True)
-    certificate_file = models.FileField(upload_to='certificates/', null=True, blank=True)
+    certificate_file = models.FileField(upload_to='certificates/', storage=get_content_addressed_storage, null=True, blank=True)
 
     def __str__(self):
         return f'{self.student.username} - {self.certificate_template.course.title}'
@@ -217,4 +332,76 @@ class Answer(models.Model):
     selected_option = models.ForeignKey(Option, on_delete=models.CASCADE)
 
     def __str__(self):
-        return f"{self.attempt} - {self.question}"
\ No newline at end of file
+        return f"{self.attempt} - {self.question}"
+
+# Analytics rollups, maintained incrementally by core.rollups and rebuilt
+# by the reconcile_rollups command
+class RollupCounter(models.Model):
+    # e.g. 'users:student' or 'courses'
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
+class CourseEnrollmentRollup(models.Model):
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='enrollment_rollup')
+    pending = models.IntegerField(default=0)
+    approved = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    progress_sum = models.FloatField(default=0.0)
+
+    @property
+    def total(self):
+        return self.pending + self.approved + self.rejected
+
+    @property
+    def avg_progress(self):
+        return self.progress_sum / self.total if self.total else None
+
+    def __str__(self):
+        return f'{self.course_id}: {self.approved} approved, {self.pending} pending, {self.rejected} rejected'
+
+class StudentCourseScoreRollup(models.Model):
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    # Attempts without a score are left out, like Avg('score')
+    score_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    score_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('student', 'course')
+
+    @property
+    def avg_score(self):
+        return self.score_sum / self.score_count if self.score_count else None
+
+    def __str__(self):
+        return f'{self.student_id} - {self.course_id}: {self.score_count} scores'
+
+class CourseContentVersion(models.Model):
+    # Bumped by core.content whenever a module, material, quiz, question or option of the course changes
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='content_version')
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.course_id}: version {self.version}'
+
+class StoredBlob(models.Model):
+    # A file kept once by core.storage.ContentAddressedStorage, and how many file fields use it
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
+
+# File fields stored with core.storage.ContentAddressedStorage
+CONTENT_ADDRESSED_FIELDS = {
+    ModuleMaterialFile: 'file',
+    CertificateTemplate: 'template_file',
+    Certificate: 'certificate_file',
+}
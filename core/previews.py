@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
+
+from .catalog import OUTLINES, invalidate_catalog
+from .content import bump_course_content
+from .models import ModuleMaterialFile
+from .roster import course_id_for_module
+from .storage import RECENT_BLOB_AGE, is_blob_name
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DIR = 'previews'
+PREVIEW_WIDTH = 320
+
+_start_lock = threading.Lock()
+
+
+def preview_name(material):
+    """
+    Name of a material's thumbnail. Blob names already are content hashes,
+    so identical materials share one thumbnail.
+    """
+    stem = os.path.splitext(os.path.basename(material.file.name))[0]
+    if not is_blob_name(material.file.name):
+        stem = hashlib.sha256(material.file.name.encode()).hexdigest()
+    return f'{PREVIEW_DIR}/{stem}.jpg'
+
+
+def _tool(setting):
+    return shutil.which(getattr(settings, setting))
+
+
+def _run(args):
+    try:
+        return subprocess.run(
+            args, capture_output=True, timeout=settings.PREVIEW_TIMEOUT, check=True, text=True,
+        ).stdout
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning('Preview command %s failed: %s', args[0], e)
+        return None
+
+
+def pdf_metadata(path, directory):
+    """(page count, thumbnail path or None) of a PDF."""
+    try:
+        page_count = len(PdfReader(path).pages)
+    except (OSError, PyPdfError) as e:
+        logger.warning('Could not read %s: %s', path, e)
+        page_count = None
+    thumbnail = None
+    pdftoppm = _tool('PREVIEW_PDFTOPPM')
+    if pdftoppm:
+        prefix = os.path.join(directory, 'page')
+        if _run([pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-jpeg', '-scale-to', str(PREVIEW_WIDTH), path, prefix]) is not None:
+            thumbnail = prefix + '.jpg'
+    return page_count, thumbnail
+
+
+def video_metadata(path, directory):
+    """(duration in seconds or None, thumbnail path or None) of a video."""
+    duration = None
+    ffprobe = _tool('PREVIEW_FFPROBE')
+    if ffprobe:
+        output = _run([ffprobe, '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path])
+        try:
+            duration = float(output)
+        except (TypeError, ValueError):
+            pass
+    thumbnail = None
+    ffmpeg = _tool('PREVIEW_FFMPEG')
+    if ffmpeg:
+        frame = os.path.join(directory, 'frame.jpg')
+        # A frame a little into the video, past fade-ins
+        seek = str(min(duration / 2, 1.0) if duration else 0)
+        if _run([
+            ffmpeg, '-v', 'error', '-ss', seek, '-i', path, '-frames:v', '1',
+            '-vf', f'scale={PREVIEW_WIDTH}:-2', '-y', frame,
+        ]) is not None:
+            thumbnail = frame
+    return duration, thumbnail
+
+
+def generate_preview(material):
+    """
+    Record the size, page count or duration and a first page or frame
+    thumbnail of a material. Thumbnails need pdftoppm (poppler) and ffmpeg;
+    without them only the metadata is stored.
+
+    The row is updated with a queryset update that only matches while it
+    still holds the same file, so a replaced file is never described by an
+    older preview.
+    """
+    name = material.file.name
+    path = material.file.path
+    fields = {'size': material.file.size, 'page_count': None, 'duration': None, 'preview': ''}
+    with tempfile.TemporaryDirectory() as directory:
+        thumbnail = None
+        if material.file_type == 'pdf':
+            fields['page_count'], thumbnail = pdf_metadata(path, directory)
+        elif material.file_type == 'video':
+            fields['duration'], thumbnail = video_metadata(path, directory)
+        if thumbnail and os.path.exists(thumbnail):
+            fields['preview'] = preview_name(material)
+            if not default_storage.exists(fields['preview']):
+                with open(thumbnail, 'rb') as f:
+                    fields['preview'] = default_storage.save(fields['preview'], File(f))
+    if ModuleMaterialFile.objects.filter(pk=material.pk, file=name).update(preview_source=name, **fields):
+        # Queryset updates send no signal; the outlines and course pages show the metadata
+        invalidate_catalog(OUTLINES)
+        bump_course_content(course_id_for_module(material.module_id))
+    for field, value in fields.items():
+        setattr(material, field, value)
+    material.preview_source = name
+    return fields
+
+
+class PreviewQueue:
+    """
+    Materials waiting for a preview, generated one at a time by a
+    background thread so that no request waits on pdftoppm or ffmpeg.
+    Failures are only logged. Materials still queued when the process
+    exits are left to the generate_previews command, which finds every
+    material without a preview of its current file.
+    """
+
+    def __init__(self):
+        self.pid = None
+
+    def _start(self):
+        # Once per process: forked workers get their own queue and thread
+        self.pid = os.getpid()
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, name='material-previews', daemon=True).start()
+
+    def _run(self):
+        while True:
+            material_id = self.queue.get()
+            try:
+                material = materials_without_preview().filter(pk=material_id).first()
+                if material is not None:
+                    generate_preview(material)
+            except Exception:
+                logger.exception('Could not preview material %s', material_id)
+            finally:
+                # Connections are per thread; do not keep this one open while idle
+                connection.close()
+
+    def put(self, material_id):
+        if self.pid != os.getpid():
+            with _start_lock:
+                if self.pid != os.getpid():
+                    self._start()
+        self.queue.put(material_id)
+
+
+preview_queue = PreviewQueue()
+
+
+def preview_on_commit(material):
+    """Queue a material for a preview once the saving transaction commits (see PREVIEW_IN_BACKGROUND)."""
+    if settings.PREVIEW_IN_BACKGROUND:
+        material_id = material.pk
+        transaction.on_commit(lambda: preview_queue.put(material_id))
+
+
+def materials_without_preview():
+    """Materials whose current file has no preview yet."""
+    return ModuleMaterialFile.objects.exclude(file='').exclude(preview_source=F('file'))
+
+
+def prune_previews():
+    """
+    Delete thumbnails no material refers to any more, left by deleted or
+    replaced files (identical materials share one, so it cannot go with
+    each of them). Recent ones are kept, as for blobs: a preview being
+    generated is saved before its row. Returns the bytes freed.
+    """
+    if not default_storage.exists(PREVIEW_DIR):
+        return 0
+    referenced = set(ModuleMaterialFile.objects.exclude(preview='').values_list('preview', flat=True))
+    freed = 0
+    for filename in default_storage.listdir(PREVIEW_DIR)[1]:
+        name = f'{PREVIEW_DIR}/{filename}'
+        if name in referenced:
+            continue
+        if time.time() - default_storage.get_modified_time(name).timestamp() < RECENT_BLOB_AGE:
+            continue
+        freed += default_storage.size(name)
+        default_storage.delete(name)
+    return freed
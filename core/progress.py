@@ -0,0 +1,93 @@
+from collections import namedtuple
+
+from django.db.models import Count, Prefetch
+
+from .models import Course, Option, Question, Quiz, QuizAttempt
+
+# Per-course progress of one student: quiz totals plus completion percentage.
+CourseProgress = namedtuple('CourseProgress', ['course', 'total_quizzes', 'completed_quizzes', 'progress'])
+
+
+def _percent(completed, total):
+    return (completed / total) * 100 if total > 0 else 0
+
+
+def student_course_progress(student, courses):
+    """
+    Progress of `student` in each of `courses`, keyed by course id.
+
+    Uses one grouped query for the quiz totals and one for the attempts,
+    whatever the number of courses.
+    """
+    courses = list(courses)
+    course_ids = [course.id for course in courses]
+
+    totals = dict(
+        Quiz.objects.filter(module__course_id__in=course_ids)
+        .values_list('module__course_id')
+        .annotate(count=Count('id'))
+    )
+    completed = dict(
+        QuizAttempt.objects.filter(student=student, quiz__module__course_id__in=course_ids)
+        .values_list('quiz__module__course_id')
+        .annotate(count=Count('id'))
+    )
+
+    progress = {}
+    for course in courses:
+        total_quizzes = totals.get(course.id, 0)
+        completed_quizzes = completed.get(course.id, 0)
+        progress[course.id] = CourseProgress(
+            course=course,
+            total_quizzes=total_quizzes,
+            completed_quizzes=completed_quizzes,
+            progress=_percent(completed_quizzes, total_quizzes),
+        )
+    return progress
+
+
+def enrolled_course_progress(student):
+    """Progress rows for every course the student is approved in."""
+    courses = Course.objects.filter(
+        enrollment_requests__student=student,
+        enrollment_requests__status='approved',
+    ).select_related('category').distinct()
+    return list(student_course_progress(student, courses).values())
+
+
+def quizzes_with_questions(modules, student):
+    """
+    Quizzes of each module with their questions, options and the student's attempt.
+
+    The result keeps the shape the course detail template expects:
+    ``[{'module': module, 'quizzes': [{'quiz', 'questions', 'attempt'}]}]``.
+    """
+    modules = list(modules)
+    quizzes = (
+        Quiz.objects.filter(module__in=modules)
+        .order_by('id')
+        .prefetch_related(
+            Prefetch('questions', queryset=Question.objects.order_by('id').prefetch_related(
+                Prefetch('options', queryset=Option.objects.order_by('id'))
+            ))
+        )
+    )
+    attempts = {}
+    if student.is_authenticated:
+        attempts = {
+            attempt.quiz_id: attempt
+            for attempt in QuizAttempt.objects.filter(student=student, quiz__module__in=modules)
+        }
+
+    quizzes_by_module = {}
+    for quiz in quizzes:
+        quizzes_by_module.setdefault(quiz.module_id, []).append({
+            'quiz': quiz,
+            'questions': quiz.questions.all(),
+            'attempt': attempts.get(quiz.id),
+        })
+
+    return [
+        {'module': module, 'quizzes': quizzes_by_module.get(module.id, [])}
+        for module in modules
+    ]
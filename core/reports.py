@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+
+def data_version(*sources):
+    """
+    Fingerprint of the rows a report is built from.
+
+    Each source is a queryset, optionally followed by extra aggregates as
+    ``(queryset, {'name': Aggregate(...)})``. Row count and highest id are
+    always included, so inserts and deletes change the version; the extra
+    aggregates pick up updates (``Max('updated_at')``, ``Sum('score')``...).
+    A string source, such as a field_digest(), is included as it is.
+    """
+    parts = []
+    for source in sources:
+        if isinstance(source, str):
+            parts.append(source)
+            continue
+        queryset, aggregates = source if isinstance(source, tuple) else (source, {})
+        values = queryset.order_by().aggregate(_count=Count('pk'), _max_pk=Max('pk'), **aggregates)
+        parts.append([queryset.model._meta.label, sorted(values.items())])
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def field_digest(queryset, *fields):
+    """SHA-256 of `fields` over every row, for text no aggregate can track (the names a report prints)."""
+    digest = hashlib.sha256()
+    for row in queryset.order_by('pk').values_list(*fields).iterator():
+        digest.update(json.dumps(row, default=str).encode())
+    return digest.hexdigest()
+
+
+class ReportArtifactStore:
+    """
+    Built report files on disk, keyed by report type, parameters and data version.
+
+    Identical concurrent requests are coalesced: threads of one process share
+    a lock, and processes wait on a lock file while one of them builds.
+    Artifacts older than `max_age` seconds, and the oldest ones once the
+    directory grows past `max_bytes`, are evicted after every build.
+    """
+    lock_timeout = 120
+    poll_interval = 0.1
+    lock_stripes = 64
+
+    def __init__(self, directory, max_bytes, max_age):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._locks = [threading.Lock() for _ in range(self.lock_stripes)]
+
+    def artifact_path(self, report_type, params, version):
+        key = json.dumps([report_type, params, version], sort_keys=True, default=str)
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, f'{report_type}-{digest}.pdf')
+
+    def get_or_build(self, report_type, params, version, build):
+        """Return the stored bytes for this key, calling `build()` only on a miss."""
+        path = self.artifact_path(report_type, params, version)
+        data = self._read(path)
+        if data is not None:
+            return data
+
+        with self._thread_lock(path):
+            data = self._read(path)
+            if data is not None:
+                return data
+            return self._build_with_file_lock(path, build)
+
+    def evict(self):
+        now = time.time()
+        artifacts = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or not entry.name.endswith('.pdf'):
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > self.max_age:
+                self._remove(entry.path)
+            else:
+                artifacts.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in artifacts)
+        for _, size, path in sorted(artifacts):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _build_with_file_lock(self, path, build):
+        lock_path = path + '.lock'
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # Another process is building the same artifact.
+                data = self._wait_for(path, lock_path)
+                if data is not None:
+                    return data
+                continue
+
+            try:
+                os.close(fd)
+                data = build()
+                tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            finally:
+                self._remove(lock_path)
+            self.evict()
+            return data
+
+    def _wait_for(self, path, lock_path):
+        while os.path.exists(lock_path):
+            try:
+                if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                    self._remove(lock_path)
+                    return None
+            except FileNotFoundError:
+                break
+            time.sleep(self.poll_interval)
+        return self._read(path)
+
+    def _thread_lock(self, path):
+        return self._locks[hash(path) % self.lock_stripes]
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Touch on read so size eviction drops the least recently used first.
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+report_store = ReportArtifactStore(
+    directory=getattr(settings, 'REPORT_CACHE_DIR', os.path.join(settings.BASE_DIR, 'report_cache')),
+    max_bytes=getattr(settings, 'REPORT_CACHE_MAX_BYTES', 200 * 1024 * 1024),
+    max_age=getattr(settings, 'REPORT_CACHE_MAX_AGE', 7 * 24 * 60 * 60),
+)
+
+
+def cached_report(report_type, params, version, build):
+    return report_store.get_or_build(report_type, params, version, build)
@@ -0,0 +1,220 @@
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import (
+    Course, CourseEnrollmentRollup, CustomUser, EnrollmentRequest, QuizAttempt, RollupCounter,
+    StudentCourseScoreRollup,
+)
+
+STATUSES = ('pending', 'approved', 'rejected')
+
+COURSES_COUNTER = 'courses'
+CENTS = Decimal('0.01')
+
+Drift = namedtuple('Drift', ['table', 'key', 'stored', 'expected'])
+
+
+def role_counter(role):
+    return f'users:{role}'
+
+
+def _adjust(model, key, create=True, **deltas):
+    """
+    Add `deltas` to the row identified by `key`, creating it when missing.
+
+    Deletes pass create=False: during a cascade the rollup row may already
+    be gone together with its course or student.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**key).update(**updates) or not create:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # Created concurrently, add to it instead
+        model.objects.filter(**key).update(**updates)
+
+
+def adjust_counter(name, delta):
+    _adjust(RollupCounter, {'name': name}, create=delta > 0, value=delta)
+
+
+def adjust_enrollments(course_id, status, count, progress=0.0):
+    """
+    Add (or with a negative count remove) requests in `status` and their
+    total progress. Other statuses ('removed') are not counted, so their
+    progress stays out of the sum too.
+    """
+    if course_id is None or status not in STATUSES:
+        return
+    deltas = {status: count, 'progress_sum': (progress or 0.0) if count > 0 else -(progress or 0.0)}
+    _adjust(CourseEnrollmentRollup, {'course_id': course_id}, create=count > 0, **deltas)
+
+
+def move_enrollments(course_id, from_status, to_status, count=1):
+    """Move `count` requests of a course between statuses, for queryset updates that skip signals."""
+    if count:
+        _adjust(CourseEnrollmentRollup, {'course_id': course_id}, **{from_status: -count, to_status: count})
+
+
+def adjust_scores(student_id, course_id, score, sign):
+    if course_id is None or score is None:
+        return
+    _adjust(
+        StudentCourseScoreRollup, {'student_id': student_id, 'course_id': course_id}, create=sign > 0,
+        score_sum=sign * Decimal(str(score)).quantize(CENTS), score_count=sign,
+    )
+
+
+# Signals only see the new values, so instances remember the stored ones
+# (read from __dict__, so deferred fields are never loaded for this).
+ROLLUP_FIELDS = {
+    CustomUser: ('role',),
+    EnrollmentRequest: ('course_id', 'status', 'progress'),
+    QuizAttempt: ('student_id', 'quiz_id', 'score'),
+}
+
+
+def remember_state(instance):
+    instance._rollup_state = tuple(instance.__dict__.get(field) for field in ROLLUP_FIELDS[type(instance)])
+
+
+def stored_state(instance):
+    return getattr(instance, '_rollup_state', None)
+
+
+def rollup_counters():
+    """{counter name: value} of every RollupCounter, in one query."""
+    return dict(RollupCounter.objects.values_list('name', 'value'))
+
+
+# Rebuilding from scratch
+
+def expected_counters():
+    counters = {
+        role_counter(role): count
+        for role, count in CustomUser.objects.values_list('role').annotate(count=Count('id')).order_by()
+    }
+    counters[COURSES_COUNTER] = Course.objects.count()
+    return counters
+
+
+def expected_enrollments():
+    rows = (
+        EnrollmentRequest.objects.values_list('course_id')
+        .annotate(
+            pending=Count('id', filter=Q(status='pending')),
+            approved=Count('id', filter=Q(status='approved')),
+            rejected=Count('id', filter=Q(status='rejected')),
+            progress_sum=Sum('progress', filter=Q(status__in=STATUSES)),
+        )
+        .order_by()
+    )
+    return {
+        course_id: (pending, approved, rejected, progress_sum or 0.0)
+        for course_id, pending, approved, rejected, progress_sum in rows
+    }
+
+
+def expected_scores():
+    rows = (
+        QuizAttempt.objects.exclude(score=None)
+        .values_list('student_id', 'quiz__module__course_id')
+        .annotate(score_sum=Sum('score'), score_count=Count('id'))
+        .order_by()
+    )
+    return {
+        (student_id, course_id): (score_sum, score_count)
+        for student_id, course_id, score_sum, score_count in rows
+    }
+
+
+def _drift(table, stored, expected, empty, same=lambda a, b: a == b):
+    drift = []
+    for key in stored.keys() | expected.keys():
+        a, b = stored.get(key, empty), expected.get(key, empty)
+        if not same(a, b):
+            drift.append(Drift(table, key, a, b))
+    return drift
+
+
+def _same_enrollments(a, b):
+    return a[:3] == b[:3] and abs(a[3] - b[3]) < 1e-6
+
+
+def _same_scores(a, b):
+    # Scores are summed at two decimals here, unrounded by some databases
+    return a[1] == b[1] and abs(Decimal(str(a[0])) - Decimal(str(b[0]))) <= CENTS * max(a[1], 1)
+
+
+def reconcile_rollups(fix=True):
+    """
+    Recompute every rollup from the source tables and compare with what is stored.
+
+    Returns the list of Drift entries found. With `fix`, the rollup tables are
+    rewritten from the recomputed values in the same transaction.
+    """
+    with transaction.atomic():
+        counters = expected_counters()
+        enrollments = expected_enrollments()
+        scores = expected_scores()
+
+        drift = _drift(
+            RollupCounter._meta.db_table,
+            dict(RollupCounter.objects.values_list('name', 'value')),
+            counters, 0,
+        )
+        drift += _drift(
+            CourseEnrollmentRollup._meta.db_table,
+            {
+                course_id: rest
+                for course_id, *rest in CourseEnrollmentRollup.objects.values_list(
+                    'course_id', 'pending', 'approved', 'rejected', 'progress_sum',
+                )
+            },
+            {course_id: list(values) for course_id, values in enrollments.items()},
+            [0, 0, 0, 0.0], _same_enrollments,
+        )
+        drift += _drift(
+            StudentCourseScoreRollup._meta.db_table,
+            {
+                (student_id, course_id): (score_sum, score_count)
+                for student_id, course_id, score_sum, score_count in StudentCourseScoreRollup.objects.values_list(
+                    'student_id', 'course_id', 'score_sum', 'score_count',
+                )
+            },
+            scores, (0, 0), _same_scores,
+        )
+
+        if fix and drift:
+            RollupCounter.objects.all().delete()
+            RollupCounter.objects.bulk_create(RollupCounter(name=name, value=value) for name, value in counters.items())
+            CourseEnrollmentRollup.objects.all().delete()
+            CourseEnrollmentRollup.objects.bulk_create(
+                (
+                    CourseEnrollmentRollup(
+                        course_id=course_id, pending=pending, approved=approved, rejected=rejected,
+                        progress_sum=progress_sum,
+                    )
+                    for course_id, (pending, approved, rejected, progress_sum) in enrollments.items()
+                ),
+                batch_size=1000,
+            )
+            StudentCourseScoreRollup.objects.all().delete()
+            StudentCourseScoreRollup.objects.bulk_create(
+                (
+                    StudentCourseScoreRollup(
+                        student_id=student_id, course_id=course_id, score_sum=score_sum, score_count=score_count,
+                    )
+                    for (student_id, course_id), (score_sum, score_count) in scores.items()
+                ),
+                batch_size=1000,
+            )
+    return drift
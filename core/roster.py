@@ -0,0 +1,89 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .models import CourseModule, EnrollmentRequest, Quiz, QuizAttempt
+
+ROSTER_CACHE_TIMEOUT = 60 * 60
+
+# One approved student of a course. `scores` maps quiz id to the attempt score.
+RosterRow = namedtuple('RosterRow', [
+    'student', 'request_date', 'response_date', 'completed_quizzes',
+    'total_quizzes', 'progress', 'average_score', 'scores',
+])
+Roster = namedtuple('Roster', ['course_id', 'quiz_ids', 'rows'])
+
+
+def roster_cache_key(course_id):
+    return f'core:roster:{course_id}'
+
+
+def build_course_roster(course):
+    """
+    Student x quiz completion and score matrix for every approved student.
+
+    Costs three queries (quizzes, enrollments, attempts) for any roster size.
+    """
+    quiz_ids = list(
+        Quiz.objects.filter(module__course=course)
+        .order_by('module__order', 'id')
+        .values_list('id', flat=True)
+    )
+    total_quizzes = len(quiz_ids)
+
+    enrollments = (
+        EnrollmentRequest.objects.filter(course=course, status='approved')
+        .select_related('student')
+        .only('request_date', 'response_date', 'student__username', 'student__email')
+        .order_by('id')
+    )
+
+    scores = {}
+    attempts = QuizAttempt.objects.filter(quiz_id__in=quiz_ids).values_list('student_id', 'quiz_id', 'score')
+    for student_id, quiz_id, score in attempts.iterator():
+        scores.setdefault(student_id, {})[quiz_id] = score
+
+    rows = []
+    for enrollment in enrollments:
+        student_scores = scores.get(enrollment.student_id, {})
+        completed_quizzes = len(student_scores)
+        total_score = sum(score for score in student_scores.values() if score is not None)
+        rows.append(RosterRow(
+            student=enrollment.student,
+            request_date=enrollment.request_date,
+            response_date=enrollment.response_date,
+            completed_quizzes=completed_quizzes,
+            total_quizzes=total_quizzes,
+            progress=(completed_quizzes / total_quizzes) * 100 if total_quizzes > 0 else 0,
+            average_score=(total_score / total_quizzes) if total_quizzes > 0 else 0,
+            scores=student_scores,
+        ))
+
+    return Roster(course_id=course.id, quiz_ids=quiz_ids, rows=rows)
+
+
+def course_roster(course):
+    """Cached `build_course_roster`, dropped by `invalidate_course_roster`."""
+    key = roster_cache_key(course.id)
+    roster = cache.get(key)
+    if roster is None:
+        roster = build_course_roster(course)
+        cache.set(key, roster, ROSTER_CACHE_TIMEOUT)
+    return roster
+
+
+def invalidate_course_roster(course_id):
+    if course_id is not None:
+        cache.delete(roster_cache_key(course_id))
+
+
+def course_id_for_module(module_id):
+    return CourseModule.objects.filter(id=module_id).values_list('course_id', flat=True).first()
+
+
+def course_id_for_quiz(quiz_id):
+    return CourseModule.objects.filter(quizzes__id=quiz_id).values_list('course_id', flat=True).first()
+
+
+def course_id_for_question(question_id):
+    return CourseModule.objects.filter(quizzes__questions__id=question_id).values_list('course_id', flat=True).first()
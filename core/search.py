@@ -0,0 +1,130 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Course, CourseCategory, CustomUser, MainCategory
+
+
+def search_terms(text):
+    return re.findall(r'\w+', text or '')
+
+
+class IContainsSearchBackend:
+    """Unindexed fallback: every term must appear in one of the searched fields."""
+
+    def search(self, queryset, text):
+        terms = search_terms(text)
+        if not terms:
+            return queryset.none()
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term)
+                | Q(description__icontains=term)
+                | Q(category__name__icontains=term)
+                | Q(category__parent_category__name__icontains=term)
+                | Q(instructor__username__icontains=term)
+                | Q(instructor__first_name__icontains=term)
+                | Q(instructor__last_name__icontains=term)
+            )
+        return queryset.order_by('title', 'id')
+
+    def index_courses(self, course_ids):
+        pass
+
+    def remove_courses(self, course_ids):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class SQLiteFTS5SearchBackend:
+    """
+    Ranked search over an FTS5 table whose rowid is the course id.
+
+    The table is created by migration 0017 and indexes the course title,
+    description, category and parent category names and instructor names.
+    """
+    table = 'core_course_fts'
+    # bm25 column weights: title, description, category, instructor
+    weights = (10.0, 1.0, 4.0, 2.0)
+
+    def search(self, queryset, text):
+        terms = search_terms(text)
+        if not terms:
+            return queryset.none()
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return queryset.extra(
+            tables=[self.table],
+            where=[f'{self.table}.rowid = {Course._meta.db_table}.id', f'{self.table} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'bm25({self.table}, {weights})'},
+            order_by=['search_rank', 'id'],
+        )
+
+    def _document_sql(self, where=''):
+        return f'''
+            SELECT c.id, c.title, c.description,
+                   COALESCE(cat.name, '') || ' ' || COALESCE(main.name, ''),
+                   COALESCE(u.username, '') || ' ' || COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, '')
+            FROM {Course._meta.db_table} c
+            LEFT JOIN {CourseCategory._meta.db_table} cat ON cat.id = c.category_id
+            LEFT JOIN {MainCategory._meta.db_table} main ON main.id = cat.parent_category_id
+            LEFT JOIN {CustomUser._meta.db_table} u ON u.id = c.instructor_id
+            {where}
+        '''
+
+    def index_courses(self, course_ids):
+        course_ids = list(course_ids)
+        if not course_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(course_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', course_ids)
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, description, category, instructor) '
+                + self._document_sql(f'WHERE c.id IN ({placeholders})'),
+                course_ids,
+            )
+
+    def remove_courses(self, course_ids):
+        course_ids = list(course_ids)
+        if not course_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(course_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', course_ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, description, category, instructor) '
+                + self._document_sql()
+            )
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+            cursor.execute(f'SELECT COUNT(*) FROM {self.table}')
+            return cursor.fetchone()[0]
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """
+    Backend named by the COURSE_SEARCH_BACKEND setting, else FTS5 on SQLite
+    when its table exists, else the icontains fallback.
+    """
+    backend_path = getattr(settings, 'COURSE_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    if connection.vendor == 'sqlite' and SQLiteFTS5SearchBackend.table in connection.introspection.table_names():
+        return SQLiteFTS5SearchBackend()
+    return IContainsSearchBackend()
+
+
+def search_courses(queryset, text):
+    return get_search_backend().search(queryset, text)
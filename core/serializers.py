@@ -0,0 +1,87 @@
+from rest_framework import serializers
+
+from .models import Course, CourseCategory, CourseModule, CustomUser, MainCategory, ModuleMaterialFile
+
+
+class SparseFieldsMixin:
+    """
+    Serializer taking a `fields` argument: the names of the fields to
+    output, all of them when empty. Unknown names are ignored.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SubcategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CourseCategory
+        fields = ['id', 'name']
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    # Subcategories are prefetched and course_count annotated by the view
+    subcategories = SubcategorySerializer(many=True, read_only=True)
+    course_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = MainCategory
+        fields = ['id', 'name', 'course_count', 'subcategories']
+
+
+class CourseCategorySerializer(serializers.ModelSerializer):
+    parent = serializers.SlugRelatedField(source='parent_category', slug_field='name', read_only=True)
+
+    class Meta:
+        model = CourseCategory
+        fields = ['id', 'name', 'parent']
+
+
+class InstructorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CustomUser
+        fields = ['id', 'first_name', 'last_name']
+
+
+class CourseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    category = CourseCategorySerializer(read_only=True)
+    instructor = InstructorSerializer(read_only=True)
+    module_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Course
+        fields = [
+            'id', 'title', 'description', 'difficulty_level', 'category', 'instructor',
+            'module_count', 'created_at', 'updated_at',
+        ]
+
+
+class MaterialSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ModuleMaterialFile
+        fields = ['id', 'file_type', 'size', 'page_count', 'duration']
+
+
+class ModuleSerializer(serializers.ModelSerializer):
+    materials = MaterialSerializer(source='files', many=True, read_only=True)
+
+    class Meta:
+        model = CourseModule
+        fields = ['id', 'title', 'description', 'order', 'materials']
+
+
+class PrerequisiteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Course
+        fields = ['id', 'title']
+
+
+class CourseOutlineSerializer(CourseSerializer):
+    prerequisites = PrerequisiteSerializer(many=True, read_only=True)
+    modules = ModuleSerializer(many=True, read_only=True)
+
+    class Meta(CourseSerializer.Meta):
+        fields = CourseSerializer.Meta.fields + ['prerequisites', 'modules']
@@ -0,0 +1,306 @@
+import os
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .catalog import CARDS, COUNTS, OUTLINES, TREE, invalidate_catalog
+from .content import bump_course_content
+from .grading import invalidate_answer_key
+from .models import (
+    CONTENT_ADDRESSED_FIELDS, Certificate, CertificateTemplate, Course, CourseCategory, CourseModule, CustomUser,
+    EnrollmentRequest, MainCategory, ModuleMaterialFile, Option, Question, Quiz, QuizAttempt,
+)
+from .previews import preview_on_commit
+from .rollups import (
+    COURSES_COUNTER, adjust_counter, adjust_enrollments, adjust_scores, remember_state, role_counter, stored_state,
+)
+from .roster import course_id_for_module, course_id_for_question, course_id_for_quiz, invalidate_course_roster
+from .search import get_search_backend
+
+
+# Roster analytics cache
+@receiver([post_save, post_delete], sender=EnrollmentRequest)
+def enrollment_changed(sender, instance, **kwargs):
+    invalidate_course_roster(instance.course_id)
+
+
+@receiver([post_save, post_delete], sender=QuizAttempt)
+def quiz_attempt_changed(sender, instance, **kwargs):
+    invalidate_course_roster(course_id_for_quiz(instance.quiz_id))
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+def quiz_changed(sender, instance, **kwargs):
+    invalidate_course_roster(course_id_for_module(instance.module_id))
+
+
+# Course search index
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, **kwargs):
+    get_search_backend().index_courses([instance.id])
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    get_search_backend().remove_courses([instance.id])
+
+
+@receiver(post_save, sender=CourseCategory)
+def course_category_saved(sender, instance, **kwargs):
+    get_search_backend().index_courses(instance.course.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=MainCategory)
+def main_category_saved(sender, instance, **kwargs):
+    courses = Course.objects.filter(category__parent_category=instance)
+    get_search_backend().index_courses(courses.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+def instructor_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or instance.role != 'instructor':
+        return
+    # Logins only touch last_login
+    if update_fields is not None and not {'username', 'first_name', 'last_name'} & set(update_fields):
+        return
+    get_search_backend().index_courses(instance.course_set.values_list('id', flat=True))
+
+
+# Deleting a category or instructor nulls the course foreign keys with a
+# queryset update, so remember the affected courses before it happens.
+@receiver(pre_delete, sender=CourseCategory)
+@receiver(pre_delete, sender=MainCategory)
+@receiver(pre_delete, sender=CustomUser)
+def remember_indexed_courses(sender, instance, **kwargs):
+    if sender is CourseCategory:
+        courses = instance.course.all()
+    elif sender is MainCategory:
+        courses = Course.objects.filter(category__parent_category=instance)
+    else:
+        courses = instance.course_set.all()
+    instance._search_course_ids = list(courses.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=CourseCategory)
+@receiver(post_delete, sender=MainCategory)
+@receiver(post_delete, sender=CustomUser)
+def reindex_remembered_courses(sender, instance, **kwargs):
+    get_search_backend().index_courses(getattr(instance, '_search_course_ids', []))
+
+
+# Cached quiz answer keys. Invalidate after commit, so a concurrent grader
+# cannot cache the old rows under the new version. Callbacks after commit
+# are robust throughout: the change is saved, so a cache failure is logged
+# rather than turned into an error response or skipping later callbacks.
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    quiz_id = instance.quiz_id
+    transaction.on_commit(lambda: invalidate_answer_key(quiz_id), robust=True)
+
+
+@receiver([post_save, post_delete], sender=Option)
+def option_changed(sender, instance, **kwargs):
+    quiz_id = Question.objects.filter(id=instance.question_id).values_list('quiz_id', flat=True).first()
+    transaction.on_commit(lambda: invalidate_answer_key(quiz_id), robust=True)
+
+
+# Cached catalog (landing page and course browsing), see core.catalog.
+# Each sender only bumps the parts it can change, after commit.
+def invalidate_catalog_on_commit(*parts):
+    transaction.on_commit(lambda: invalidate_catalog(*parts), robust=True)
+
+
+@receiver([post_save, post_delete], sender=Course)
+def catalog_course_changed(sender, instance, **kwargs):
+    invalidate_catalog_on_commit(COUNTS, CARDS, OUTLINES)
+
+
+@receiver([post_save, post_delete], sender=CourseCategory)
+def catalog_course_category_changed(sender, instance, **kwargs):
+    invalidate_catalog_on_commit(TREE, COUNTS, CARDS, OUTLINES)
+
+
+@receiver([post_save, post_delete], sender=MainCategory)
+def catalog_main_category_changed(sender, instance, **kwargs):
+    invalidate_catalog_on_commit(TREE, COUNTS, OUTLINES)
+
+
+@receiver([post_save, post_delete], sender=CourseModule)
+def catalog_module_changed(sender, instance, created=False, **kwargs):
+    # Cards only show the module count
+    if created or kwargs['signal'] is post_delete:
+        invalidate_catalog_on_commit(CARDS, OUTLINES)
+    else:
+        invalidate_catalog_on_commit(OUTLINES)
+
+
+@receiver(m2m_changed, sender=Course.prerequisites.through)
+def catalog_prerequisites_changed(sender, instance, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_catalog_on_commit(OUTLINES)
+
+
+@receiver([post_save, post_delete], sender=ModuleMaterialFile)
+def catalog_material_changed(sender, instance, **kwargs):
+    invalidate_catalog_on_commit(OUTLINES)
+
+
+@receiver(post_save, sender=CustomUser)
+def catalog_instructor_changed(sender, instance, update_fields=None, **kwargs):
+    # Outlines show instructor names; logins only touch last_login
+    if instance.role == 'instructor' and update_fields != frozenset(['last_login']):
+        invalidate_catalog_on_commit(OUTLINES)
+
+
+# Analytics rollups, see core.rollups. Queryset updates and bulk inserts
+# skip these, so those code paths adjust the rollups themselves.
+@receiver(post_init, sender=CustomUser)
+@receiver(post_init, sender=EnrollmentRequest)
+@receiver(post_init, sender=QuizAttempt)
+def rollup_instance_loaded(sender, instance, **kwargs):
+    if instance.pk is not None:
+        remember_state(instance)
+
+
+@receiver(post_save, sender=CustomUser)
+def rollup_user_saved(sender, instance, created, **kwargs):
+    old = stored_state(instance)
+    if created:
+        adjust_counter(role_counter(instance.role), 1)
+    elif old and old[0] is not None and old[0] != instance.role:
+        adjust_counter(role_counter(old[0]), -1)
+        adjust_counter(role_counter(instance.role), 1)
+    remember_state(instance)
+
+
+@receiver(post_delete, sender=CustomUser)
+def rollup_user_deleted(sender, instance, **kwargs):
+    old = stored_state(instance)
+    adjust_counter(role_counter(old[0] if old and old[0] is not None else instance.role), -1)
+
+
+@receiver(post_save, sender=Course)
+def rollup_course_saved(sender, instance, created, **kwargs):
+    if created:
+        adjust_counter(COURSES_COUNTER, 1)
+
+
+@receiver(post_delete, sender=Course)
+def rollup_course_deleted(sender, instance, **kwargs):
+    adjust_counter(COURSES_COUNTER, -1)
+
+
+@receiver(post_save, sender=EnrollmentRequest)
+def rollup_enrollment_saved(sender, instance, created, **kwargs):
+    old = stored_state(instance)
+    new = (instance.course_id, instance.status, instance.progress)
+    if not created and old != new:
+        adjust_enrollments(old[0], old[1], -1, old[2])
+    if created or old != new:
+        adjust_enrollments(new[0], new[1], 1, new[2])
+    remember_state(instance)
+
+
+@receiver(post_delete, sender=EnrollmentRequest)
+def rollup_enrollment_deleted(sender, instance, **kwargs):
+    course_id, status, progress = stored_state(instance) or (instance.course_id, instance.status, instance.progress)
+    adjust_enrollments(course_id, status, -1, progress)
+
+
+@receiver(post_save, sender=QuizAttempt)
+def rollup_attempt_saved(sender, instance, created, **kwargs):
+    old = stored_state(instance)
+    new = (instance.student_id, instance.quiz_id, instance.score)
+    if not created and old != new:
+        adjust_scores(old[0], course_id_for_quiz(old[1]), old[2], -1)
+    if created or old != new:
+        adjust_scores(new[0], course_id_for_quiz(new[1]), new[2], 1)
+    remember_state(instance)
+
+
+@receiver(post_delete, sender=QuizAttempt)
+def rollup_attempt_deleted(sender, instance, **kwargs):
+    student_id, quiz_id, score = stored_state(instance) or (instance.student_id, instance.quiz_id, instance.score)
+    adjust_scores(student_id, course_id_for_quiz(quiz_id), score, -1)
+
+
+# Content-addressed files, see core.storage. Rows release their reference
+# to a blob when they are deleted or their file is replaced, after commit.
+def stored_file_name(instance):
+    value = instance.__dict__.get(CONTENT_ADDRESSED_FIELDS[type(instance)])
+    return getattr(value, 'name', value) or None
+
+
+def release_file_on_commit(instance, name):
+    storage = instance._meta.get_field(CONTENT_ADDRESSED_FIELDS[type(instance)]).storage
+    transaction.on_commit(lambda: storage.delete(name), robust=True)
+
+
+@receiver(post_init, sender=ModuleMaterialFile)
+@receiver(post_init, sender=CertificateTemplate)
+@receiver(post_init, sender=Certificate)
+def file_instance_loaded(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._stored_file = stored_file_name(instance)
+
+
+@receiver(pre_save, sender=ModuleMaterialFile)
+@receiver(pre_save, sender=CertificateTemplate)
+@receiver(pre_save, sender=Certificate)
+def file_instance_saving(sender, instance, **kwargs):
+    field_file = getattr(instance, CONTENT_ADDRESSED_FIELDS[sender])
+    # An assigned file is stored, taking a new reference, by this save
+    instance._storing_file = bool(field_file) and not field_file._committed
+    if instance._storing_file and sender is ModuleMaterialFile:
+        instance.original_name = os.path.basename(field_file.name)[:255]
+
+
+@receiver(post_save, sender=ModuleMaterialFile)
+@receiver(post_save, sender=CertificateTemplate)
+@receiver(post_save, sender=Certificate)
+def file_instance_saved(sender, instance, **kwargs):
+    old, new = getattr(instance, '_stored_file', None), stored_file_name(instance)
+    # The same bytes saved again on a row land on its current blob, with one reference too many
+    if old and (old != new or getattr(instance, '_storing_file', False)):
+        release_file_on_commit(instance, old)
+    instance._stored_file = new
+    instance._storing_file = False
+
+
+@receiver(post_delete, sender=ModuleMaterialFile)
+@receiver(post_delete, sender=CertificateTemplate)
+@receiver(post_delete, sender=Certificate)
+def file_instance_deleted(sender, instance, **kwargs):
+    name = stored_file_name(instance)
+    if name:
+        release_file_on_commit(instance, name)
+
+
+# Material previews, see core.previews
+@receiver(post_save, sender=ModuleMaterialFile)
+def material_saved(sender, instance, **kwargs):
+    if instance.file and instance.file.name != instance.preview_source:
+        preview_on_commit(instance)
+
+
+# Course content versions (student course page validators), see core.content
+@receiver([post_save, post_delete], sender=CourseModule)
+def content_module_changed(sender, instance, **kwargs):
+    bump_course_content(instance.course_id, create=kwargs['signal'] is post_save)
+
+
+@receiver([post_save, post_delete], sender=ModuleMaterialFile)
+@receiver([post_save, post_delete], sender=Quiz)
+def content_module_child_changed(sender, instance, **kwargs):
+    bump_course_content(course_id_for_module(instance.module_id), create=kwargs['signal'] is post_save)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def content_question_changed(sender, instance, **kwargs):
+    bump_course_content(course_id_for_quiz(instance.quiz_id), create=kwargs['signal'] is post_save)
+
+
+@receiver([post_save, post_delete], sender=Option)
+def content_option_changed(sender, instance, **kwargs):
+    bump_course_content(course_id_for_question(instance.question_id), create=kwargs['signal'] is post_save)
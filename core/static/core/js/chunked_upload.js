@@ -0,0 +1,130 @@
+// Chunked, resumable material uploads against the /api/uploads/ endpoints.
+//
+// Forms marked with data-chunked-upload="<start url>" and holding a file
+// input named "file", a "file_type" select and a "module_id" input are sent
+// chunk by chunk, a few chunks in parallel. An interrupted upload of the
+// same file resumes with the chunks the server is still missing. Without
+// WebCrypto (plain http outside localhost) the form is submitted as usual.
+(function () {
+    const PARALLEL = 3;
+    const RETRIES = 3;
+
+    function hex(buffer) {
+        return Array.from(new Uint8Array(buffer), b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function request(method, url, csrf, body, headers) {
+        const response = await fetch(url, {
+            method: method,
+            body: body,
+            credentials: 'same-origin',
+            headers: Object.assign({'X-CSRFToken': csrf}, headers || {}),
+        });
+        const data = response.status === 204 ? {} : await response.json();
+        if (!response.ok) {
+            const error = new Error(data.error || response.statusText);
+            error.status = response.status;
+            throw error;
+        }
+        return data;
+    }
+
+    async function resumeOrStart(startUrl, csrf, key, fields) {
+        const uploadId = localStorage.getItem(key);
+        if (uploadId) {
+            try {
+                const upload = await request('GET', startUrl + uploadId + '/', csrf);
+                if (upload.status === 'uploading') {
+                    return upload;
+                }
+            } catch (e) {
+                // Expired or gone, start over
+            }
+            localStorage.removeItem(key);
+        }
+        const upload = await request('POST', startUrl, csrf, JSON.stringify(fields), {'Content-Type': 'application/json'});
+        localStorage.setItem(key, upload.id);
+        return upload;
+    }
+
+    async function upload(form, startUrl, progress) {
+        const file = form.querySelector('input[name="file"]').files[0];
+        const csrf = form.querySelector('input[name="csrfmiddlewaretoken"]').value;
+        const moduleId = form.querySelector('input[name="module_id"]').value;
+        const key = ['chunked-upload', moduleId, file.name, file.size, file.lastModified].join(':');
+        const session = await resumeOrStart(startUrl, csrf, key, {
+            module_id: moduleId,
+            filename: file.name,
+            size: file.size,
+            file_type: form.querySelector('[name="file_type"]').value,
+        });
+        const base = startUrl + session.id + '/';
+        const digests = new Array(session.chunks);
+        const queue = session.missing.slice();
+        let done = session.chunks - queue.length;
+
+        async function chunk(index) {
+            const start = index * session.chunk_size;
+            const buffer = await file.slice(start, Math.min(start + session.chunk_size, file.size)).arrayBuffer();
+            digests[index] = hex(await crypto.subtle.digest('SHA-256', buffer));
+            return buffer;
+        }
+
+        async function worker() {
+            while (queue.length) {
+                const index = queue.shift();
+                const buffer = await chunk(index);
+                for (let attempt = 1; ; attempt++) {
+                    try {
+                        await request('PUT', base + 'chunks/' + index + '/', csrf, buffer, {'X-Chunk-SHA256': digests[index]});
+                        break;
+                    } catch (e) {
+                        if (attempt >= RETRIES || (e.status && e.status < 500)) {
+                            throw e;
+                        }
+                        await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+                    }
+                }
+                done++;
+                progress(done / session.chunks);
+            }
+        }
+
+        progress(done / session.chunks);
+        await Promise.all(Array.from({length: PARALLEL}, worker));
+        // Chunks sent before a resume were never hashed here
+        for (let index = 0; index < session.chunks; index++) {
+            if (digests[index] === undefined) {
+                await chunk(index);
+            }
+        }
+        const list = new Uint8Array(session.chunks * 32);
+        digests.forEach((digest, i) => list.set(digest.match(/../g).map(b => parseInt(b, 16)), i * 32));
+        const result = await request('POST', base + 'complete/', csrf,
+            JSON.stringify({chunks_sha256: hex(await crypto.subtle.digest('SHA-256', list))}),
+            {'Content-Type': 'application/json'});
+        localStorage.removeItem(key);
+        return result;
+    }
+
+    document.querySelectorAll('form[data-chunked-upload]').forEach(form => {
+        form.addEventListener('submit', event => {
+            const input = form.querySelector('input[name="file"]');
+            if (!window.crypto || !crypto.subtle || !input.files.length) {
+                return;
+            }
+            event.preventDefault();
+            const status = form.querySelector('.upload-progress');
+            const button = form.querySelector('button[type="submit"]');
+            button.disabled = true;
+            upload(form, form.dataset.chunkedUpload, fraction => {
+                status.textContent = 'Uploaded ' + Math.floor(fraction * 100) + '%';
+            }).then(() => {
+                window.location.reload();
+            }).catch(e => {
+                status.textContent = 'Upload stopped: ' + e.message + ' Submit again to resume.';
+                button.disabled = false;
+            });
+        });
+    });
+})();
@@ -0,0 +1,15 @@
+// Swap a PDF material's thumbnail for the full document only when asked for,
+// see material_preview.html
+document.addEventListener('click', event => {
+    const button = event.target.closest('[data-load-material]');
+    if (!button) {
+        return;
+    }
+    const container = button.closest('.material-embed');
+    const embed = document.createElement('embed');
+    embed.src = container.dataset.src;
+    embed.type = 'application/pdf';
+    embed.width = 640;
+    embed.height = 480;
+    container.replaceChildren(embed);
+});
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+# Blob names look like blobs/ab/abcdef...0123.pdf
+BLOB_DIR = 'blobs'
+# Unreferenced blob files younger than this are left alone when recounting
+RECENT_BLOB_AGE = 60 * 60
+
+
+def blob_name(sha256, extension):
+    return f'{BLOB_DIR}/{sha256[:2]}/{sha256}{extension.lower()}'
+
+
+def is_blob_name(name):
+    return name.startswith(f'{BLOB_DIR}/')
+
+
+class LocalFile(File):
+    # A file already on local disk; storages move it into place instead of copying it.
+    # A caller that has already hashed it passes `sha256` so it is not read again.
+    def __init__(self, file, name=None, sha256=None):
+        super().__init__(file, name)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps each distinct content once.
+
+    A saved file is stored under the SHA-256 of its bytes (keeping only the
+    extension of the name it was saved as), so names never depend on
+    course or module titles, and saving the same bytes again only adds a
+    reference to the existing blob. StoredBlob counts the references;
+    deleting a name drops one, and the blob itself is removed with the last.
+    Names saved before this storage was used (not under blobs/) behave as
+    in FileSystemStorage.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content is hashed in _save
+        return name
+
+    def _save(self, name, content):
+        from .models import StoredBlob
+
+        extension = os.path.splitext(name)[1]
+        directory = os.path.join(self.location, BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+        sha256 = getattr(content, 'sha256', None)
+        temporary = None
+        if hasattr(content, 'temporary_file_path'):
+            # Already on local disk (large uploads): hash in place unless known, move it if it is new
+            source = content.temporary_file_path()
+            if not sha256:
+                digest = hashlib.sha256()
+                with open(source, 'rb') as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b''):
+                        digest.update(block)
+                sha256 = digest.hexdigest()
+        else:
+            digest = hashlib.sha256()
+            fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                for block in content.chunks():
+                    digest.update(block)
+                    f.write(block)
+            source = temporary
+            sha256 = digest.hexdigest()
+
+        size = os.path.getsize(source)
+        name = blob_name(sha256, extension)
+        path = self.path(name)
+        try:
+            with transaction.atomic():
+                if not StoredBlob.objects.filter(name=name).update(references=F('references') + 1):
+                    StoredBlob.objects.create(name=name, sha256=sha256, size=size, references=1)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if temporary:
+                        os.replace(temporary, path)
+                        temporary = None
+                    else:
+                        file_move_safe(source, path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+        except IntegrityError:
+            # Created concurrently, with its file: take a reference to it
+            StoredBlob.objects.filter(name=name).update(references=F('references') + 1)
+        finally:
+            if temporary:
+                os.remove(temporary)
+        return name
+
+    def delete(self, name):
+        from .models import StoredBlob
+
+        if not is_blob_name(name):
+            return super().delete(name)
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return super().delete(name)
+            if blob.references > 1:
+                StoredBlob.objects.filter(pk=blob.pk).update(references=F('references') - 1)
+                return
+            blob.delete()
+            super().delete(name)
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def get_content_addressed_storage():
+    return content_addressed_storage
+
+
+def recount_blob_references():
+    """
+    Recount every blob's references from the file fields that use this
+    storage, drop blobs nothing refers to, and remove blob files without a
+    StoredBlob row (left by rolled back transactions). Returns the bytes freed.
+    """
+    from .models import CONTENT_ADDRESSED_FIELDS, StoredBlob
+
+    counts = {}
+    for model, field in CONTENT_ADDRESSED_FIELDS.items():
+        rows = model.objects.filter(**{f'{field}__startswith': f'{BLOB_DIR}/'}).values_list(field, flat=True)
+        for name in rows.iterator():
+            counts[name] = counts.get(name, 0) + 1
+
+    storage = content_addressed_storage
+    freed = 0
+    with transaction.atomic():
+        stored = dict(StoredBlob.objects.values_list('name', 'references'))
+        for name, references in stored.items():
+            if name not in counts:
+                StoredBlob.objects.filter(name=name).delete()
+            elif references != counts[name]:
+                StoredBlob.objects.filter(name=name).update(references=counts[name])
+        # Referenced files whose row was lost
+        StoredBlob.objects.bulk_create(
+            StoredBlob(
+                name=name, sha256=os.path.splitext(os.path.basename(name))[0], size=storage.size(name),
+                references=references,
+            )
+            for name, references in counts.items()
+            if name not in stored and storage.exists(name)
+        )
+
+    for directory, _, filenames in os.walk(storage.path(BLOB_DIR)):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if time.time() - os.path.getmtime(path) < RECENT_BLOB_AGE:
+                # Possibly saved by a request that has not saved its row yet
+                continue
+            if os.path.relpath(path, storage.location).replace(os.sep, '/') not in counts:
+                freed += os.path.getsize(path)
+                os.remove(path)
+    return freed
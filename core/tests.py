@@ -1,3 +1,317 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .activity import ActivityBuffer, log_activity, write_activity
+from .catalog import OUTLINES, catalog_versions
+from .enrollment import (
+    APPROVED, COURSE_FULL, NOT_APPROVED, NOT_PENDING, REJECTED, REMOVED, approve_enrollment_request,
+    reject_enrollment_request, remove_enrollment,
+)
+from .media import UnsatisfiableRange, can_view_material, parse_ranges
+from .models import (
+    Course, CourseEnrollmentLimit, CourseEnrollmentRollup, CourseModule, CustomUser, EnrollmentRequest,
+    MaterialUpload, ModuleMaterialFile, StoredBlob, UserActivityLog,
+)
+from .previews import prune_previews
+from .reports import data_version, field_digest
+from .rollups import reconcile_rollups
+from .storage import RECENT_BLOB_AGE
+from .uploads import complete_upload, start_upload, write_chunk
+
+
+def create_course(limit, students):
+    instructor = CustomUser.objects.create(username='instructor', role='instructor')
+    course = Course.objects.create(title='Course', description='', instructor=instructor, difficulty_level='Beginner')
+    CourseEnrollmentLimit.objects.create(course=course, enrollment_limit=limit)
+    requests = [
+        EnrollmentRequest.objects.create(
+            course=course, student=CustomUser.objects.create(username=f'student{i}', role='student'),
+        )
+        for i in range(students)
+    ]
+    return course, requests
+
+
+class EnrollmentTests(TestCase):
+    def test_reject_does_not_overwrite_approval(self):
+        course, (request,) = create_course(limit=1, students=1)
+        stale = EnrollmentRequest.objects.get(id=request.id)
+        self.assertEqual(approve_enrollment_request(request), APPROVED)
+        self.assertEqual(reject_enrollment_request(stale), NOT_PENDING)
+        request.refresh_from_db()
+        self.assertEqual(request.status, 'approved')
+        self.assertEqual(CourseEnrollmentLimit.objects.get(course=course).current_enrollments, 1)
+
+    def test_reject_moves_rollup(self):
+        course, (request,) = create_course(limit=1, students=1)
+        self.assertEqual(reject_enrollment_request(request), REJECTED)
+        rollup = CourseEnrollmentRollup.objects.get(course=course)
+        self.assertEqual((rollup.pending, rollup.rejected), (0, 1))
+
+    def test_remove_releases_one_seat(self):
+        course, (first, second) = create_course(limit=2, students=2)
+        approve_enrollment_request(first)
+        approve_enrollment_request(second)
+        self.assertEqual(remove_enrollment(first), REMOVED)
+        self.assertEqual(remove_enrollment(EnrollmentRequest.objects.get(id=first.id)), NOT_APPROVED)
+        self.assertEqual(CourseEnrollmentLimit.objects.get(course=course).current_enrollments, 1)
+        self.assertEqual(CourseEnrollmentRollup.objects.get(course=course).approved, 1)
+
+    def test_removed_progress_leaves_rollup(self):
+        course, (kept, removed) = create_course(limit=2, students=2)
+        for request, progress in ((kept, 40.0), (removed, 90.0)):
+            approve_enrollment_request(request)
+            request.progress = progress
+            request.save()
+        remove_enrollment(removed)
+        rollup = CourseEnrollmentRollup.objects.get(course=course)
+        self.assertEqual((rollup.total, rollup.avg_progress), (1, 40.0))
+        self.assertEqual(reconcile_rollups(fix=False), [])
+
+    def test_remove_pending_releases_nothing(self):
+        course, (approved, pending) = create_course(limit=2, students=2)
+        approve_enrollment_request(approved)
+        self.assertEqual(remove_enrollment(pending), NOT_APPROVED)
+        self.assertEqual(CourseEnrollmentLimit.objects.get(course=course).current_enrollments, 1)
+
+
+class ParallelApprovalTests(TransactionTestCase):
+    LIMIT = 25
+    STUDENTS = 300
+    WORKERS = 16
+
+    def approve(self, request_id):
+        deadline = time.monotonic() + 60
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    return approve_enrollment_request(EnrollmentRequest.objects.get(id=request_id))
+                except OperationalError:
+                    # SQLite allows one writer at a time
+                    time.sleep(random.uniform(0.001, 0.02))
+            raise AssertionError('approval kept failing on a locked database')
+        finally:
+            connection.close()
+
+    def test_parallel_approvals_never_oversubscribe(self):
+        course, requests = create_course(self.LIMIT, self.STUDENTS)
+        with ThreadPoolExecutor(self.WORKERS) as pool:
+            outcomes = list(pool.map(self.approve, [request.id for request in requests]))
+
+        self.assertEqual(outcomes.count(APPROVED), self.LIMIT)
+        self.assertEqual(outcomes.count(COURSE_FULL), self.STUDENTS - self.LIMIT)
+        self.assertEqual(CourseEnrollmentLimit.objects.get(course=course).current_enrollments, self.LIMIT)
+        self.assertEqual(EnrollmentRequest.objects.filter(course=course, status='approved').count(), self.LIMIT)
+        self.assertEqual(CourseEnrollmentRollup.objects.get(course=course).approved, self.LIMIT)
+
+    def test_parallel_approvals_of_one_request(self):
+        course, (request,) = create_course(self.LIMIT, 1)
+        with ThreadPoolExecutor(self.WORKERS) as pool:
+            outcomes = list(pool.map(self.approve, [request.id] * self.WORKERS))
+
+        self.assertEqual(outcomes.count(APPROVED), 1)
+        self.assertEqual(outcomes.count(NOT_PENDING), self.WORKERS - 1)
+        self.assertEqual(CourseEnrollmentLimit.objects.get(course=course).current_enrollments, 1)
+        self.assertEqual(CourseEnrollmentRollup.objects.get(course=course).approved, 1)
+
+
+class RobustCallbackTests(TestCase):
+    def test_cache_failure_after_commit_keeps_approval(self):
+        course, (request,) = create_course(limit=1, students=1)
+        locked = mock.patch('core.roster.cache.delete', side_effect=OperationalError('database table is locked'))
+        with locked, mock.patch('core.activity.activity_buffer.add') as add, self.assertLogs(level='ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(approve_enrollment_request(request), APPROVED)
+                log_activity(course.instructor, 'Approved a request')
+        # The callbacks after the failing one still ran
+        add.assert_called_once()
+        request.refresh_from_db()
+        self.assertEqual(request.status, 'approved')
+
+
+class CatalogAPITests(TestCase):
+    def test_etag_follows_catalog_version(self):
+        course, _ = create_course(limit=1, students=0)
+        course.is_published = True
+        course.save()
+        url = reverse('api_courses')
+
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        version = catalog_versions(OUTLINES)[OUTLINES]
+        with self.captureOnCommitCallbacks(execute=True):
+            course.title = 'Renamed'
+            course.save()
+        self.assertNotEqual(catalog_versions(OUTLINES)[OUTLINES], version)
+
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertEqual(changed.json()['results'][0]['title'], 'Renamed')
+
+
+class ReportVersionTests(TestCase):
+    def test_renamed_user_changes_version(self):
+        instructor = CustomUser.objects.create(username='before', role='instructor')
+        instructors = CustomUser.objects.filter(role='instructor')
+        version = data_version(field_digest(instructors, 'username'), instructors)
+        CustomUser.objects.filter(pk=instructor.pk).update(username='after')
+        self.assertNotEqual(data_version(field_digest(instructors, 'username'), instructors), version)
+
+
+class RangeParsingTests(TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_ranges('bytes=0-9', 100), [(0, 9)])
+        self.assertEqual(parse_ranges('bytes=90-', 100), [(90, 99)])
+        self.assertEqual(parse_ranges('bytes=-5', 100), [(95, 99)])
+        self.assertEqual(parse_ranges('bytes=-500', 100), [(0, 99)])
+        self.assertEqual(parse_ranges('bytes=50-60, 0-9, 10-20, 55-70', 100), [(0, 20), (50, 70)])
+
+    def test_ignored_headers(self):
+        for header in (None, '', 'items=0-9', 'bytes=9-0', 'bytes=a-b', 'bytes=-', ','.join(['bytes=0-1'] * 17)):
+            self.assertIsNone(parse_ranges(header, 100), header)
+
+    def test_unsatisfiable(self):
+        for header, size in (('bytes=100-', 100), ('bytes=-0', 100), ('bytes=-5', 0), ('bytes=0-', 0)):
+            with self.assertRaises(UnsatisfiableRange, msg=(header, size)):
+                parse_ranges(header, size)
+
+
+class MaterialFileTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root, PREVIEW_IN_BACKGROUND=False)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.course, (self.enrollment,) = create_course(limit=1, students=1)
+        module = CourseModule.objects.create(course=self.course, title='Module', order=1)
+        self.material = ModuleMaterialFile.objects.create(
+            module=module, file_type='other', file=SimpleUploadedFile('notes.txt', bytes(range(100))),
+        )
+        self.url = reverse('material_file', args=[self.material.id])
+
+    def test_permission(self):
+        student = self.enrollment.student
+        self.assertFalse(can_view_material(student, self.material))
+        self.client.force_login(student)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+        approve_enrollment_request(self.enrollment)
+        self.assertTrue(can_view_material(student, self.material))
+        self.assertTrue(can_view_material(self.course.instructor, self.material))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+
+    def test_range_and_if_range(self):
+        self.client.force_login(self.course.instructor)
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        # A changed file: the whole of it instead of a range of something else
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '100')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=200-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_original_name(self):
+        self.assertEqual(self.material.display_name, 'notes.txt')
+        self.assertNotIn('notes', self.material.file.name)
+        self.client.force_login(self.course.instructor)
+        self.assertEqual(self.client.get(self.url)['Content-Disposition'], 'inline; filename="notes.txt"')
+
+    def test_same_bytes_saved_again_keep_one_reference(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.material.file = SimpleUploadedFile('again.txt', bytes(range(100)))
+            self.material.save()
+        self.assertEqual(StoredBlob.objects.get(name=self.material.file.name).references, 1)
+        self.assertEqual(ModuleMaterialFile.objects.get(id=self.material.id).original_name, 'again.txt')
+
+    def test_failed_completion_can_be_retried(self):
+        content = bytes(range(200))
+        with override_settings(MATERIAL_UPLOAD_TEMP_DIR=os.path.join(settings.MEDIA_ROOT, 'parts')):
+            upload = start_upload(self.material.module, self.course.instructor, 'upload.txt', len(content))
+            write_chunk(upload, 0, io.BytesIO(content), len(content))
+            sha256 = hashlib.sha256(content).hexdigest()
+            with mock.patch('core.storage.ContentAddressedStorage._save', side_effect=OSError('disk full')):
+                with self.assertRaises(OSError):
+                    complete_upload(upload, sha256)
+            self.assertEqual(MaterialUpload.objects.get(pk=upload.pk).status, 'uploading')
+
+            material = complete_upload(upload, sha256)
+        self.assertEqual(StoredBlob.objects.get(name=material.file.name).sha256, sha256)
+        with material.file.open('rb') as f:
+            self.assertEqual(f.read(), content)
+
+
+class PreviewPruneTests(TestCase):
+    def test_only_old_unreferenced_previews_are_removed(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root, PREVIEW_IN_BACKGROUND=False):
+            course, _ = create_course(limit=1, students=0)
+            module = CourseModule.objects.create(course=course, title='Module', order=1)
+            ModuleMaterialFile.objects.create(module=module, file_type='pdf', preview='previews/kept.jpg')
+            os.makedirs(os.path.join(media_root, 'previews'))
+            for name in ('kept', 'orphan', 'recent'):
+                with open(os.path.join(media_root, 'previews', f'{name}.jpg'), 'wb') as f:
+                    f.write(b'jpeg')
+            old = time.time() - 2 * RECENT_BLOB_AGE
+            for name in ('kept', 'orphan'):
+                os.utime(os.path.join(media_root, 'previews', f'{name}.jpg'), (old, old))
+
+            self.assertEqual(prune_previews(), 4)
+            self.assertEqual(sorted(os.listdir(os.path.join(media_root, 'previews'))), ['kept.jpg', 'recent.jpg'])
+
+
+class ActivityBufferTests(TestCase):
+    def test_latest_activity_kept_once(self):
+        user = CustomUser.objects.create(username='student', role='student')
+        write_activity([], {(user.id, 'login'): timezone.now() - timedelta(days=1)})
+        now = timezone.now()
+        write_activity([(user.id, 'login', now)], {(user.id, 'login'): now})
+        # An event of an activity kept once per user updates that row too
+        self.assertEqual(list(UserActivityLog.objects.filter(user=user).values_list('timestamp', flat=True)), [now])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UserActivityLog.objects.create(user=user, activity='login')
+        UserActivityLog.objects.create(user=user, activity='Viewed a course')
+        UserActivityLog.objects.create(user=user, activity='Viewed a course')
+
+    @override_settings(ACTIVITY_LOG_MAX_BACKLOG=3)
+    def test_failed_flush_keeps_newest_rows(self):
+        buffer = ActivityBuffer()
+        # No flusher thread or signal handlers for this buffer
+        with mock.patch('threading.Thread.start'), mock.patch('signal.signal'):
+            for i in range(5):
+                buffer.add(1, f'event {i}', i)
+        buffer.add(1, 'login', 5, latest=True)
+        with mock.patch('core.activity.write_activity', side_effect=DatabaseError), self.assertLogs('core.activity'):
+            buffer.flush()
+        self.assertEqual(buffer.events, [(1, 'event 3', 3), (1, 'event 4', 4)])
+        self.assertEqual(buffer.latest, {(1, 'login'): 5})
+        buffer.events, buffer.latest = [], {}
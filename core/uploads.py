@@ -0,0 +1,238 @@
+import hashlib
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MaterialUpload, MaterialUploadChunk, ModuleMaterialFile
+from .storage import LocalFile
+
+# Chunks are streamed to disk in blocks of this size
+BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """A chunked upload request that cannot be honoured; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def part_path(upload):
+    return os.path.join(settings.MATERIAL_UPLOAD_TEMP_DIR, f'{upload.id}.part')
+
+
+def chunk_count(upload):
+    return -(-upload.size // upload.chunk_size) if upload.size else 0
+
+
+def chunk_length(upload, index):
+    return min(upload.chunk_size, upload.size - index * upload.chunk_size)
+
+
+def start_upload(module, user, filename, size, file_type='other', chunk_size=None):
+    """Create an upload session and a sparse part file of the final size, so chunks can land in any order."""
+    chunk_size = chunk_size or settings.MATERIAL_UPLOAD_CHUNK_SIZE
+    filename = os.path.basename(filename or '')
+    if not filename:
+        raise UploadError('A file name is required.')
+    if file_type not in dict(ModuleMaterialFile.MATERIAL_TYPE_CHOICES):
+        raise UploadError(f'Unknown file type {file_type!r}.')
+    if not 0 < size <= settings.MATERIAL_UPLOAD_MAX_SIZE:
+        raise UploadError(f'Size must be between 1 and {settings.MATERIAL_UPLOAD_MAX_SIZE} bytes.')
+    if not 0 < chunk_size <= settings.MATERIAL_UPLOAD_CHUNK_SIZE:
+        raise UploadError(f'Chunk size must be between 1 and {settings.MATERIAL_UPLOAD_CHUNK_SIZE} bytes.')
+
+    upload = MaterialUpload.objects.create(
+        module=module, uploaded_by=user, filename=filename, file_type=file_type, size=size, chunk_size=chunk_size,
+    )
+    os.makedirs(settings.MATERIAL_UPLOAD_TEMP_DIR, exist_ok=True)
+    with open(part_path(upload), 'wb') as f:
+        f.truncate(size)
+    return upload
+
+
+def received_chunks(upload):
+    return sorted(upload.chunks.values_list('index', flat=True))
+
+
+def upload_status(upload):
+    received = received_chunks(upload)
+    return {
+        'id': str(upload.id),
+        'module': upload.module_id,
+        'filename': upload.filename,
+        'size': upload.size,
+        'chunk_size': upload.chunk_size,
+        'chunks': chunk_count(upload),
+        'received': received,
+        'missing': sorted(set(range(chunk_count(upload))) - set(received)),
+        'status': upload.status,
+        'material': upload.material_id,
+    }
+
+
+def write_chunk(upload, index, stream, length, sha256=None):
+    """
+    Stream one chunk from `stream` into its place in the part file.
+
+    Chunks write disjoint byte ranges with positioned writes, so any number
+    of them can be uploaded in parallel, and a chunk sent again (after a
+    dropped connection, say) simply overwrites itself. The chunk is only
+    recorded as received once all of it is on disk and, when the client
+    sent one, its SHA-256 matched.
+    """
+    if upload.status != 'uploading':
+        raise UploadError(f'Upload is {upload.status}.', status=409)
+    if not 0 <= index < chunk_count(upload):
+        raise UploadError(f'Chunk index must be between 0 and {chunk_count(upload) - 1}.')
+    expected = chunk_length(upload, index)
+    if length != expected:
+        raise UploadError(f'Chunk {index} must be {expected} bytes, got {length}.')
+
+    digest = hashlib.sha256()
+    offset = index * upload.chunk_size
+    written = 0
+    try:
+        fd = os.open(part_path(upload), os.O_WRONLY)
+    except FileNotFoundError:
+        raise UploadError('Upload has expired.', status=410)
+    try:
+        while written < expected:
+            block = stream.read(min(BLOCK_SIZE, expected - written))
+            if not block:
+                break
+            digest.update(block)
+            os.pwrite(fd, block, offset + written)
+            written += len(block)
+    finally:
+        os.close(fd)
+
+    if written != expected:
+        raise UploadError(f'Chunk {index} ended after {written} of {expected} bytes.')
+    if sha256 and sha256.lower() != digest.hexdigest():
+        raise UploadError(f'Chunk {index} does not match its checksum.')
+
+    # A re-sent chunk updates its row, which must describe what is on disk now
+    if not MaterialUploadChunk.objects.filter(upload=upload, index=index).update(sha256=digest.hexdigest()):
+        MaterialUploadChunk.objects.bulk_create(
+            [MaterialUploadChunk(upload=upload, index=index, sha256=digest.hexdigest())], ignore_conflicts=True,
+        )
+    MaterialUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now())
+    return digest.hexdigest()
+
+
+def _digests(upload):
+    """(SHA-256 of the file, [SHA-256 of each chunk]) read back from the part file."""
+    whole = hashlib.sha256()
+    chunks = []
+    with open(part_path(upload), 'rb') as f:
+        for index in range(chunk_count(upload)):
+            chunk = hashlib.sha256()
+            remaining = chunk_length(upload, index)
+            while remaining:
+                block = f.read(min(BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                whole.update(block)
+                chunk.update(block)
+                remaining -= len(block)
+            chunks.append(chunk.hexdigest())
+    return whole.hexdigest(), chunks
+
+
+def chunk_list_checksum(chunk_digests):
+    """SHA-256 over the binary SHA-256 digests of the chunks in order; browsers can compute it chunk by chunk."""
+    return hashlib.sha256(b''.join(bytes.fromhex(digest) for digest in chunk_digests)).hexdigest()
+
+
+def complete_upload(upload, sha256=None, chunks_sha256=None):
+    """
+    Verify the assembled file and attach it to a new ModuleMaterialFile.
+
+    The client proves integrity with the SHA-256 of the whole file or, when
+    it cannot hash the file in one pass, with chunk_list_checksum() of its
+    chunks. Only one request can complete an upload: the status moves from
+    uploading to completing with a conditional UPDATE, and back if anything
+    short of a checksum mismatch fails before storing. The part file is moved
+    into storage, and the material row is created in the same transaction
+    that marks the upload complete.
+    """
+    if not sha256 and not chunks_sha256:
+        raise UploadError('A sha256 or chunks_sha256 checksum is required.')
+    if upload.status == 'complete':
+        if upload.material is None:
+            raise UploadError('The uploaded material has been deleted.', status=410)
+        return upload.material
+    if not MaterialUpload.objects.filter(pk=upload.pk, status='uploading').update(
+        status='completing', updated_at=timezone.now(),
+    ):
+        raise UploadError('Upload is already being completed, or has failed.', status=409)
+
+    try:
+        missing = chunk_count(upload) - upload.chunks.count()
+        if missing:
+            raise UploadError(f'{missing} chunks are missing.', status=409)
+
+        whole, chunks = _digests(upload)
+        recorded = dict(upload.chunks.values_list('index', 'sha256'))
+        if (
+            any(recorded[index] != digest for index, digest in enumerate(chunks))
+            or (sha256 and sha256.lower() != whole)
+            or (chunks_sha256 and chunks_sha256.lower() != chunk_list_checksum(chunks))
+        ):
+            discard_upload(upload, status='failed')
+            raise UploadError('Checksum mismatch, the upload has to start over.', status=422)
+
+        material = ModuleMaterialFile(module=upload.module, file_type=upload.file_type, original_name=upload.filename)
+        with open(part_path(upload), 'rb') as f:
+            # The file was just hashed: storage does not read it again
+            material.file.save(upload.filename, LocalFile(f, sha256=whole), save=False)
+    except BaseException:
+        # Completing can be retried; an upload that failed its checksum stays failed
+        MaterialUpload.objects.filter(pk=upload.pk, status='completing').update(status='uploading')
+        raise
+    try:
+        with transaction.atomic():
+            material.save()
+            MaterialUpload.objects.filter(pk=upload.pk).update(status='complete', material=material)
+    except BaseException:
+        # The part file may already have been moved into storage
+        material.file.delete(save=False)
+        discard_upload(upload, status='failed')
+        raise
+    if os.path.exists(part_path(upload)):
+        # Left in place when the same content was already stored
+        os.remove(part_path(upload))
+    upload.status, upload.material = 'complete', material
+    return material
+
+
+def discard_upload(upload, status=None):
+    """Remove the part file and chunk records; with a status the session is kept, otherwise deleted."""
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+    if status is None:
+        upload.delete()
+    else:
+        upload.chunks.all().delete()
+        MaterialUpload.objects.filter(pk=upload.pk).update(status=status)
+        upload.status = status
+
+
+def expire_uploads(max_age=None):
+    """Discard unfinished uploads untouched for `max_age` seconds; returns how many."""
+    max_age = settings.MATERIAL_UPLOAD_EXPIRY if max_age is None else max_age
+    stale = MaterialUpload.objects.filter(
+        status__in=['uploading', 'completing', 'failed'], updated_at__lt=timezone.now() - timedelta(seconds=max_age),
+    )
+    count = 0
+    for upload in stale:
+        discard_upload(upload)
+        count += 1
+    return count
@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import *
+from .api import CategoryListAPIView, CourseListAPIView, CourseOutlineAPIView
 
 urlpatterns = [
     path('login/', superuser_login_view, name='superuser_login'),
@@ -28,6 +29,7 @@ urlpatterns = [
 
     path('enrollment/requests/', PendingEnrollmentRequestsView.as_view(), name='enrollment_req'),
     path('enrollment/statistics/', EnrollmentStatisticsView.as_view(), name='enrollment_statistics'),
+    path('enrollment/statistics/json/', enrollment_statistics_json, name='enrollment_statistics_json'),
 
     path('certificate/templates/', CertificateTemplateListView.as_view(), name='certificate_template_list'),
     path('certificates/', CertificateListView.as_view(), name='certificate_list'),
@@ -38,6 +40,21 @@ urlpatterns = [
     path('export/csv/', export_csv, name='export_csv'),
     path('analytics/', analytics_dashboard, name='analytics_dashboard'),
 
+    path('instrumentation/', instrumentation_dashboard, name='instrumentation'),
+    path('instrumentation/json/', instrumentation_json, name='instrumentation_json'),
+
+    path('uploads/', material_upload_start, name='material_upload_start'),
+    path('uploads/<uuid:upload_id>/', material_upload_detail, name='material_upload_detail'),
+    path('uploads/<uuid:upload_id>/chunks/<int:index>/', material_upload_chunk, name='material_upload_chunk'),
+    path('uploads/<uuid:upload_id>/complete/', material_upload_complete, name='material_upload_complete'),
+    path('materials/<int:material_id>/', material_file, name='material_file'),
+    path('materials/<int:material_id>/preview/', material_preview, name='material_preview'),
+
+    # Read-only catalog API, see core/api.py
+    path('v1/categories/', CategoryListAPIView.as_view(), name='api_categories'),
+    path('v1/courses/', CourseListAPIView.as_view(), name='api_courses'),
+    path('v1/courses/<int:course_id>/', CourseOutlineAPIView.as_view(), name='api_course_outline'),
+
     
     
 
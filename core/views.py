@@ -4,9 +4,16 @@ from django.views import View
 from django.views.decorators.http import require_POST
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
+from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
 from .models import *
 from .forms import *
+from .enrollment import (
+    REMOVED, approve_enrollment_request, bulk_enrollment_message, bulk_process_enrollment_requests,
+    enrollment_message, reject_enrollment_request, remove_enrollment, select_enrollment_requests,
+)
+from .listing import list_page
+from .rollups import COURSES_COUNTER, role_counter, rollup_counters
 
 def superuser_login_view(request):
     if request.method == 'POST':
@@ -28,16 +35,18 @@ def user_logout(request):
     return redirect('superuser_login')
 
 def home(request):
-    student_count = CustomUser.objects.filter(role='student').count()
-    instructor_count = CustomUser.objects.filter(role='instructor').count()
-    courses = Course.objects.all().count()
+    # Counts are kept up to date in the rollup tables
+    counters = rollup_counters()
+    student_count = counters.get(role_counter('student'), 0)
+    instructor_count = counters.get(role_counter('instructor'), 0)
+    courses = counters.get(COURSES_COUNTER, 0)
     return render(request, 'index.html',{'student':student_count, 'instructor':instructor_count,'course': courses})
 
 class StudentListView(View):
     def get(self, request, *args, **kwargs):
-        students = CustomUser.objects.filter(role='student').all()
+        page = list_page(request, CustomUser.objects.filter(role='student'), ['username', 'email'])
         form = CustomUserForm()
-        return render(request, 'students.html', {'students': students, 'form': form})
+        return render(request, 'students.html', {'students': page.items, 'page': page, 'form': form})
     
     def post(self, request, *args, **kwargs):
         if 'create_student' in request.POST:
@@ -77,9 +86,9 @@ def student_detail(request, pk):
 
 class InstructorListView(View):
     def get(self, request, *args, **kwargs):
-        instructors = CustomUser.objects.filter(role='instructor').all()
+        page = list_page(request, CustomUser.objects.filter(role='instructor'), ['username', 'email'])
         form = CustomUserForm()
-        return render(request, 'instructor.html', {'instructors': instructors, 'form': form})
+        return render(request, 'instructor.html', {'instructors': page.items, 'page': page, 'form': form})
     
 
     def post(self, request, *args, **kwargs):
@@ -131,10 +140,13 @@ def delete_user(request, user_id):
 
 class CourseListView(View):
     def get(self, request, *args, **kwargs):
-        courses = Course.objects.all()
+        courses = Course.objects.select_related('instructor', 'category__parent_category')
+        page = list_page(request, courses, ['title'])
         categories = CourseCategory.objects.all()
         instructors = CustomUser.objects.filter(role='instructor')
-        return render(request, 'course.html', {'courses': courses, 'categories': categories, 'instructors': instructors})
+        return render(request, 'course.html', {
+            'courses': page.items, 'page': page, 'categories': categories, 'instructors': instructors,
+        })
 
     def post(self, request, *args, **kwargs):
         course_id = request.POST.get('course_id')
@@ -206,13 +218,11 @@ class CourseDetailView(View):
             enrollment_request = get_object_or_404(EnrollmentRequest, id=enroll_id)
 
             if action == 'remove':
-                enrollment_request.status = 'removed'
-                enrollment_request.save()
-                enrollment_limit = get_object_or_404(CourseEnrollmentLimit, course=enrollment_request.course)
-                if enrollment_limit.unenroll_student():
-                    print("Student removed successfully")
+                # Only an approved request is removed, releasing its seat once
+                if remove_enrollment(enrollment_request) == REMOVED:
+                    messages.success(request, f'{enrollment_request.student.username} was removed from the course.')
                 else:
-                    print("No enrollments to remove")
+                    messages.warning(request, f'{enrollment_request.student.username} is not enrolled in the course.')
 
             return redirect('course_detail', course_id=course.id)
         
@@ -322,69 +332,84 @@ class SubCategoryDeleteView(View):
     
 class PendingEnrollmentRequestsView(View):
     def get(self, request, *args, **kwargs):
-        requests = EnrollmentRequest.objects.filter(status='pending')
-        
-        return render(request, 'enroll.html', {'requests': requests})
+        return render(request, 'enroll.html', {'requests': self.pending_requests()})
+
+    def pending_requests(self):
+        return EnrollmentRequest.objects.filter(status='pending').select_related('student', 'course__enrollment_limit')
     
     def post(self, request, *args, **kwargs):
+        if request.POST.get('bulk_action') in ('approve', 'reject'):
+            enrollment_requests = select_enrollment_requests(EnrollmentRequest.objects.all(), request.POST)
+            outcomes = bulk_process_enrollment_requests(enrollment_requests, request.POST['bulk_action'])
+            bulk_enrollment_message(request, outcomes)
+            return redirect('enrollment_req')
+
         enroll_id = request.POST.get('enroll_id')
         action = request.POST.get('action')
         enrollment_request = get_object_or_404(EnrollmentRequest, id=enroll_id)
 
         if action == 'approve':
-            enrollment_request.status = 'approved'
-            enrollment_request.save()
-            enrollment_limit = CourseEnrollmentLimit.objects.filter(course=enrollment_request.course).first()
-            if enrollment_limit and not enrollment_limit.is_full():
-                if enrollment_limit.enroll_student():
-                    print("Student enrolled successfully")
-                else:
-                    print("Enrollment failed: limit is full")
-            else:
-                print("Enrollment limit not set or course is already full")
-                
+            # Approval and seat reservation happen in one transaction
+            outcome = approve_enrollment_request(enrollment_request)
+            enrollment_message(request, enrollment_request, outcome)
+
         elif action == 'reject':
-            enrollment_request.status = 'rejected'
-            enrollment_request.save()
+            outcome = reject_enrollment_request(enrollment_request)
+            enrollment_message(request, enrollment_request, outcome)
 
         return redirect('enrollment_req')
     
 
+import hashlib
+import json
+from django.core.paginator import Paginator
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+ENROLLMENT_STATS_PER_PAGE = 24
+ENROLLMENT_STATS_MAX_AGE = 60
+# (label, colour) of each bar, in the order of a course's `data`
+ENROLLMENT_STATS_SERIES = [
+    ('Approved Requests', 'rgba(68, 231, 9, 0.96)'),
+    ('Pending Requests', 'rgba(1, 1, 1, 0.9)'),
+    ('Rejected Requests', 'rgba(231, 9, 9, 0.96)'),
+    ('Current Enrollments', 'rgba(9, 231, 210, 0.96)'),
+    ('Enrollment Limit', 'rgba(231, 207, 9, 0.96)'),
+]
+
 class EnrollmentStatisticsView(View):
     def get(self, request, *args, **kwargs):
-        # Get all courses
-        courses = Course.objects.all()
-        
-        # Prepare data for each course
-        course_data = []
-
-        for course in courses:
-            total_requests = EnrollmentRequest.objects.filter(course=course).count()
-            approved_requests = EnrollmentRequest.objects.filter(course=course, status='approved').count()
-            pending_requests = EnrollmentRequest.objects.filter(course=course, status='pending').count()
-            rejected_requests = EnrollmentRequest.objects.filter(course=course, status='rejected').count()
-            
-            try:
-                enrollment_limit = course.enrollment_limit
-                limit = enrollment_limit.enrollment_limit
-                current_enrollments_count = enrollment_limit.current_enrollments
-            except CourseEnrollmentLimit.DoesNotExist:
-                limit = None
-                current_enrollments_count = 0
-
-            course_data.append({
-                'title': course.title,
-                'labels': ['Approved', 'Pending', 'Rejected', 'Current Enrollments', 'Enrollment Limit'],
-                'data': [approved_requests, pending_requests, rejected_requests, current_enrollments_count, limit if limit is not None else 0],
-                'backgroundColor': ['rgba(75, 192, 192, 0.2)', 'rgba(255, 206, 86, 0.2)', 'rgba(255, 99, 132, 0.2)', 'rgba(153, 102, 255, 0.2)', 'rgba(255, 159, 64, 0.2)'],
-                'borderColor': ['rgba(75, 192, 192, 1)', 'rgba(255, 206, 86, 1)', 'rgba(255, 99, 132, 1)', 'rgba(153, 102, 255, 1)', 'rgba(255, 159, 64, 1)'],
-            })
-
-        context = {
-            'course_data': course_data,
-        }
+        # The charts are fetched page by page from enrollment_statistics_json
+        return render(request, 'enroll_sts.html', {
+            'series': [{'label': label, 'color': color} for label, color in ENROLLMENT_STATS_SERIES],
+        })
 
-        return render(request, 'enroll_sts.html', context)
+def enrollment_statistics_json(request):
+    # One query per page: status counts come from the enrollment rollup,
+    # joined to the course's enrollment limit
+    courses = Course.objects.order_by('title', 'id').values_list(
+        'id', 'title',
+        'enrollment_rollup__approved', 'enrollment_rollup__pending', 'enrollment_rollup__rejected',
+        'enrollment_limit__current_enrollments', 'enrollment_limit__enrollment_limit',
+    )
+    page = Paginator(courses, ENROLLMENT_STATS_PER_PAGE).get_page(request.GET.get('page'))
+
+    body = json.dumps({
+        'page': page.number,
+        'num_pages': page.paginator.num_pages,
+        'next': page.next_page_number() if page.has_next() else None,
+        'courses': [
+            {'id': course_id, 'title': title, 'data': [value or 0 for value in data]}
+            for course_id, title, *data in page
+        ],
+    })
+    etag = '"%s"' % hashlib.md5(body.encode()).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=ENROLLMENT_STATS_MAX_AGE)
+    return response
 
 
 
@@ -404,11 +429,13 @@ class CertificateTemplateListView(View):
 
 class CertificateListView(View):
     def get(self, request, *args, **kwargs):
-        certificates = Certificate.objects.all()
-        return render(request, 'certificate_list.html', {'certificates': certificates})
+        certificates = Certificate.objects.select_related('student', 'certificate_template__course')
+        page = list_page(request, certificates, ['student__username', 'student__email', 'certificate_template__course__title'])
+        return render(request, 'certificate_list.html', {'certificates': page.items, 'page': page})
     
 
 from instructor.forms import QuizForm
+from .discussions import load_discussion_threads, parse_cursor
 
 class QuizDoubtView(View):
     def get(self, request, *args, **kwargs):
@@ -417,18 +444,7 @@ class QuizDoubtView(View):
         modules = CourseModule.objects.filter(course=course)
         quizzes = Quiz.objects.filter(module__in=modules)
 
-        discussions = Discussion.objects.filter(course=course).order_by('timestamp')
-
-        discussions_dict = {}
-        for discussion in discussions:
-            if discussion.parent is None:
-                discussions_dict[discussion.id] = {
-                    'message': discussion,
-                    'replies': []
-                }
-            else:
-                if discussion.parent.id in discussions_dict:
-                    discussions_dict[discussion.parent.id]['replies'].append(discussion)
+        discussions = load_discussion_threads(course, before=parse_cursor(request.GET.get('threads_before')))
 
         quizzes_with_modules = []
         for module in modules:
@@ -446,7 +462,8 @@ class QuizDoubtView(View):
             'quiz_form': quiz_form,
             'question_form': question_form,
             'options_formset': options_formset,
-            'discussions': discussions_dict,
+            'discussions': discussions.threads,
+            'discussions_next': discussions.next_cursor,
         })
 
     def post(self, request, *args, **kwargs):
@@ -499,23 +516,23 @@ class QuizDoubtView(View):
 
         return redirect('quiz_doubt', course_id=course_id)
 
-from django.db.models import Avg
+from django.db.models import Q
 
 def analytics_dashboard(request):
-    # Calculate completion rates
+    # Completion rates, from the per-course enrollment rollup
     completion_rates = (
-        EnrollmentRequest.objects
+        CourseEnrollmentRollup.objects
+        .filter(Q(pending__gt=0) | Q(approved__gt=0) | Q(rejected__gt=0))
         .select_related('course')
-        .values('course__title')
-        .annotate(avg_progress=Avg('progress'))
     )
     
-    # Calculate student performance with course details
+    # Student performance with course details, from the score rollup
     student_performance = (
-        QuizAttempt.objects
-        .select_related('student', 'quiz__module__course')
-        .values('student__username', 'quiz__module__course__title')
-        .annotate(avg_score=Avg('score'))
+        StudentCourseScoreRollup.objects
+        .filter(score_count__gt=0)
+        .select_related('student', 'course')
+        .only('score_sum', 'score_count', 'student__username', 'course__title')
+        .order_by('course__title', 'student__username')
     )
     
     # Get list of all courses for reference
@@ -531,19 +548,73 @@ def analytics_dashboard(request):
     return render(request, 'analytics_dashboard.html', context)
 
 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
 import csv
+
+EXPORT_CSV_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() hands the row back to the csv writer."""
+    def write(self, value):
+        return value
+
+
+def _parse_date_param(value):
+    try:
+        return parse_date(value) if value else None
+    except ValueError:
+        return None
+
+
+def filter_quiz_attempts(params):
+    """Quiz attempts filtered by the `course`, `quiz`, `date_from` and `date_to` parameters."""
+    attempts = QuizAttempt.objects.all()
+
+    course_id = params.get('course')
+    if course_id and course_id.isdigit():
+        attempts = attempts.filter(quiz__module__course_id=course_id)
+
+    quiz_id = params.get('quiz')
+    if quiz_id and quiz_id.isdigit():
+        attempts = attempts.filter(quiz_id=quiz_id)
+
+    date_from = _parse_date_param(params.get('date_from'))
+    if date_from:
+        attempts = attempts.filter(attempt_date__date__gte=date_from)
+
+    date_to = _parse_date_param(params.get('date_to'))
+    if date_to:
+        attempts = attempts.filter(attempt_date__date__lte=date_to)
+
+    return attempts
+
+
 def export_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="performance_report.csv"'
+    rows = (
+        filter_quiz_attempts(request.GET)
+        .order_by('id')
+        .values_list(
+            'student__username',
+            'quiz__module__course__title',
+            'quiz__module__title',
+            'quiz__title',
+            'score',
+            'attempt_date',
+        )
+        .iterator(chunk_size=EXPORT_CSV_CHUNK_SIZE)
+    )
 
-    writer = csv.writer(response)
-    writer.writerow(['Student', 'Quiz', 'Score', 'Attempt Date'])
-    
-    quiz_attempts = QuizAttempt.objects.all()
-    for attempt in quiz_attempts:
-        writer.writerow([attempt.student, attempt.quiz, attempt.score, attempt.attempt_date])
+    writer = csv.writer(Echo())
+
+    def stream():
+        yield writer.writerow(['Student', 'Course', 'Module', 'Quiz', 'Score', 'Attempt Date'])
+        for row in rows:
+            yield writer.writerow(row)
 
+    response = StreamingHttpResponse(stream(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="performance_report.csv"'
     return response
 
 from django.http import HttpResponse
@@ -552,8 +623,24 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet
 from io import BytesIO
 from reportlab.lib import colors
+from django.db.models import Max, Sum
+from .reports import cached_report, data_version, field_digest
 
 def export_pdf(request):
+    version = data_version(
+        (Course.objects.all(), {'updated_at': Max('updated_at')}),
+        (EnrollmentRequest.objects.all(), {'progress': Sum('progress')}),
+        (QuizAttempt.objects.all(), {'score': Sum('score')}),
+        CustomUser.objects.all(),
+    )
+    pdf = cached_report('performance', {}, version, build_performance_report)
+
+    # Create a HTTP response with the PDF data
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename="performance_report.pdf"'
+    return response
+
+def build_performance_report():
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
     styles = getSampleStyleSheet()
@@ -612,13 +699,20 @@ def export_pdf(request):
     # Get PDF data from buffer
     pdf = buffer.getvalue()
     buffer.close()
-
-    # Create a HTTP response with the PDF data
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="performance_report.pdf"'
-    return response
+    return pdf
 
 def generate_instructor_activity_report(request):
+    version = data_version(
+        # Login and logout rows are updated in place, see core.activity
+        (UserActivityLog.objects.filter(user__role='instructor'), {'timestamp': Max('timestamp')}),
+        # The report prints usernames, which can be renamed in place
+        field_digest(CustomUser.objects.filter(role='instructor'), 'username'),
+        CustomUser.objects.filter(role='instructor'),
+    )
+    pdf = cached_report('instructor_activity', {}, version, build_instructor_activity_report)
+    return HttpResponse(pdf, content_type='application/pdf')
+
+def build_instructor_activity_report():
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
     styles = getSampleStyleSheet()
@@ -627,7 +721,7 @@ def generate_instructor_activity_report(request):
     
     table_data = [['Instructor Name', 'Activity', 'Timestamp']]
     
-    logs = UserActivityLog.objects.filter(user__role='instructor').order_by('-timestamp')
+    logs = UserActivityLog.objects.filter(user__role='instructor').select_related('user').order_by('-timestamp')
     for log in logs:
         table_data.append([
             log.user.username,
@@ -647,5 +741,117 @@ def generate_instructor_activity_report(request):
     ]))
 
     doc.build([title, table])
-    buffer.seek(0)
-    return HttpResponse(buffer, content_type='application/pdf')
+    return buffer.getvalue()
+
+from django.conf import settings
+from django.http import JsonResponse
+from .instrumentation import registry
+
+@user_passes_test(lambda user: user.is_superuser, login_url='superuser_login')
+def instrumentation_dashboard(request):
+    if request.method == 'POST' and 'reset' in request.POST:
+        registry.reset()
+        return redirect('instrumentation')
+    snapshot = registry.snapshot()
+    context = {
+        'views': snapshot['views'],
+        'slow_queries': snapshot['slow_queries'],
+        'budgets': getattr(settings, 'VIEW_BUDGETS', {}),
+    }
+    return render(request, 'instrumentation.html', context)
+
+@user_passes_test(lambda user: user.is_superuser, login_url='superuser_login')
+def instrumentation_json(request):
+    return JsonResponse(registry.snapshot())
+
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+from .uploads import UploadError, complete_upload, discard_upload, start_upload, upload_status, write_chunk
+
+# Chunked material uploads: start a session, PUT chunks (in parallel, in any
+# order, again after a disconnect), then complete with the file's checksum.
+
+def can_manage_course(user, course):
+    return user.is_authenticated and (user.is_superuser or course.instructor_id == user.id)
+
+def upload_json(view):
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+    return wrapper
+
+def get_upload(request, upload_id):
+    upload = get_object_or_404(MaterialUpload.objects.select_related('module__course'), id=upload_id)
+    if not can_manage_course(request.user, upload.module.course):
+        raise UploadError('Not allowed to upload to this course.', status=403)
+    return upload
+
+@require_POST
+@upload_json
+def material_upload_start(request):
+    try:
+        data = json.loads(request.body)
+        module = CourseModule.objects.select_related('course').filter(id=int(data['module_id'])).first()
+        size = int(data['size'])
+    except (ValueError, TypeError, KeyError):
+        raise UploadError('Expected JSON with module_id, filename, size and optionally file_type.')
+    if module is None:
+        raise UploadError('No such module.', status=404)
+    if not can_manage_course(request.user, module.course):
+        raise UploadError('Not allowed to upload to this course.', status=403)
+    upload = start_upload(module, request.user, data.get('filename'), size, data.get('file_type', 'other'))
+    return JsonResponse(upload_status(upload), status=201)
+
+@require_http_methods(['GET', 'DELETE'])
+@upload_json
+def material_upload_detail(request, upload_id):
+    upload = get_upload(request, upload_id)
+    if request.method == 'DELETE':
+        discard_upload(upload)
+        return HttpResponse(status=204)
+    return JsonResponse(upload_status(upload))
+
+@require_http_methods(['PUT'])
+@upload_json
+def material_upload_chunk(request, upload_id, index):
+    upload = get_upload(request, upload_id)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        raise UploadError('Content-Length is required.', status=411)
+    # The body is streamed from the request, never read into memory at once
+    digest = write_chunk(upload, index, request, length, request.headers.get('X-Chunk-SHA256'))
+    return JsonResponse({'index': index, 'sha256': digest})
+
+@require_POST
+@upload_json
+def material_upload_complete(request, upload_id):
+    upload = get_upload(request, upload_id)
+    try:
+        data = json.loads(request.body or '{}')
+    except ValueError:
+        raise UploadError('Expected JSON with sha256 or chunks_sha256.')
+    material = complete_upload(upload, data.get('sha256'), data.get('chunks_sha256'))
+    return JsonResponse({**upload_status(upload), 'url': reverse('material_file', args=[material.id])})
+
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from .media import can_view_material, serve_file
+
+@require_http_methods(['GET', 'HEAD'])
+def material_file(request, material_id):
+    material = get_object_or_404(ModuleMaterialFile.objects.select_related('module__course'), id=material_id)
+    if not can_view_material(request.user, material):
+        raise PermissionDenied
+    return serve_file(request, material.file, material.display_name)
+
+@require_http_methods(['GET', 'HEAD'])
+def material_preview(request, material_id):
+    material = get_object_or_404(ModuleMaterialFile.objects.select_related('module__course'), id=material_id)
+    if not material.preview:
+        raise Http404
+    if not can_view_material(request.user, material):
+        raise PermissionDenied
+    return serve_file(request, material.preview)
@@ -1,3 +1,43 @@
+from django.contrib.messages import get_messages
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from core.models import (
+    Course, CourseEnrollmentLimit, CourseModule, CustomUser, EnrollmentRequest, ModuleMaterialFile,
+)
+
+
+class MaterialUploadTests(TestCase):
+    def test_other_instructor_cannot_upload(self):
+        owner = CustomUser.objects.create(username='owner', role='instructor')
+        other = CustomUser.objects.create(username='other', role='instructor')
+        course = Course.objects.create(title='Course', description='', instructor=owner, difficulty_level='Beginner')
+        module = CourseModule.objects.create(course=course, title='Module', description='', order=1)
+
+        self.client.force_login(other)
+        response = self.client.post(reverse('instructor_course_detail', args=[course.id]), {
+            'upload_material': '1', 'module_id': module.id, 'file_type': 'pdf',
+            'file': SimpleUploadedFile('notes.pdf', b'%PDF-1.4'),
+        })
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ModuleMaterialFile.objects.filter(module=module).exists())
+
+
+class BulkEnrollmentTests(TestCase):
+    def test_bulk_approve_redirects_with_summary(self):
+        instructor = CustomUser.objects.create(username='instructor', role='instructor')
+        course = Course.objects.create(title='Course', description='', instructor=instructor, difficulty_level='Beginner')
+        CourseEnrollmentLimit.objects.create(course=course, enrollment_limit=1)
+        for name in ('alice', 'bob'):
+            EnrollmentRequest.objects.create(course=course, student=CustomUser.objects.create(username=name, role='student'))
+
+        self.client.force_login(instructor)
+        response = self.client.post(reverse('pending_requests'), {
+            'bulk_action': 'approve', 'select_all': '1', 'course_id': str(course.id),
+        })
+        self.assertRedirects(
+            response, f"{reverse('pending_requests')}?course_id={course.id}", fetch_redirect_response=False,
+        )
+        summary = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertEqual(summary, ['1 student enrolled.', 'Course full, not enrolled: bob (Course).'])
@@ -2,13 +2,23 @@ from django.utils import timezone
 from django.contrib.auth import login, logout
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
+from django.core.exceptions import PermissionDenied
 from django.contrib.auth.forms import AuthenticationForm
 from core.models import *
+from core.activity import log_activity, log_latest_activity
 from core.forms import CertificateTemplateForm
+from core.views import can_manage_course
+from core.roster import course_roster
+from core.discussions import load_discussion_threads, parse_cursor
+from core.enrollment import (
+    APPROVED, REJECTED, approve_enrollment_request, bulk_enrollment_message, bulk_process_enrollment_requests,
+    enrollment_message, reject_enrollment_request, select_enrollment_requests,
+)
 from .forms import *
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import CreateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.http import urlencode
 from django.views.decorators.http import require_POST
 
 
@@ -19,12 +29,7 @@ def instructor_login_view(request):
             user = form.get_user()
             if user.role == 'instructor':  # Ensure the user is an instructor
                 login(request, user)
-                UserActivityLog.objects.filter(user=user, activity='login').delete()
-
-                UserActivityLog.objects.create(
-                    user=user,
-                    activity='login'
-                )
+                log_latest_activity(user, 'login')
                 return redirect('instructor_dashboard')  # Redirect to the instructor's dashboard or home page
             else:
                 form.add_error(None, 'Invalid login for instructor.')
@@ -37,13 +42,7 @@ def user_logout(request):
     user = request.user
     
     if user.is_authenticated:
-        UserActivityLog.objects.filter(user=user, activity='logout').delete()
-
-        # Create a new log entry for logout
-        UserActivityLog.objects.create(
-            user=user,
-            activity='logout'
-        )
+        log_latest_activity(user, 'logout')
         logout(request)
     return redirect('instructor_login')
 
@@ -64,20 +63,14 @@ class CourseCreateView(LoginRequiredMixin, CreateView):
         response = super().form_valid(form)
 
         # Log the course creation activity
-        UserActivityLog.objects.create(
-            user=self.request.user,
-            activity=f'Created course: {form.instance.title}'
-        )
+        log_activity(self.request.user, f'Created course: {form.instance.title}')
 
         return response
 
 @require_POST
 def delete_course(request, course_id):
     course = get_object_or_404(Course, id=course_id)
-    UserActivityLog.objects.create(
-        user=request.user,
-        activity=f'Deleted course: {course.title}'
-    )
+    log_activity(request.user, f'Deleted course: {course.title}')
     course.delete()
     return redirect('instructor_dashboard')
 
@@ -88,37 +81,25 @@ class CourseDetailView(View):
         course = get_object_or_404(Course, id=course_id)
         module_form = CourseModuleForm()
         module_formset = ModuleMaterialFileFormSet(instance=CourseModule())  # Pass a new, empty instance
+        material_form = ModuleMaterialFileForm()
         modules = CourseModule.objects.filter(course=course)
         course_form = CourseForm(instance=course)
         pending_count = EnrollmentRequest.objects.filter(course=course, status='pending').count()
         accepted_count = EnrollmentRequest.objects.filter(course=course, status='approved').count()
         discussion_form = DiscussionForm()
-        discussions = Discussion.objects.filter(course=course).order_by('timestamp')
-
-        # Organize discussions into a dictionary with message IDs as keys
-        discussions_dict = {}
-        for discussion in discussions:
-            if discussion.parent is None:
-                # This is a top-level message
-                discussions_dict[discussion.id] = {
-                    'message': discussion,
-                    'replies': []
-                }
-            else:
-                # This is a reply
-                if discussion.parent.id in discussions_dict:
-                    discussions_dict[discussion.parent.id]['replies'].append(discussion)
-
+        discussions = load_discussion_threads(course, before=parse_cursor(request.GET.get('threads_before')))
 
         return render(request, 'instructor_course_detail.html', {
             'course': course,
             'module_form': module_form,
             'module_formset': module_formset,
+            'material_form': material_form,
             'modules': modules,
             'course_form': course_form,
             'pending_count': pending_count,
             'accepted_count': accepted_count,
-            'discussions': discussions_dict,
+            'discussions': discussions.threads,
+            'discussions_next': discussions.next_cursor,
             'discussion_form': discussion_form
         })
 
@@ -129,22 +110,28 @@ class CourseDetailView(View):
         # Handling the publishing and unpublishing actions
         if 'publish' in request.POST:
             course.is_published = True
-            UserActivityLog.objects.create(
-                user=request.user,
-                activity=f'Published {course.title} course'
-            )
+            log_activity(request.user, f'Published {course.title} course')
             course.save()
             return redirect('instructor_course_detail', course_id=course.id)
 
         if 'unpublish' in request.POST:
             course.is_published = False
-            UserActivityLog.objects.create(
-                user=request.user,
-                activity=f'Unpublish {course.title} course'
-            )
+            log_activity(request.user, f'Unpublish {course.title} course')
             course.save()
             return redirect('instructor_course_detail', course_id=course.id)
 
+        # Single material upload, when the browser cannot use the chunked upload API
+        if 'upload_material' in request.POST:
+            if not can_manage_course(request.user, course):
+                raise PermissionDenied
+            module = get_object_or_404(CourseModule, id=request.POST.get('module_id'), course=course)
+            material_form = ModuleMaterialFileForm(request.POST, request.FILES)
+            if material_form.is_valid():
+                material = material_form.save(commit=False)
+                material.module = module
+                material.save()
+            return redirect('instructor_course_detail', course_id=course.id)
+
         # Handling form submission for creating modules and materials
         module_form = CourseModuleForm(request.POST)
         module_formset = ModuleMaterialFileFormSet(request.POST, request.FILES)
@@ -197,54 +184,57 @@ class DeleteModuleView(View):
     
 class InstructorPendingRequestsView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
+        return render(request, 'pending_requests.html', {
+            'pending_requests': self.pending_requests(request),
+        })
+
+    def pending_requests(self, request):
         # Fetch courses taught by the logged-in instructor
         instructor_courses = Course.objects.filter(instructor=request.user)
         
         # Initialize the queryset for pending requests
-        pending_requests = EnrollmentRequest.objects.filter(course__in=instructor_courses, status='pending')
+        pending_requests = EnrollmentRequest.objects.filter(
+            course__in=instructor_courses, status='pending'
+        ).select_related('student', 'course__enrollment_limit')
 
         # Filter by course ID if provided
         course_id = request.GET.get('course_id')
         if course_id:
             pending_requests = pending_requests.filter(course_id=course_id)
-        
-        return render(request, 'pending_requests.html', {
-            'pending_requests': pending_requests,
-        })
+        return pending_requests
 
     def post(self, request, *args, **kwargs):
+        if request.POST.get('bulk_action') in ('approve', 'reject'):
+            enrollment_requests = select_enrollment_requests(
+                EnrollmentRequest.objects.filter(course__instructor=request.user), request.POST
+            )
+            outcomes = bulk_process_enrollment_requests(
+                enrollment_requests, request.POST['bulk_action'], log_user=request.user
+            )
+            bulk_enrollment_message(request, outcomes)
+            # Back to the list the instructor was looking at
+            course_id = request.POST.get('course_id', '')
+            if course_id.isdigit():
+                return redirect(f"{reverse('pending_requests')}?{urlencode({'course_id': course_id})}")
+            return redirect('pending_requests')
+
         request_id = request.POST.get('request_id')
         action = request.POST.get('action')
         enrollment_request = get_object_or_404(EnrollmentRequest, id=request_id)
         if enrollment_request.course.instructor == request.user:
             if action == 'approve':
-                enrollment_request.status = 'approved'
-                enrollment_request.response_date = timezone.now()  # Update response date
-                UserActivityLog.objects.create(
-                user=request.user,
-                activity=f'{enrollment_request.student.username} {enrollment_request.course.title} course request approved'
-            )
-                enrollment_request.save()
-                
-                # Check enrollment limits and enroll the student if possible
-                enrollment_limit = CourseEnrollmentLimit.objects.filter(course=enrollment_request.course).first()
-                if enrollment_limit and not enrollment_limit.is_full():
-                    if enrollment_limit.enroll_student():
-                        print("Student enrolled successfully")
-                    else:
-                        print("Enrollment failed: limit is full")
-                else:
-                    print("Enrollment limit not set or course is already full")
+                # Approval and seat reservation happen in one transaction
+                outcome = approve_enrollment_request(enrollment_request)
+                if outcome == APPROVED:
+                    log_activity(request.user, f'{enrollment_request.student.username} {enrollment_request.course.title} course request approved')
+                enrollment_message(request, enrollment_request, outcome)
 
             # Handle reject action
             elif action == 'reject':
-                enrollment_request.status = 'rejected'
-                enrollment_request.response_date = timezone.now()
-                UserActivityLog.objects.create(
-                user=request.user,
-                activity=f'{enrollment_request.student.username} {enrollment_request.course.title} course request rejected'
-            )
-                enrollment_request.save()
+                outcome = reject_enrollment_request(enrollment_request)
+                if outcome == REJECTED:
+                    log_activity(request.user, f'{enrollment_request.student.username} {enrollment_request.course.title} course request rejected')
+                enrollment_message(request, enrollment_request, outcome)
 
         return redirect('pending_requests')
     
@@ -254,48 +244,14 @@ class CourseEnrolledStudentsView(LoginRequiredMixin, View):
         course_id = kwargs.get('course_id')
         course = get_object_or_404(Course, id=course_id)
 
-        # Fetch enrolled students for the specified course
-        enrolled_students = EnrollmentRequest.objects.filter(course=course, status='approved').select_related('student')
-
-        student_progress_data = []
-        for enrollment in enrolled_students:
-            student = enrollment.student
-            modules = CourseModule.objects.filter(course=course)
-            quizzes_with_questions = self.get_quizzes_with_questions(modules, student)
-
-            total_quizzes = sum(len(q['quizzes']) for q in quizzes_with_questions)
-            completed_quizzes = sum(1 for q in quizzes_with_questions for quiz in q['quizzes'] if quiz['attempt'])
-            progress = (completed_quizzes / total_quizzes) * 100 if total_quizzes > 0 else 0
-            total_score = sum(attempt.score for attempt in QuizAttempt.objects.filter(student=student, quiz__in=[q['quiz'] for q in quizzes_with_questions for q in q['quizzes']]))
-            average_score = (total_score / total_quizzes) if total_quizzes > 0 else 0
-            student_progress_data.append({
-                'student': student,
-                'progress': progress,
-                'total_quizzes': total_quizzes,
-                'completed_quizzes': completed_quizzes,
-                'average_score': average_score,
-                'response_date': enrollment.response_date,
-            })
+        # Student x quiz matrix for the whole roster, cached per course
+        student_progress_data = course_roster(course).rows
 
         return render(request, 'enrolled_students.html', {
             'course': course,
             'student_progress_data': student_progress_data,
         })
 
-    def get_quizzes_with_questions(self, modules, user):
-        quizzes_with_questions = []
-        for module in modules:
-            quizzes = Quiz.objects.filter(module=module)
-            quizzes_with_questions.append({
-                'module': module,
-                'quizzes': [{
-                    'quiz': quiz,
-                    'questions': quiz.questions.all(),
-                    'attempt': QuizAttempt.objects.filter(student=user, quiz=quiz).first()
-                } for quiz in quizzes]
-            })
-        return quizzes_with_questions
-
 class ManageCertificateTemplatesView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         user_courses = Course.objects.filter(instructor=request.user)
@@ -398,14 +354,31 @@ from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
 from io import BytesIO
+from django.db.models import Max, Sum
+from core.reports import cached_report, data_version, field_digest
 
 class DownloadProgressView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         course_id = kwargs.get('course_id')
         course = get_object_or_404(Course, id=course_id)
-        
-        # Fetch enrolled students
-        enrolled_students = EnrollmentRequest.objects.filter(course=course, status='approved').select_related('student')
+
+        version = data_version(
+            (Course.objects.filter(id=course.id), {'updated_at': Max('updated_at')}),
+            (EnrollmentRequest.objects.filter(course=course, status='approved'), {'response_date': Max('response_date')}),
+            (QuizAttempt.objects.filter(quiz__module__course=course), {'score': Sum('score')}),
+            Quiz.objects.filter(module__course=course),
+            # The report prints usernames, which can be renamed in place
+            field_digest(EnrollmentRequest.objects.filter(course=course, status='approved'), 'student__username'),
+        )
+        pdf = cached_report('course_progress', {'course_id': course.id}, version, lambda: self.build_report(course))
+
+        filename = f"{course.title}_enrollment_report.pdf"
+        response = HttpResponse(pdf, content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    def build_report(self, course):
+        roster = course_roster(course)
 
         # Create a file-like buffer to receive PDF data
         buffer = BytesIO()
@@ -425,24 +398,14 @@ class DownloadProgressView(LoginRequiredMixin, View):
             ['Student', 'Enrollment Date', 'Completed Quizzes', 'Total Quizzes', 'Progress(%)', 'Avg.Score(%)']
         ]
 
-        for enrollment in enrolled_students:
-            student = enrollment.student
-            modules = CourseModule.objects.filter(course=course)
-            quizzes_with_questions = self.get_quizzes_with_questions(modules, student)
-
-            total_quizzes = sum(len(q['quizzes']) for q in quizzes_with_questions)
-            completed_quizzes = sum(1 for q in quizzes_with_questions for quiz in q['quizzes'] if quiz['attempt'])
-            progress = (completed_quizzes / total_quizzes) * 100 if total_quizzes > 0 else 0
-            total_score = sum(attempt.score for attempt in QuizAttempt.objects.filter(student=student, quiz__in=[q['quiz'] for q in quizzes_with_questions for q in q['quizzes']]))
-            average_score = (total_score / total_quizzes) if total_quizzes > 0 else 0
-
+        for row in roster.rows:
             table_data.append([
-                student.username,
-                enrollment.request_date.strftime('%Y-%m-%d'),
-                completed_quizzes,
-                total_quizzes,
-                f"{progress:.2f}",
-                f"{average_score:.2f}"
+                row.student.username,
+                row.request_date.strftime('%Y-%m-%d'),
+                row.completed_quizzes,
+                row.total_quizzes,
+                f"{row.progress:.2f}",
+                f"{row.average_score:.2f}"
             ])
 
         # Create table
@@ -459,25 +422,6 @@ class DownloadProgressView(LoginRequiredMixin, View):
 
         story.append(table)
         doc.build(story)
-        buffer.seek(0)
-
-        filename = f"{course.title}_enrollment_report.pdf"
-        response = HttpResponse(buffer.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
-
-    def get_quizzes_with_questions(self, modules, user):
-        quizzes_with_questions = []
-        for module in modules:
-            quizzes = Quiz.objects.filter(module=module)
-            quizzes_with_questions.append({
-                'module': module,
-                'quizzes': [{
-                    'quiz': quiz,
-                    'questions': quiz.questions.all(),
-                    'attempt': QuizAttempt.objects.filter(student=user, quiz=quiz).first()
-                } for quiz in quizzes]
-            })
-        return quizzes_with_questions
+        return buffer.getvalue()
 
 
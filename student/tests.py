@@ -1,3 +1,48 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from core.models import Course, CustomUser, Discussion, EnrollmentRequest
+
+
+class CourseDetailTests(TestCase):
+    def setUp(self):
+        instructor = CustomUser.objects.create(username='instructor', role='instructor')
+        self.student = CustomUser.objects.create(username='student', role='student')
+        self.course = Course.objects.create(
+            title='Course', description='', instructor=instructor, difficulty_level='Beginner', is_published=True,
+        )
+        EnrollmentRequest.objects.create(course=self.course, student=self.student, status='approved')
+        self.url = reverse('student_course_detail', args=[self.course.id])
+        self.client.force_login(self.student)
+
+    def test_first_visit_sets_csrf_cookie_and_revisit_is_304(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn(settings.CSRF_COOKIE_NAME, first.cookies)
+        self.assertNotIn('Last-Modified', first)
+
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_deleted_discussion_changes_etag(self):
+        Discussion.objects.create(course=self.course, sender=self.student, receiver=self.student, message='Hello')
+        first = self.client.get(self.url)
+        Discussion.objects.filter(course=self.course).delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_queued_message_bypasses_304(self):
+        first = self.client.get(self.url)
+        # Queue a flash message the way a redirecting view would
+        storage = CookieStorage(RequestFactory().get(self.url))
+        storage.add(messages.INFO, 'Saved')
+        response = HttpResponse()
+        storage.update(response)
+        self.client.cookies[storage.cookie_name] = response.cookies[storage.cookie_name].value
+
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 200)
+        self.assertContains(again, 'Saved')
@@ -1,25 +1,35 @@
 from django.shortcuts import render
-from django.db.models import Count
+from django.core.paginator import Paginator
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.messages import get_messages
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout
+from django.http import Http404
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views import View
 from core. models import *
+from core.activity import log_activity, log_latest_activity
+from core.catalog import category_tree, course_card_page, course_cards, landing_page, published_course_count
+from core.certificates import render_course_certificate, student_average_score
+from core.content import course_page_etag
+from core.discussions import load_discussion_threads, parse_cursor
+from core.grading import InvalidSubmission, submit_quiz
+from core.progress import enrolled_course_progress, quizzes_with_questions
+from core.search import search_courses
 from .forms import *
 
 # Create your views here.
 class IndexView(View):
     def get(self, request, *args, **kwargs):
-        # Annotate each MainCategory with the count of related courses
-        categories = MainCategory.objects.annotate(course_count=Count('subcategories__course')).order_by('name')
-        course=Course.objects.filter(is_published=True)
+        # Category counts and course cards come from the catalog cache
+        categories, courses = landing_page(categories=8, cards=3)
 
         return render(request, 'student_index.html', {
             'categories': categories,
-            'courses':course,
+            'courses': courses,
         })
 
 class StudentRegistrationView(View):
@@ -42,11 +52,7 @@ def student_login_view(request):
             user = form.get_user()
             if user.role == 'student': 
                 login(request, user)
-                UserActivityLog.objects.filter(user=user, activity='login').delete()
-                UserActivityLog.objects.create(
-                    user=user,
-                    activity='login'
-                )
+                log_latest_activity(user, 'login')
                 return redirect('student_dashboard') 
             else:
                 form.add_error(None, 'Invalid login for student.')
@@ -60,35 +66,45 @@ def user_logout(request):
     user = request.user
     
     if user.is_authenticated:
-        UserActivityLog.objects.filter(user=user, activity='logout').delete()
-
-        # Create a new log entry for logout
-        UserActivityLog.objects.create(
-            user=user,
-            activity='logout'
-        )
+        log_latest_activity(user, 'logout')
     
     return redirect('student_index')
 
+COURSES_PER_PAGE = 12
+
 class StudentHomeView(View):
     def get(self, request, *args, **kwargs):
         # Get all main categories and their sub-categories
-        main_categories = MainCategory.objects.all()
+        main_categories = category_tree()
         # Get search parameters from the request
         main_category_id = request.GET.get('main_category')
         course_title = request.GET.get('course_title', '')
 
-        # Filter courses based on selected categories and title
-        courses = Course.objects.filter(is_published=True)
-        if main_category_id:
-            sub_categories = CourseCategory.objects.filter(parent_category_id=main_category_id)
-            courses = courses.filter(category__parent_category_id=main_category_id)
-        
-        if course_title:
-            courses = courses.filter(title__icontains=course_title)
+        if not main_category_id and not course_title:
+            # Unfiltered browsing is served from the catalog cache
+            page = Paginator(range(published_course_count()), COURSES_PER_PAGE).get_page(request.GET.get('page'))
+            page.object_list = course_card_page(page.number, COURSES_PER_PAGE)
+        else:
+            # Filter courses based on selected categories and title
+            courses = Course.objects.filter(is_published=True).select_related('category')
+            if main_category_id:
+                courses = courses.filter(category__parent_category_id=main_category_id)
+
+            if course_title:
+                # Ranked by the search index (title, description, category, instructor)
+                courses = search_courses(courses, course_title)
+            else:
+                courses = courses.order_by('id')
+
+            page = Paginator(courses, COURSES_PER_PAGE).get_page(request.GET.get('page'))
+            page.object_list = course_cards(page.object_list)
+        query = request.GET.copy()
+        query.pop('page', None)
 
         return render(request, 'home.html', {
-            'courses': courses,
+            'courses': page,
+            'page': page,
+            'query': query.urlencode(),
             'main_categories': main_categories,
             'course_title': course_title,
         })
@@ -97,35 +113,36 @@ class StudentHomeView(View):
 class CourseDetailView(View):
     def get(self, request, *args, **kwargs):
         course_id = kwargs.get('course_id')
+        # Revisits of an unchanged page are answered from the ETag alone
+        etag = course_page_etag(request, course_id)
+        if etag is None:
+            raise Http404('No Course matches the given query.')
+        # Queued flash messages are not in the ETag; a 304 would drop them
+        response = None if len(get_messages(request)) else get_conditional_response(request, etag=etag)
+        if response is None:
+            response = self.render_page(request, course_id)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def render_page(self, request, course_id):
         course = get_object_or_404(Course, id=course_id)
         modules = CourseModule.objects.filter(course=course)
         accepted_count = EnrollmentRequest.objects.filter(course=course, status='approved').count()
         enrollment_request = EnrollmentRequest.objects.filter(course=course, student=request.user).first()
         form = DiscussionForm()
 
-        discussions = Discussion.objects.filter(course=course).order_by('timestamp')
-
-        discussions_dict = {}
-        for discussion in discussions:
-            if discussion.parent is None:
-                discussions_dict[discussion.id] = {
-                    'message': discussion,
-                    'replies': []
-                }
-            else:
-                if discussion.parent.id in discussions_dict:
-                    discussions_dict[discussion.parent.id]['replies'].append(discussion)
-
-        quizzes_with_questions = self.get_quizzes_with_questions(modules, request.user)
+        discussions = load_discussion_threads(course, before=parse_cursor(request.GET.get('threads_before')))
 
         return render(request, 'student_course_detail.html', {
             'course': course,
             'modules': modules,
             'accepted_count': accepted_count,
             'enrollment_request': enrollment_request,
-            'discussions': discussions_dict,
+            'discussions': discussions.threads,
+            'discussions_next': discussions.next_cursor,
             'form': form,
-            'quizzes_with_questions': quizzes_with_questions,
+            'quizzes_with_questions': self.get_quizzes_with_questions(modules, request.user),
         })
 
     def post(self, request, *args, **kwargs):
@@ -143,9 +160,7 @@ class CourseDetailView(View):
                     status='pending',
                     request_date=timezone.now()
                 )
-                UserActivityLog.objects.create(
-                    user=request.user,
-                    activity=f'Requested enrollment in course: {course.title}')
+                log_activity(request.user, f'Requested enrollment in course: {course.title}')
             else:
                 if enrollment_request.status == 'rejected':
                     enrollment_request.status = 'pending'
@@ -155,9 +170,7 @@ class CourseDetailView(View):
         elif action == 'unenroll':
             existing_request = EnrollmentRequest.objects.filter(course=course, student=request.user).first()
             if existing_request:
-                UserActivityLog.objects.create(
-                user=request.user,
-                activity=f'Removed enrollment request for course: {course.title}')
+                log_activity(request.user, f'Removed enrollment request for course: {course.title}')
                 existing_request.delete()
 
         if 'send_message' in request.POST:
@@ -174,89 +187,29 @@ class CourseDetailView(View):
             quiz_id = request.POST.get('quiz_id')
             quiz = get_object_or_404(Quiz, id=quiz_id)
 
-            if QuizAttempt.objects.filter(student=request.user, quiz=quiz).exists():
-                return redirect('student_course_detail', course_id=course_id)
-
-            total_questions = 0
-            correct_answers = 0
-
-            for question in quiz.questions.all():
-                user_answer = request.POST.get(f'question_{question.id}')
-                if user_answer:
-                    option = get_object_or_404(Option, id=user_answer)
-                    if option.is_correct:
-                        correct_answers += 1
-                total_questions += 1
-
-            score = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
-
-            QuizAttempt.objects.create(
-                student=request.user,
-                quiz=quiz,
-                score=score
-            )
+            try:
+                submit_quiz(request.user, quiz, request.POST)
+            except InvalidSubmission as e:
+                return HttpResponseBadRequest(str(e))
 
             return redirect('student_course_detail', course_id=course_id)
 
         return redirect('student_course_detail', course_id=course_id)
 
     def get_quizzes_with_questions(self, modules, user):
-        quizzes_with_questions = []
-        for module in modules:
-            quizzes = Quiz.objects.filter(module=module)
-            quizzes_with_questions.append({
-                'module': module,
-                'quizzes': [{
-                    'quiz': quiz,
-                    'questions': quiz.questions.all(),
-                    'attempt': QuizAttempt.objects.filter(student=user, quiz=quiz).first()
-                } for quiz in quizzes]
-            })
-        return quizzes_with_questions
+        return quizzes_with_questions(modules, user)
 
 
 
 class EnrolledCoursesListView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
-        enrollment_requests = EnrollmentRequest.objects.filter(student=request.user, status='approved')
-
         # Prepare a list to hold course progress data
-        course_progress_data = []
-        
-        for enrollment in enrollment_requests:
-            course = enrollment.course
-            modules = CourseModule.objects.filter(course=course)
-            quizzes_with_questions = self.get_quizzes_with_questions(modules, request.user)
-            
-            total_quizzes = sum(len(q['quizzes']) for q in quizzes_with_questions)
-            completed_quizzes = sum(1 for q in quizzes_with_questions for quiz in q['quizzes'] if quiz['attempt'])
-            progress = (completed_quizzes / total_quizzes) * 100 if total_quizzes > 0 else 0
-            
-            course_progress_data.append({
-                'course': course,
-                'progress': progress,
-                'total_quizzes': total_quizzes,
-                'completed_quizzes': completed_quizzes,
-            })
-        
+        course_progress_data = enrolled_course_progress(request.user)
+
         return render(request, 'student_courses_list.html', {
             'course_progress_data': course_progress_data,
         })
     
-    def get_quizzes_with_questions(self, modules, user):
-        quizzes_with_questions = []
-        for module in modules:
-            quizzes = Quiz.objects.filter(module=module)
-            quizzes_with_questions.append({
-                'module': module,
-                'quizzes': [{
-                    'quiz': quiz,
-                    'questions': quiz.questions.all(),
-                    'attempt': QuizAttempt.objects.filter(student=user, quiz=quiz).first()
-                } for quiz in quizzes]
-            })
-        return quizzes_with_questions
-    
 
     
 class ProfileAndPasswordUpdateView(View):
@@ -297,7 +250,7 @@ class CertificateListView(View):
         return render(request, 'student_certificate.html', {'certificates': certificates})
     
 
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseBadRequest, HttpResponseForbidden
 
 class GenerateCertificateView(View):
     def get(self, request, *args, **kwargs):
@@ -313,17 +266,7 @@ class GenerateCertificateView(View):
         return redirect('student_certificate_list')  # Redirect to the certificate list or detail view
 
     def check_and_generate_certificate(self, student, course):
-        quizzes = Quiz.objects.filter(module__course=course)
-        total_score = 0
-        total_quizzes = 0
-        
-        for quiz in quizzes:
-            attempt = QuizAttempt.objects.filter(student=student, quiz=quiz).first()
-            if attempt:
-                total_score += attempt.score
-                total_quizzes += 1
-
-        average_score = (total_score / total_quizzes) if total_quizzes > 0 else 0
+        average_score = student_average_score(student, course)
 
         template = course.template
         if average_score >= template.min_avg_score:
@@ -333,35 +276,15 @@ class GenerateCertificateView(View):
                 defaults={'certificate_template': template}
             )
             if created:
-                certificate_file = self.generate_certificate_file(student, course)
+                certificate_file = self.generate_certificate_file(student, course, template)
                 certificate.certificate_file = certificate_file
                 certificate.save()
 
-    def generate_certificate_file(self, student, course):
-        from reportlab.lib.pagesizes import letter
-        from reportlab.pdfgen import canvas
-        from io import BytesIO
+    def generate_certificate_file(self, student, course, template):
         from django.core.files.base import ContentFile
 
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=letter)
-        width, height = letter
-
-        c.setFont("Helvetica", 12)
-        c.drawString(100, height - 100, "Certificate of Completion")
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(100, height - 150, f"This is to certify that {student.get_full_name()}")
-        c.drawString(100, height - 175, f"has successfully completed the course:")
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(100, height - 225, f"{course.title}")
-        c.setFont("Helvetica", 12)
-        c.drawString(100, height - 275, f"Issued Date: {timezone.now().strftime('%Y-%m-%d')}")
-
-        c.showPage()
-        c.save()
-        buffer.seek(0)
-        
-        return ContentFile(buffer.getvalue(), 'certificate.pdf') 
+        pdf = render_course_certificate(template, student.get_full_name(), course.title, timezone.now())
+        return ContentFile(pdf, 'certificate.pdf')
     
 from django.contrib.auth.views import PasswordResetView,PasswordResetDoneView,PasswordResetConfirmView,PasswordResetCompleteView
 from django.urls import reverse_lazy